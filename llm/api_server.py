@@ -1,13 +1,28 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional, Union
 import uvicorn
 import os
 import shutil
 from pathlib import Path
 from rag_system import IntelligentQuerySystem, QueryResponse
+from metadata_filter import filter_key
+from query_executor import QueryExecutor
+from ingestion_jobs import IngestionJobQueue, RemoteJobQueue
+from metrics import metrics, profiler
+from serving import WriterLock, SnapshotFollower, SnapshotPublisher
+from llm_pool import PooledLLM
+from config import (
+    QUERY_WORKERS, MAX_BATCH_SIZE, SNAPSHOT_PATH, AUTO_SAVE_SNAPSHOT, INGESTION_QUEUE_PATH, ENABLE_PROFILING,
+    SERVING_MODE, WRITER_LOCK_PATH, INGESTION_INBOX_DIR, API_HOST, API_PORT, API_WORKERS, SHARD_ADDRESSES
+)
+from datetime import datetime
+import asyncio
 import json
+import threading
+import time
 
 app = FastAPI(
     title="Intelligent Query-Retrieval System",
@@ -24,8 +39,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize the RAG system
-rag_system = IntelligentQuerySystem()
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count and time requests by route template, so paths with ids share one series."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.inc("rag_http_requests_total", method=request.method, route=path, status=status)
+        metrics.observe("rag_http_request_seconds", time.perf_counter() - start, method=request.method, route=path)
+
+# The RAG system is created by the background boot thread; requests that
+# need it get a 503 until the model is loaded
+rag_system: Optional[IntelligentQuerySystem] = None
+
+# In shared serving mode each worker process takes its role at startup: the
+# one holding the writer lock ingests and publishes snapshot generations, the
+# others ("reader") serve those generations read-only
+serving_role = "single"
+writer_lock = WriterLock(str(WRITER_LOCK_PATH))
+snapshot_follower: Optional[SnapshotFollower] = None
+snapshot_publisher = SnapshotPublisher(str(SNAPSHOT_PATH))
+
+# Blocking query work runs here so the event loop stays responsive
+query_executor = QueryExecutor(max_workers=QUERY_WORKERS)
 
 # Create upload directory
 UPLOAD_DIR = Path("uploads")
@@ -35,43 +77,212 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 PARENT_UPLOAD_DIR = Path("../uploads")
 PARENT_UPLOAD_DIR.mkdir(exist_ok=True)
 
-print("Loading existing documents...")
-try:
-    # Check both upload directories
-    documents_loaded = False
+def publish_snapshot(system: IntelligentQuerySystem):
+    """Save the snapshot after a change so the next boot starts warm and read-only workers pick it up.
+
+    Saves are debounced (see SnapshotPublisher); the last changes are flushed on shutdown.
+    """
+    if AUTO_SAVE_SNAPSHOT or serving_role == "writer":
+        snapshot_publisher.changed(system)
+
+def run_ingestion_job(job: dict) -> dict:
+    """Run one queued job, ingesting or removing its files, and return its final progress."""
+    system = rag_system
+    if job.get("action") == "remove":
+        removed = system.remove_files([Path(f) for f in job["files"]])
+        if removed:
+            publish_snapshot(system)
+        return {"chunks_removed": removed}
     
-    if UPLOAD_DIR.exists() and any(UPLOAD_DIR.iterdir()):
-        rag_system.add_documents(str(UPLOAD_DIR))
-        print("Existing documents loaded from llm/uploads successfully")
-        documents_loaded = True
+    files = [Path(f) for f in job["files"] if Path(f).exists()]
+    changed = system.add_files(files, source=f"job:{job['id']}")
+    if changed:
+        publish_snapshot(system)
     
-    if PARENT_UPLOAD_DIR.exists() and any(PARENT_UPLOAD_DIR.iterdir()):
-        rag_system.add_documents(str(PARENT_UPLOAD_DIR))
-        print("Existing documents loaded from ../uploads successfully")
-        documents_loaded = True
+    progress = system.ingestion_progress
+    return {key: progress[key] for key in ("files_seen", "files_pending", "pages", "chunks", "embeddings")}
+
+# Uploads are queued here and ingested by a single background worker; in
+# shared mode the queue is created once the worker knows its role
+ingestion_jobs = IngestionJobQueue(str(INGESTION_QUEUE_PATH), run_ingestion_job) if SERVING_MODE != "shared" else None
+
+# (vector store, version, statistics) of the last scrape; statistics walk the
+# lexical and filter indexes, so they are only recomputed when the index changes
+_store_gauges = (None, None, None)
+
+def store_statistics(store) -> dict:
+    """Vector store statistics for the gauges, cached per index version."""
+    global _store_gauges
+    cached_store, version, stats = _store_gauges
+    if cached_store is not store or version != store.version:
+        version = store.version
+        stats = store.get_statistics()
+        _store_gauges = (store, version, stats)
+    return stats
+
+def collect_gauges():
+    """Gauges sampled each time /metrics is scraped."""
+    yield "rag_active_queries", {}, query_executor.stats["active"]
+    yield "rag_profiler_running", {}, int(profiler.running)
+    yield "rag_profiler_samples_total", {}, profiler.samples
+    system = rag_system
+    if system is not None:
+        stats = store_statistics(system.vector_store)
+        yield "rag_indexed_chunks", {}, stats["total_documents"]
+        yield "rag_tombstoned_chunks", {}, stats.get("tombstones", 0)
+        yield "rag_ingestion_running", {}, int(system.ingestion_progress["state"] != "idle")
+        yield "rag_snapshot_generation", {}, stats.get("generation") or 0
+        if isinstance(system.llm, PooledLLM):
+            yield from system.llm.pool.collect_gauges()
+
+metrics.add_collector(collect_gauges)
+
+boot_state = {
+    "model_loaded": False,
+    "snapshot_loaded": False,
+    "snapshot_path": str(SNAPSHOT_PATH),
+    "reconciled": False,
+    "error": None,
+    "started_at": None,
+    "ready_at": None
+}
+
+def boot_system():
+    """Load the model and last snapshot, then reconcile the upload directories."""
+    global rag_system, snapshot_follower
+    boot_state["started_at"] = datetime.now().isoformat()
+    try:
+        system = IntelligentQuerySystem(read_only=serving_role == "reader")
+        boot_state["model_loaded"] = True
+        
+        # Shards keep their own snapshots, so a sharded system always asks them
+        if SHARD_ADDRESSES or os.path.isdir(f"{SNAPSHOT_PATH}.snapshot") or os.path.exists(f"{SNAPSHOT_PATH}.index"):
+            boot_state["snapshot_loaded"] = system.load_system(str(SNAPSHOT_PATH))
+        else:
+            print("No saved snapshot found, starting with an empty index")
+        
+        # Start serving from the snapshot before touching the upload directories
+        rag_system = system
+        boot_state["ready_at"] = datetime.now().isoformat()
+        
+        if serving_role == "reader":
+            # The writer owns ingestion; follow the generations it publishes
+            snapshot_follower = SnapshotFollower(system, str(SNAPSHOT_PATH))
+            snapshot_follower.start()
+            return
+        ingestion_jobs.start()
+        
+        print("Reconciling upload directories in the background...")
+        changed = 0
+        for directory in (UPLOAD_DIR, PARENT_UPLOAD_DIR):
+            if directory.exists() and any(directory.iterdir()):
+                changed += system.add_documents(str(directory))
+        
+        if changed:
+            publish_snapshot(system)
+        boot_state["reconciled"] = True
+        print(f"Background reconciliation finished ({changed} documents added or replaced)")
+        
+    except Exception as e:
+        boot_state["error"] = str(e)
+        print(f"Error during startup: {e}")
+        import traceback
+        traceback.print_exc()
+
+def require_system() -> IntelligentQuerySystem:
+    """Return the RAG system, or raise 503 while it is still starting."""
+    if rag_system is None:
+        raise HTTPException(status_code=503, detail="System is starting up, see GET /ready")
+    return rag_system
+
+def require_writer() -> IntelligentQuerySystem:
+    """Return the RAG system, or raise 409 on a read-only worker."""
+    system = require_system()
+    if system.read_only:
+        raise HTTPException(status_code=409, detail="This worker serves a read-only snapshot; retry, "
+                                                    "or send the request to the writer worker")
+    return system
+
+def serving_state() -> dict:
+    """Serving mode and role of this worker, with its snapshot generation when following one."""
+    state = {"mode": SERVING_MODE, "role": serving_role, "pid": os.getpid()}
+    if snapshot_follower is not None:
+        state["follower"] = snapshot_follower.get_statistics()
+    elif AUTO_SAVE_SNAPSHOT or serving_role == "writer":
+        state["publisher"] = snapshot_publisher.get_statistics()
+    return state
+
+@app.on_event("startup")
+async def start_boot():
+    """Start loading in the background so the server accepts requests immediately."""
+    global serving_role, ingestion_jobs
+    if SERVING_MODE == "shared":
+        serving_role = "writer" if writer_lock.acquire() else "reader"
+        print(f"Shared serving: worker {os.getpid()} is the {serving_role}")
+        if serving_role == "reader":
+            ingestion_jobs = RemoteJobQueue(str(INGESTION_QUEUE_PATH), str(INGESTION_INBOX_DIR))
+        else:
+            ingestion_jobs = IngestionJobQueue(str(INGESTION_QUEUE_PATH), run_ingestion_job,
+                                               inbox=str(INGESTION_INBOX_DIR))
+    threading.Thread(target=boot_system, name="boot", daemon=True).start()
+    if ENABLE_PROFILING:
+        profiler.start()
+
+@app.on_event("shutdown")
+async def publish_pending_changes():
+    """Save changes the debounced publisher has not written yet."""
+    await asyncio.to_thread(snapshot_publisher.flush)
+
+class SearchFilters(BaseModel):
+    """Metadata filters; each field takes one value or a list of alternatives."""
+    source: Optional[Union[str, List[str]]] = None  # document name, e.g. "health_policy"
+    section: Optional[Union[str, List[str]]] = None
+    type: Optional[Union[str, List[str]]] = None  # "pdf", "docx" or "email"
+    domain: Optional[Union[str, List[str]]] = None  # see config.DOMAINS
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
     
-    if not documents_loaded:
-        print("No existing documents found in upload directories")
-except Exception as e:
-    print(f"Error loading existing documents: {e}")
+    def to_dict(self) -> Optional[dict]:
+        return self.dict(exclude_none=True) or None
 
 class QueryRequest(BaseModel):
     """Request model for queries."""
     query: str
     top_k: Optional[int] = 5
     threshold: Optional[float] = 0.3
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    mode: Optional[Literal["dense", "lexical", "hybrid"]] = None  # defaults to RETRIEVAL_MODE
+    filters: Optional[SearchFilters] = None
+    rerank: Optional[bool] = None  # False skips the re-ranker when it is enabled
+    rerank_budget_ms: Optional[float] = None
 
 class BatchQueryRequest(BaseModel):
     """Request model for batch queries."""
     queries: List[str]
     top_k: Optional[int] = 5
     threshold: Optional[float] = 0.3
+    mode: Optional[Literal["dense", "lexical", "hybrid"]] = None
+    filters: Optional[SearchFilters] = None
+    rerank: Optional[bool] = None
+
+class ProfilingRequest(BaseModel):
+    """Start or stop the sampling profiler."""
+    enabled: bool
+    interval_ms: Optional[float] = None  # defaults to PROFILER_INTERVAL_MS
+    reset: bool = False  # discard the stacks collected so far
 
 class SystemStats(BaseModel):
     """System statistics response."""
     vector_store: dict
     llm_model: str
+    llm_pool: Optional[Dict[str, Any]] = None
+    executor: dict
+    ingestion: dict
+    cache: dict
+    reranker: dict
     document_processor: dict
+    serving: Optional[dict] = None
 
 @app.get("/")
 async def root():
@@ -82,9 +293,16 @@ async def root():
         "endpoints": {
             "upload_documents": "POST /upload",
             "query": "POST /query",
+            "query_stream": "POST /query/stream",
             "batch_query": "POST /batch-query",
             "stats": "GET /stats",
-            "health": "GET /health"
+            "health": "GET /health",
+            "ready": "GET /ready",
+            "metrics": "GET /metrics",
+            "profiling": "GET /profiling, POST /profiling",
+            "jobs": "GET /jobs",
+            "job_status": "GET /jobs/{job_id}",
+            "delete_document": "DELETE /documents/{filename}"
         }
     }
 
@@ -93,9 +311,23 @@ async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "system": "Intelligent Query-Retrieval System"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint: model, snapshot and background ingestion state."""
+    ingestion = rag_system.ingestion_progress if rag_system is not None else {"state": "pending"}
+    return {
+        "ready": rag_system is not None,
+        **boot_state,
+        "ingestion": dict(ingestion),
+        "serving": serving_state()
+    }
+
 @app.post("/upload")
 async def upload_documents(files: List[UploadFile] = File(...)):
-    """Upload and process documents."""
+    """Save uploaded documents and queue them for ingestion.
+    
+    Returns immediately with a job id; poll GET /jobs/{job_id} for progress.
+    """
     try:
         # Save uploaded files
         saved_files = []
@@ -114,28 +346,97 @@ async def upload_documents(files: List[UploadFile] = File(...)):
                 
                 saved_files.append(str(file_path_llm))
         
-        # Process documents from both directories
-        rag_system.add_documents(str(UPLOAD_DIR))
-        rag_system.add_documents(str(PARENT_UPLOAD_DIR))
+        # The parent copy has the same content hash, so the manifest would
+        # skip it anyway; only the llm/uploads paths are queued
+        job = ingestion_jobs.submit(saved_files)
         
         return {
-            "message": f"Successfully processed {len(saved_files)} documents",
+            "message": f"Queued {len(saved_files)} documents for processing",
             "files": saved_files,
-            "status": "success"
+            "job_id": job["id"],
+            "status": job["status"]
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing documents: {str(e)}")
 
+@app.get("/jobs")
+async def list_jobs():
+    """List recent ingestion jobs."""
+    return {"jobs": ingestion_jobs.list(), "counts": ingestion_jobs.get_statistics()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the status and progress (pages, chunks, embeddings) of an ingestion job."""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    
+    # While running, report live counters from the ingestion pipeline
+    if job["status"] == "running" and rag_system is not None:
+        progress = rag_system.ingestion_progress
+        if progress.get("source") == f"job:{job_id}":
+            job["progress"] = {
+                "stage": progress["state"],
+                **{key: progress[key] for key in ("files_seen", "files_pending", "pages", "chunks", "embeddings")}
+            }
+    return job
+
+@app.delete("/documents/{filename}")
+async def delete_document(filename: str):
+    """Delete an uploaded document and remove its chunks from the index.
+    
+    On a read-only worker the removal is queued for the writer and a job id
+    returned instead.
+    """
+    system = require_system()
+    name = Path(filename).name
+    paths = [path for path in (UPLOAD_DIR / name, PARENT_UPLOAD_DIR / name) if path.exists()]
+    if not paths:
+        raise HTTPException(status_code=404, detail=f"Document {name} not found")
+    
+    try:
+        if system.read_only:
+            job = ingestion_jobs.submit([str(path) for path in paths], action="remove")
+            for path in paths:
+                path.unlink()
+            return {"message": f"Deleted {name}; removal from the index is queued", "job_id": job["id"],
+                    "status": job["status"]}
+        
+        removed = await asyncio.to_thread(system.remove_files, paths)
+        for path in paths:
+            path.unlink()
+        
+        if removed:
+            await asyncio.to_thread(publish_snapshot, system)
+        
+        return {"message": f"Deleted {name}", "chunks_removed": removed, "status": "success"}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
+
 @app.post("/query", response_model=QueryResponse)
 async def query_documents(request: QueryRequest):
     """Process a single query."""
+    system = require_system()
     try:
         print(f"Processing query: {request.query}")
-        response = rag_system.query(
-            request.query,
+        params = dict(
             top_k=request.top_k,
-            threshold=request.threshold
+            threshold=request.threshold,
+            nprobe=request.nprobe,
+            ef_search=request.ef_search,
+            mode=request.mode,
+            rerank=request.rerank,
+            rerank_budget_ms=request.rerank_budget_ms
+        )
+        filters = request.filters.to_dict() if request.filters else None
+        response = await query_executor.run_coalesced(
+            QueryExecutor.query_key(request.query, filters=filter_key(filters), **params),
+            system.query,
+            request.query,
+            filters=filters,
+            **params
         )
         print(f"Query processed successfully")
         return response
@@ -146,18 +447,58 @@ async def query_documents(request: QueryRequest):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+@app.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """Process a single query, streaming the answer as server-sent events.
+    
+    Events arrive in order: 'sources' once retrieval is done, one 'token' per
+    generated chunk, then a final 'response' with the full QueryResponse.
+    """
+    system = require_system()
+    print(f"Streaming query: {request.query}")
+    
+    def event_stream():
+        for event in system.query_stream(
+            request.query,
+            top_k=request.top_k,
+            threshold=request.threshold,
+            nprobe=request.nprobe,
+            ef_search=request.ef_search,
+            mode=request.mode,
+            filters=request.filters.to_dict() if request.filters else None,
+            rerank=request.rerank,
+            rerank_budget_ms=request.rerank_budget_ms
+        ):
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+    
+    # A sync generator is iterated in Starlette's threadpool, off the event loop
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/batch-query")
 async def batch_query_documents(request: BatchQueryRequest):
     """Process multiple queries in batch."""
+    if len(request.queries) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch of {len(request.queries)} queries exceeds the limit of {MAX_BATCH_SIZE}"
+        )
+    system = require_system()
+    
     try:
-        responses = []
-        for query in request.queries:
-            response = rag_system.query(
-                query,
-                top_k=request.top_k,
-                threshold=request.threshold
-            )
-            responses.append(response.dict())
+        results = await query_executor.run(
+            system.batch_query,
+            request.queries,
+            top_k=request.top_k,
+            threshold=request.threshold,
+            mode=request.mode,
+            filters=request.filters.to_dict() if request.filters else None,
+            rerank=request.rerank
+        )
+        responses = [response.dict() for response in results]
         
         return {
             "responses": responses,
@@ -170,12 +511,13 @@ async def batch_query_documents(request: BatchQueryRequest):
 @app.post("/load-documents")
 async def load_documents():
     """Manually trigger document loading from uploads directory."""
+    system = require_writer()
     try:
         print("Manually loading documents...")
-        rag_system.add_documents(str(UPLOAD_DIR))
+        await asyncio.to_thread(system.add_documents, str(UPLOAD_DIR))
         
         # Get updated stats
-        stats = rag_system.get_system_stats()
+        stats = system.get_system_stats()
         
         return {
             "message": "Documents loaded successfully",
@@ -192,8 +534,11 @@ async def load_documents():
 @app.get("/stats", response_model=SystemStats)
 async def get_system_stats():
     """Get system statistics."""
+    system = require_system()
     try:
-        stats = rag_system.get_system_stats()
+        stats = system.get_system_stats()
+        stats["executor"] = query_executor.get_statistics()
+        stats["serving"] = serving_state()
         return SystemStats(**stats)
         
     except Exception as e:
@@ -202,11 +547,42 @@ async def get_system_stats():
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error getting system stats: {str(e)}")
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: per-stage latency histograms, counters and gauges."""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (ENABLE_METRICS)")
+    # Collectors read shared state and may do real work; keep it off the event loop
+    return PlainTextResponse(await asyncio.to_thread(metrics.render), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiling")
+async def get_profile(limit: int = 50, collapsed: bool = False):
+    """Profiler state and its most sampled stacks.
+    
+    collapsed=true returns every stack as "frames count" lines instead, the
+    input format of flamegraph.pl and speedscope.
+    """
+    if collapsed:
+        return PlainTextResponse(profiler.collapsed())
+    return {**profiler.get_statistics(), "stacks": profiler.top(limit)}
+
+@app.post("/profiling")
+async def set_profiling(request: ProfilingRequest):
+    """Start or stop the sampling profiler without restarting the server."""
+    if request.reset:
+        profiler.reset()
+    if request.enabled:
+        profiler.start(request.interval_ms)
+    else:
+        await asyncio.to_thread(profiler.stop)
+    return profiler.get_statistics()
+
 @app.post("/save")
 async def save_system(filepath: str = "system_backup"):
     """Save the system state."""
+    system = require_writer()
     try:
-        rag_system.save_system(filepath)
+        await asyncio.to_thread(system.save_system, filepath)
         return {"message": f"System saved to {filepath}", "status": "success"}
         
     except Exception as e:
@@ -215,12 +591,17 @@ async def save_system(filepath: str = "system_backup"):
 @app.post("/load")
 async def load_system(filepath: str = "system_backup"):
     """Load the system state."""
+    system = require_writer()
     try:
-        rag_system.load_system(filepath)
+        await asyncio.to_thread(system.load_system, filepath)
         return {"message": f"System loaded from {filepath}", "status": "success"}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading system: {str(e)}")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # Several workers need the app as an import string; run them with SERVING_MODE=shared
+    # so they share one index instead of each building its own
+    if API_WORKERS > 1 and SERVING_MODE != "shared":
+        print("Warning: API_WORKERS > 1 without SERVING_MODE=shared gives every worker its own index")
+    uvicorn.run("api_server:app" if API_WORKERS > 1 else app, host=API_HOST, port=API_PORT, workers=API_WORKERS)
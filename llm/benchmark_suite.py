@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+End-to-end performance benchmark on synthetic policy corpora, fully offline.
+
+For each corpus size a mix of PDF, DOCX and EML documents is generated and
+ingested into a fresh IntelligentQuerySystem whose LLM is the deterministic
+FakeLLM. The suite then measures:
+  - ingest throughput (documents, chunks and MB per second)
+  - VectorStore.search latency percentiles per retrieval mode
+  - /query and /batch-query throughput and latency at several concurrency
+    levels, through the real API served by uvicorn on 127.0.0.1
+  - memory footprint (process RSS, chunk store and index sizes)
+
+Everything runs in a temporary working directory with the query and
+embedding caches disabled, so repeated runs are comparable. The embedding
+model must already be in the local Hugging Face cache (the hub is put in
+offline mode) and the tiktoken cl100k_base encoding in its cache (set
+TIKTOKEN_CACHE_DIR); the suite checks both before starting. Results are
+written as JSON for regression comparison.
+
+Examples:
+  python benchmark_suite.py --sizes 20,100 --json benchmark.json
+  python benchmark_suite.py --sizes 300 --concurrency 1,8,32 --llm-first-token-ms 300 --llm-tokens-per-second 40
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import format_datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+# Synthetic policy language; numbers and parties are drawn per sentence
+PARTIES = ["the insured", "the policyholder", "the employee", "the contractor", "the company", "the claimant"]
+SUBJECTS = ["hospitalisation", "dental treatment", "maternity care", "travel delay", "water damage",
+            "data breaches", "workplace injury", "vehicle theft", "legal expenses", "overtime pay"]
+OBLIGATIONS = [
+    "Coverage for {subject} is limited to {amount} per policy year, subject to a deductible of {deductible}.",
+    "{party} shall notify the insurer of any claim relating to {subject} within {days} days.",
+    "Claims for {subject} are excluded during the first {days} days of the policy term.",
+    "Under clause {clause}, {party} must provide receipts for {subject} before reimbursement.",
+    "The premium for {subject} cover increases by {percent} percent after each approved claim.",
+    "Section {clause} requires {party} to complete compliance training on {subject} every {days} days.",
+    "Any dispute about {subject} is resolved by arbitration as set out in clause {clause}.",
+    "Benefits for {subject} are paid at {percent} percent of the eligible amount up to {amount}."
+]
+QUERY_TEMPLATES = [
+    "What is the coverage limit for {subject}?",
+    "How many days does {party} have to report a claim for {subject}?",
+    "What does clause {clause} say about {subject}?",
+    "Is {subject} excluded at the start of the policy?",
+    "What percentage of {subject} costs is reimbursed?"
+]
+
+def _fill(template: str, rng: random.Random) -> str:
+    text = template.format(
+        party=rng.choice(PARTIES), subject=rng.choice(SUBJECTS), amount=f"${rng.randint(1, 200) * 500:,}",
+        deductible=f"${rng.randint(1, 40) * 50}", days=rng.choice([7, 14, 30, 60, 90, 180]),
+        percent=rng.choice([10, 20, 50, 80, 90]), clause=f"{rng.randint(1, 12)}.{rng.randint(1, 9)}"
+    )
+    return text[0].upper() + text[1:]
+
+def policy_paragraphs(rng: random.Random, count: int) -> List[str]:
+    """Paragraphs of three to seven synthetic policy sentences."""
+    return [" ".join(_fill(rng.choice(OBLIGATIONS), rng) for _ in range(rng.randint(3, 7))) for _ in range(count)]
+
+def write_pdf(path: Path, pages: List[List[str]]):
+    """Write a minimal text PDF (Helvetica, one text object per page) that PyPDF2 can extract."""
+    def escape(line: str) -> str:
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects: Dict[int, bytes] = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    }
+    kids = []
+    for i, paragraphs in enumerate(pages):
+        lines = []
+        for paragraph in paragraphs:
+            words, line = paragraph.split(), ""
+            for word in words:
+                if len(line) + len(word) > 95:
+                    lines.append(line)
+                    line = ""
+                line = f"{line} {word}" if line else word
+            lines.extend([line, ""])
+        stream = ("BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({escape(line)}) '" for line in lines) + " ET")
+        data = stream.encode('latin-1', errors='replace')
+        page_id, content_id = 4 + 2 * i, 5 + 2 * i
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream"
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 {max(842, 14 * len(lines))}] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>").encode()
+        kids.append(f"{page_id} 0 R")
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(out)
+        out += b"%d 0 obj\n" % number + objects[number] + b"\nendobj\n"
+    xref = len(out)
+    size = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    out += b"".join(b"%010d 00000 n \n" % offsets[number] for number in range(1, size))
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref)
+    path.write_bytes(bytes(out))
+
+def write_docx(path: Path, title: str, paragraphs: List[str]):
+    from docx import Document
+    document = Document()
+    document.add_heading(title, level=1)
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(str(path))
+
+def write_eml(path: Path, subject: str, body: str, date: datetime):
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = "claims@example.com"
+    message["To"] = "policyholder@example.com"
+    message["Date"] = format_datetime(date)
+    message.set_content(body)
+    path.write_bytes(bytes(message))
+
+def generate_corpus(directory: Path, documents: int, seed: int = 0) -> Dict[str, Any]:
+    """Write a reproducible mix of PDF (multi-page), DOCX and EML documents."""
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    counts = {"pdf": 0, "docx": 0, "eml": 0}
+    start = datetime(2024, 1, 1)
+    for i in range(documents):
+        kind = ("pdf", "docx", "eml")[i % 3]
+        if kind == "pdf":
+            write_pdf(directory / f"policy_{i:05d}.pdf", [policy_paragraphs(rng, 4) for _ in range(rng.randint(2, 6))])
+        elif kind == "docx":
+            write_docx(directory / f"handbook_{i:05d}.docx", f"Handbook {i}", policy_paragraphs(rng, rng.randint(6, 16)))
+        else:
+            write_eml(directory / f"claim_{i:05d}.eml", f"Claim {i} update",
+                      "\n\n".join(policy_paragraphs(rng, rng.randint(2, 5))), start + timedelta(days=i % 365))
+        counts[kind] += 1
+    counts["bytes"] = sum(path.stat().st_size for path in directory.iterdir())
+    return counts
+
+def make_queries(count: int, seed: int = 1) -> List[str]:
+    """Distinct queries, so neither the cache nor request coalescing can merge them."""
+    rng = random.Random(seed)
+    queries = []
+    seen = set()
+    for i in range(count):
+        query = _fill(rng.choice(QUERY_TEMPLATES), rng)
+        if query in seen:
+            query = f"{query} (variant {i})"
+        seen.add(query)
+        queries.append(query)
+    return queries
+
+def latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies_ms)
+    if not ordered:
+        return {}
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 3)
+
+    return {"mean_ms": round(sum(ordered) / len(ordered), 3), "p50_ms": percentile(50),
+            "p95_ms": percentile(95), "p99_ms": percentile(99), "max_ms": round(ordered[-1], 3)}
+
+def rss_mb() -> float:
+    """Resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def bench_ingest(system, directory: Path, corpus: Dict[str, Any]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    documents = system.add_documents(str(directory))
+    elapsed = time.perf_counter() - start
+    chunks = system.vector_store.get_statistics()["total_documents"]
+    return {
+        "documents": documents,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "documents_per_s": round(documents / elapsed, 2),
+        "chunks_per_s": round(chunks / elapsed, 1),
+        "mb_per_s": round(corpus["bytes"] / elapsed / 1e6, 3)
+    }
+
+def bench_search(store, queries: List[str], k: int) -> Dict[str, Any]:
+    """Per-query VectorStore.search latency, one query at a time, for each retrieval mode."""
+    results = {}
+    for mode in ("dense", "lexical", "hybrid"):
+        store.search(queries[0], k, mode=mode)  # warm-up
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            store.search(query, k, mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results[mode] = latency_summary(latencies)
+    return results
+
+def memory_footprint(system) -> Dict[str, Any]:
+    import faiss
+    store = system.vector_store
+    stats = store.get_statistics()
+    return {
+        "rss_mb": rss_mb(),
+        "index_type": stats.get("index_type"),
+        "index_mb": round(len(faiss.serialize_index(store.index)) / 1e6, 2) if store.index is not None else 0.0,
+        "chunk_store_mb": round(stats["chunk_store"]["bytes"] / 1e6, 2) if stats.get("chunk_store") else 0.0
+    }
+
+def start_server():
+    """Serve api_server.app on a free loopback port without its startup hooks; returns (base_url, server)."""
+    import uvicorn
+    import api_server
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    # lifespan off: the benchmark installs its own system instead of booting from a snapshot
+    server = uvicorn.Server(uvicorn.Config(api_server.app, host="127.0.0.1", port=port, lifespan="off",
+                                           log_level="warning", access_log=False))
+    threading.Thread(target=server.run, name="benchmark-server", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
+
+def post_json(url: str, payload: Dict[str, Any]) -> Tuple[int, float]:
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=600) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, (time.perf_counter() - start) * 1000
+
+def bench_endpoint(url: str, payloads: List[Dict[str, Any]], concurrency: int, queries_per_request: int = 1) -> Dict[str, Any]:
+    """Send payloads with a fixed number of requests in flight; report throughput and latency."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda payload: post_json(url, payload), payloads))
+    elapsed = time.perf_counter() - start
+    ok = [latency for status, latency in results if status == 200]
+    return {
+        "concurrency": concurrency,
+        "requests": len(payloads),
+        "errors": len(payloads) - len(ok),
+        "requests_per_s": round(len(ok) / elapsed, 2),
+        "queries_per_s": round(len(ok) * queries_per_request / elapsed, 2),
+        **latency_summary(ok)
+    }
+
+def run_size(documents: int, args, base_url: str, workdir: Path) -> Dict[str, Any]:
+    import api_server
+    from fake_llm import FakeLLM
+    from rag_system import IntelligentQuerySystem
+
+    corpus_dir = workdir / f"corpus_{documents}"
+    started = time.perf_counter()
+    corpus = generate_corpus(corpus_dir, documents, seed=args.seed)
+    print(f"[{documents} documents] corpus generated in {time.perf_counter() - started:.1f}s ({corpus['bytes']} bytes)")
+
+    rss_before = rss_mb()
+    system = IntelligentQuerySystem(llm=FakeLLM(first_token_ms=args.llm_first_token_ms,
+                                                tokens_per_second=args.llm_tokens_per_second))
+    # Measure real work: no answer cache, no embedding cache
+    system.cache = None
+    system.vector_store.embedding_cache = None
+    rss_loaded = rss_mb()
+
+    ingest = bench_ingest(system, corpus_dir, corpus)
+    print(f"[{documents} documents] ingested {ingest['chunks']} chunks in {ingest['seconds']}s")
+    memory = {"rss_before_mb": rss_before, "rss_model_loaded_mb": rss_loaded, **memory_footprint(system)}
+
+    queries = make_queries(args.queries + args.batch_size * args.batches * len(args.concurrency)
+                           + args.queries * len(args.concurrency), seed=args.seed + 1)
+    search = bench_search(system.vector_store, queries[:args.queries], args.k)
+    print(f"[{documents} documents] search p95: " + ", ".join(f"{m}={r['p95_ms']}ms" for m, r in search.items()))
+
+    api_server.rag_system = system
+    remaining = iter(queries[args.queries:])
+    query_runs, batch_runs = [], []
+    for concurrency in args.concurrency:
+        payloads = [{"query": next(remaining), "top_k": args.k} for _ in range(args.queries)]
+        query_runs.append(bench_endpoint(f"{base_url}/query", payloads, concurrency))
+        batches = [{"queries": [next(remaining) for _ in range(args.batch_size)], "top_k": args.k}
+                   for _ in range(args.batches)]
+        batch_runs.append(bench_endpoint(f"{base_url}/batch-query", batches, concurrency, args.batch_size))
+        print(f"[{documents} documents] concurrency {concurrency}: /query {query_runs[-1]['requests_per_s']} req/s, "
+              f"/batch-query {batch_runs[-1]['queries_per_s']} queries/s")
+    api_server.rag_system = None
+
+    memory["rss_after_queries_mb"] = rss_mb()
+    return {
+        "documents": documents,
+        "corpus": corpus,
+        "ingest": ingest,
+        "search": search,
+        "query": query_runs,
+        "batch_query": batch_runs,
+        "memory": memory
+    }
+
+def check_offline_caches():
+    """Exit with a message naming what to pre-fetch unless the tokenizer and model files are cached."""
+    from huggingface_hub import snapshot_download
+    from config import DEFAULT_EMBEDDING_MODEL
+    import tiktoken
+
+    missing = []
+    try:
+        tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        missing.append(f"tiktoken cl100k_base encoding ({type(e).__name__}): run "
+                       f"python -c \"import tiktoken; tiktoken.get_encoding('cl100k_base')\" once with network "
+                       f"access and TIKTOKEN_CACHE_DIR set, then keep TIKTOKEN_CACHE_DIR set for the benchmark")
+    # Bare names resolve as in load_embedding_tokenizer
+    repo_id = DEFAULT_EMBEDDING_MODEL
+    if "/" not in repo_id:
+        repo_id = f"sentence-transformers/{repo_id}"
+    if not os.path.isdir(DEFAULT_EMBEDDING_MODEL):
+        try:
+            snapshot_download(repo_id, local_files_only=True)
+        except Exception as e:
+            missing.append(f"embedding model {repo_id} ({type(e).__name__}): run "
+                           f"huggingface-cli download {repo_id} once with network access")
+    if missing:
+        print("The benchmark runs offline, but these are not cached locally:", file=sys.stderr)
+        for item in missing:
+            print(f"  - {item}", file=sys.stderr)
+        sys.exit(2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end performance benchmark")
+    parser.add_argument("--sizes", type=str, default="30,150", help="Corpus sizes in documents (default: 30,150)")
+    parser.add_argument("--queries", type=int, default=100, help="Queries per search and /query run (default: 100)")
+    parser.add_argument("--k", type=int, default=5, help="Chunks retrieved per query (default: 5)")
+    parser.add_argument("--concurrency", type=str, default="1,4,16", help="Requests in flight (default: 1,4,16)")
+    parser.add_argument("--batch-size", type=int, default=10, help="Queries per /batch-query request (default: 10)")
+    parser.add_argument("--batches", type=int, default=10, help="/batch-query requests per run (default: 10)")
+    parser.add_argument("--llm-first-token-ms", type=float, default=0.0, help="Fake LLM time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0.0, help="Fake LLM generation rate (0: instant)")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus and query seed (default: 0)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary working directory")
+    parser.add_argument("--json", type=str, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    sizes = [int(s) for s in args.sizes.split(",")]
+    output = Path(args.json).resolve() if args.json else None
+    original_directory = os.getcwd()
+
+    # No network: the embedding model must come from the local cache
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    # config creates its directories relative to the working directory at import
+    workdir = Path(tempfile.mkdtemp(prefix="rag-benchmark-"))
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    os.chdir(workdir)
+    print(f"Working directory: {workdir}")
+
+    try:
+        check_offline_caches()
+        base_url, server = start_server()
+        results = [run_size(size, args, base_url, workdir) for size in sizes]
+        server.should_exit = True
+    finally:
+        os.chdir(original_directory)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    import faiss
+    from config import DEFAULT_EMBEDDING_MODEL, DEFAULT_INDEX_TYPE, RETRIEVAL_MODE
+    report = {
+        "created": datetime.now().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "faiss": getattr(faiss, "__version__", None)
+        },
+        "settings": {
+            **{key: value for key, value in vars(args).items() if key not in ("json", "keep")},
+            "embedding_model": DEFAULT_EMBEDDING_MODEL,
+            "index_type": DEFAULT_INDEX_TYPE,
+            "retrieval_mode": RETRIEVAL_MODE
+        },
+        "results": results
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to: {output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Memory per chunk of the columnar ChunkStore against a dict of DocumentChunk objects.
+
+Synthetic chunks resemble ingested ones: about a chunk's worth of text, a
+per-page source, a creation datetime and, for a share of them, an email's
+metadata dict. Memory is measured with tracemalloc while each layout is
+filled, so only what the layout retains is counted.
+
+Examples:
+  python chunk_memory_report.py --chunks 200000
+  python chunk_memory_report.py --json chunk_memory.json
+"""
+
+import argparse
+import json
+import random
+import string
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict
+from chunk_store import ChunkStore
+from document_processor import DocumentChunk
+
+def synthetic_chunk(i: int, rng: random.Random, text_chars: int) -> DocumentChunk:
+    """A chunk with fresh string and dict objects, as the document processor produces."""
+    document = i // 40
+    content = "".join(rng.choices(string.ascii_lowercase + "     .", k=text_chars))
+    is_email = document % 4 == 0
+    return DocumentChunk(
+        content=content,
+        source=f"policy_{document}_page_{(i % 40) // 4 + 1}" if not is_email else f"message_{document}",
+        chunk_id=f"policy_{document}_chunk_{i % 40}",
+        page_number=(i % 40) // 4 + 1 if not is_email else None,
+        section="email" if is_email else None,
+        timestamp=datetime.now(),
+        metadata={
+            'subject': f"Claim {document} update", 'sender': "claims@example.com",
+            'date': "Mon, 3 Jun 2024 10:00:00 +0000", 'type': 'email'
+        } if is_email else {'type': 'pdf'},
+        document_id=f"{document:064x}",
+        start_char=(i % 4) * text_chars,
+        end_char=(i % 4 + 1) * text_chars
+    )
+
+def measure(fill: Callable[[], Any]) -> int:
+    """Bytes still allocated after fill() returns, keeping its result alive."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = fill()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+def memory_report(count: int, text_chars: int) -> Dict[str, Any]:
+    """Bytes per chunk of each layout, total and excluding the UTF-8 text itself."""
+    def objects():
+        rng = random.Random(0)
+        return {i: synthetic_chunk(i, rng, text_chars) for i in range(count)}
+
+    def columns():
+        rng = random.Random(0)
+        store = ChunkStore()
+        for i in range(count):
+            store[i] = synthetic_chunk(i, rng, text_chars)
+        return store
+
+    results = {}
+    for name, fill in (("objects", objects), ("columns", columns)):
+        total = measure(fill)
+        results[name] = {
+            "bytes_per_chunk": round(total / count, 1),
+            "overhead_per_chunk": round(total / count - text_chars, 1)
+        }
+    results["ratio"] = round(results["objects"]["bytes_per_chunk"] / results["columns"]["bytes_per_chunk"], 2)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per chunk of ChunkStore vs DocumentChunk objects")
+    parser.add_argument("--chunks", type=int, default=50000, help="Number of chunks (default: 50000)")
+    parser.add_argument("--text-chars", type=int, default=900, help="Characters of text per chunk (default: 900)")
+    parser.add_argument("--json", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = memory_report(args.chunks, args.text_chars)
+    print(f"Chunks: {args.chunks}, {args.text_chars} characters of text each")
+    print(f"{'layout':<10} {'bytes/chunk':>12} {'overhead':>10}")
+    print("-" * 34)
+    for name in ("objects", "columns"):
+        row = report[name]
+        print(f"{name:<10} {row['bytes_per_chunk']:>12.1f} {row['overhead_per_chunk']:>10.1f}")
+    print(f"Objects use {report['ratio']}x the memory of columns")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"chunks": args.chunks, "text_chars": args.text_chars, **report}, f, indent=2)
+        print(f"Report written to: {args.json}")
+
+if __name__ == "__main__":
+    main()
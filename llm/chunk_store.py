@@ -0,0 +1,161 @@
+import json
+import math
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+from document_processor import DocumentChunk
+
+class InternedStrings:
+    """Growable column of repeated strings: a table of distinct values plus per-row indices."""
+
+    def __init__(self):
+        self.table = []
+        self.lookup: Dict[str, int] = {}
+        self.indices = array('i')
+
+    def append(self, value: Optional[str]):
+        if value is None:
+            self.indices.append(-1)
+            return
+        entry = self.lookup.get(value)
+        if entry is None:
+            entry = self.lookup[value] = len(self.table)
+            self.table.append(value)
+        self.indices.append(entry)
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        entry = self.indices[row]
+        return self.table[entry] if entry >= 0 else None
+
+    def nbytes(self) -> int:
+        return (self.indices.itemsize * len(self.indices) + sys.getsizeof(self.table) + sys.getsizeof(self.lookup)
+                + sum(sys.getsizeof(value) for value in self.table))
+
+class ChunkStore(MutableMapping):
+    """Columnar in-memory mapping of chunk id -> DocumentChunk.
+
+    Chunks are stored as columns rather than objects: text and chunk ids in
+    contiguous UTF-8 buffers addressed by offsets, source, section, document
+    id and metadata interned, and page numbers, timestamps and character
+    offsets in typed arrays. DocumentChunk objects are built only when a
+    chunk is read, e.g. for search results. Ids must be added in ascending
+    order and are found by binary search; deleted rows are masked until
+    compacted().
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.text = bytearray()
+        self.text_offsets = array('q', [0])
+        self.chunk_ids = bytearray()
+        self.chunk_id_offsets = array('q', [0])
+        self.source = InternedStrings()
+        self.section = InternedStrings()
+        self.document_id = InternedStrings()
+        # Chunks of one email or file share their metadata, so it is interned as JSON
+        self.metadata = InternedStrings()
+        self.page_number = array('i')
+        self.timestamp = array('d')
+        self.start_char = array('q')
+        self.end_char = array('q')
+        self.deleted: set = set()
+
+    @classmethod
+    def from_items(cls, items: Iterable[Tuple[int, DocumentChunk]]) -> "ChunkStore":
+        store = cls()
+        for chunk_id, chunk in items:
+            store[chunk_id] = chunk
+        return store
+
+    def _row(self, chunk_id: int) -> Optional[int]:
+        row = bisect_left(self.ids, chunk_id)
+        if row < len(self.ids) and self.ids[row] == chunk_id and row not in self.deleted:
+            return row
+        return None
+
+    def _materialize(self, row: int) -> DocumentChunk:
+        timestamp = self.timestamp[row]
+        metadata = self.metadata[row]
+        return DocumentChunk(
+            content=self.text[self.text_offsets[row]:self.text_offsets[row + 1]].decode('utf-8'),
+            source=self.source[row],
+            chunk_id=self.chunk_ids[self.chunk_id_offsets[row]:self.chunk_id_offsets[row + 1]].decode('utf-8'),
+            page_number=self.page_number[row] if self.page_number[row] >= 0 else None,
+            section=self.section[row],
+            timestamp=datetime.fromtimestamp(timestamp) if not math.isnan(timestamp) else None,
+            metadata=json.loads(metadata) if metadata is not None else {},
+            document_id=self.document_id[row],
+            start_char=self.start_char[row] if self.start_char[row] >= 0 else None,
+            end_char=self.end_char[row] if self.end_char[row] >= 0 else None
+        )
+
+    def __getitem__(self, chunk_id: int) -> DocumentChunk:
+        row = self._row(chunk_id)
+        if row is None:
+            raise KeyError(chunk_id)
+        return self._materialize(row)
+
+    def __setitem__(self, chunk_id: int, chunk: DocumentChunk):
+        if self.ids and chunk_id <= self.ids[-1]:
+            if self._row(chunk_id) is not None:
+                raise KeyError(f"Chunk id {chunk_id} already exists")
+            raise ValueError(f"Chunk ids must be added in ascending order (got {chunk_id} after {self.ids[-1]})")
+
+        self.text += chunk.content.encode('utf-8')
+        self.text_offsets.append(len(self.text))
+        self.chunk_ids += chunk.chunk_id.encode('utf-8')
+        self.chunk_id_offsets.append(len(self.chunk_ids))
+        self.source.append(chunk.source)
+        self.section.append(chunk.section)
+        self.document_id.append(getattr(chunk, 'document_id', None))
+        self.metadata.append(json.dumps(chunk.metadata, sort_keys=True, default=str) if chunk.metadata else None)
+        self.page_number.append(chunk.page_number if chunk.page_number is not None else -1)
+        self.timestamp.append(chunk.timestamp.timestamp() if chunk.timestamp else math.nan)
+        self.start_char.append(chunk.start_char if chunk.start_char is not None else -1)
+        self.end_char.append(chunk.end_char if chunk.end_char is not None else -1)
+        # Last, so a row is only findable once all of its columns exist
+        self.ids.append(chunk_id)
+
+    def __delitem__(self, chunk_id: int):
+        row = self._row(chunk_id)
+        if row is None:
+            raise KeyError(chunk_id)
+        self.deleted.add(row)
+
+    def __len__(self) -> int:
+        return len(self.ids) - len(self.deleted)
+
+    def __iter__(self) -> Iterator[int]:
+        for row, chunk_id in enumerate(self.ids):
+            if row not in self.deleted:
+                yield chunk_id
+
+    def __contains__(self, chunk_id) -> bool:
+        return self._row(chunk_id) is not None
+
+    def compacted(self) -> "ChunkStore":
+        """A copy without the deleted rows; the caller swaps it in."""
+        if not self.deleted:
+            return self
+        return ChunkStore.from_items((chunk_id, self[chunk_id]) for chunk_id in list(self))
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns, including deleted rows."""
+        arrays = (self.ids, self.text_offsets, self.chunk_id_offsets, self.page_number,
+                  self.timestamp, self.start_char, self.end_char)
+        return (len(self.text) + len(self.chunk_ids)
+                + sum(column.itemsize * len(column) for column in arrays)
+                + sum(column.nbytes() for column in (self.source, self.section, self.document_id, self.metadata)))
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Size of the store in chunks and bytes."""
+        nbytes = self.nbytes()
+        return {
+            "chunks": len(self),
+            "deleted_pending": len(self.deleted),
+            "bytes": nbytes,
+            "bytes_per_chunk": round(nbytes / len(self.ids), 1) if len(self.ids) else 0.0
+        }
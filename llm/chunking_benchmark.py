@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Chunking throughput and retrieval-quality benchmark.
+
+Compares DocumentProcessor's sentence-aware chunker with the fixed 1000-token
+window chunker it replaced. Throughput is measured on raw text; quality is
+recall@k of sentence-level queries against each chunker's chunks embedded
+with the configured model, which truncates anything beyond its maximum
+sequence length. Text comes from a document directory (--dir) or is generated
+synthetically.
+
+The new chunker counts with the embedding model's tokenizer and the legacy
+one windows tiktoken cl100k_base tokens, as it did. Both are downloaded on
+first use, so an offline run needs the model in the Hugging Face cache and
+cl100k_base in the tiktoken cache (TIKTOKEN_CACHE_DIR).
+
+Examples:
+  python chunking_benchmark.py --paragraphs 2000 --no-quality
+  python chunking_benchmark.py --dir sample_docs --json chunking.json
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from document_processor import DocumentChunk, DocumentProcessor
+from config import DEFAULT_EMBEDDING_MODEL, EMBEDDING_MAX_SEQ_LENGTH
+
+def legacy_chunk_text(processor: DocumentProcessor, text: str, source: str,
+                      chunk_size: int = 1000, chunk_overlap: int = 200) -> List[DocumentChunk]:
+    """The previous chunker: overlapping token windows, each decoded back to text."""
+    chunks = []
+    tokens = processor.tokenizer.encode(text)
+    for i in range(0, len(tokens), chunk_size - chunk_overlap):
+        chunk_text = processor.tokenizer.decode(tokens[i:i + chunk_size])
+        if chunk_text.strip():
+            chunks.append(DocumentChunk(content=chunk_text, source=source,
+                                        chunk_id=f"{source}_chunk_{i//chunk_size}"))
+    return chunks
+
+def synthetic_texts(paragraphs: int, seed: int = 0) -> List[str]:
+    """Generate documents of paragraphs made of distinguishable pseudo-word sentences."""
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ren", "tus", "va", "del", "po", "shi", "ran", "te", "gor"]
+    vocabulary = ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(3000)]
+    texts = []
+    for _ in range(max(1, paragraphs // 20)):
+        document = []
+        for _ in range(20):
+            sentences = [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(8, 24))).capitalize() + "."
+                         for _ in range(rng.randint(2, 8))]
+            document.append(" ".join(sentences))
+        texts.append("\n\n".join(document))
+    return texts
+
+def collect_texts(processor: DocumentProcessor, directory: str) -> List[str]:
+    """Extract the page and document texts the processor would chunk from a directory."""
+    texts = []
+
+    def record(text, *args, **kwargs):
+        texts.append(text)
+        return []
+
+    processor._chunk_text = record
+    for path in processor.list_documents(directory):
+        processor.process_file(str(path))
+    del processor._chunk_text
+    return texts
+
+def measure_throughput(name: str, chunk, texts: List[str]) -> Tuple[Dict[str, Any], List[List[DocumentChunk]]]:
+    """Chunk every text once, returning throughput stats and the chunks per text."""
+    start = time.perf_counter()
+    results = [chunk(text, f"doc{i}") for i, text in enumerate(texts)]
+    elapsed = time.perf_counter() - start
+    count = sum(len(chunks) for chunks in results)
+    characters = sum(len(text) for text in texts)
+    return {
+        "chunker": name,
+        "chunks": count,
+        "seconds": round(elapsed, 3),
+        "chunks_per_s": round(count / elapsed, 1) if elapsed else 0.0,
+        "mb_per_s": round(characters / elapsed / 1e6, 2) if elapsed else 0.0
+    }, results
+
+def truncation_stats(model, results: List[List[DocumentChunk]]) -> Dict[str, Any]:
+    """Share of chunks, and of their tokens, beyond the embedding model's input limit."""
+    lengths = np.array([len(model.tokenizer.tokenize(chunk.content)) + 2
+                        for chunks in results for chunk in chunks])
+    limit = model.max_seq_length
+    return {
+        "mean_model_tokens": round(float(lengths.mean()), 1) if len(lengths) else 0.0,
+        "truncated_chunks": round(float((lengths > limit).mean()), 4) if len(lengths) else 0.0,
+        "unembedded_tokens": round(float(np.maximum(lengths - limit, 0).sum() / lengths.sum()), 4) if len(lengths) else 0.0
+    }
+
+def make_queries(texts: List[str], count: int, seed: int = 1) -> List[Tuple[int, str, str]]:
+    """Sample (text index, sentence, query) triples; queries drop a third of the sentence's words."""
+    rng = random.Random(seed)
+    candidates = []
+    for i, text in enumerate(texts):
+        for sentence in text.replace("\n", " ").split(". "):
+            words = sentence.strip().rstrip(".").split()
+            if len(words) >= 8:
+                candidates.append((i, " ".join(words)))
+    triples = []
+    for i, sentence in rng.sample(candidates, min(count, len(candidates))):
+        words = sentence.split()
+        kept = sorted(rng.sample(range(len(words)), max(4, len(words) * 2 // 3)))
+        triples.append((i, sentence, " ".join(words[j] for j in kept)))
+    return triples
+
+def recall_at_k(model, results: List[List[DocumentChunk]], queries: List[Tuple[int, str, str]], k: int) -> float:
+    """Fraction of queries whose source sentence is in one of the top-k retrieved chunks."""
+    chunks = [(i, chunk) for i, text_chunks in enumerate(results) for chunk in text_chunks]
+    vectors = model.encode([chunk.content for _, chunk in chunks], batch_size=64,
+                           normalize_embeddings=True, show_progress_bar=False)
+    query_vectors = model.encode([query for _, _, query in queries], batch_size=64,
+                                 normalize_embeddings=True, show_progress_bar=False)
+    hits = 0
+    for (text_index, sentence, _), scores in zip(queries, query_vectors @ vectors.T):
+        top = np.argsort(-scores)[:k]
+        normalized = " ".join(sentence.split())
+        hits += any(chunks[j][0] == text_index and normalized in " ".join(chunks[j][1].content.split())
+                    for j in top)
+    return hits / len(queries) if queries else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunking throughput and retrieval-quality benchmark")
+    parser.add_argument("--dir", type=str, help="Directory of documents to chunk")
+    parser.add_argument("--paragraphs", type=int, default=1000, help="Synthetic paragraphs (default: 1000)")
+    parser.add_argument("--queries", type=int, default=200, help="Sentence queries (default: 200)")
+    parser.add_argument("--k", type=int, default=5, help="Chunks retrieved per query (default: 5)")
+    parser.add_argument("--no-quality", action="store_true", help="Skip the embedding model measurements")
+    parser.add_argument("--json", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    processor = DocumentProcessor(workers=1)
+    texts = collect_texts(processor, args.dir) if args.dir else synthetic_texts(args.paragraphs)
+    print(f"Corpus: {len(texts)} texts, {sum(len(t) for t in texts)} characters")
+
+    chunkers = [
+        ("legacy", lambda text, source: legacy_chunk_text(processor, text, source)),
+        ("sentence", lambda text, source: processor._chunk_text(text, source))
+    ]
+    rows, outputs = [], []
+    for name, chunk in chunkers:
+        row, results = measure_throughput(name, chunk, texts)
+        ids = [c.chunk_id for chunks in results for c in chunks]
+        row["duplicate_ids"] = len(ids) - len(set(ids))
+        rows.append(row)
+        outputs.append(results)
+
+    if not args.no_quality:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(DEFAULT_EMBEDDING_MODEL)
+        model.max_seq_length = EMBEDDING_MAX_SEQ_LENGTH
+        queries = make_queries(texts, args.queries)
+        for row, results in zip(rows, outputs):
+            row.update(truncation_stats(model, results))
+            row[f"recall@{args.k}"] = round(recall_at_k(model, results, queries, args.k), 4)
+
+    for row in rows:
+        print(", ".join(f"{key}={value}" for key, value in row.items()))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"texts": len(texts), "chunk_size": processor.chunk_size,
+                       "chunk_overlap": processor.chunk_overlap, "results": rows}, f, indent=2)
+        print(f"Report written to: {args.json}")
+
+if __name__ == "__main__":
+    main()
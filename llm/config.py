@@ -10,9 +10,19 @@ SYSTEM_NAME = "Intelligent Query-Retrieval System"
 VERSION = "1.0.0"
 
 # Document Processing Configuration
-DEFAULT_CHUNK_SIZE = 1000
-DEFAULT_CHUNK_OVERLAP = 200
+# Chunks are sized so the embedding model sees all of their text: all-MiniLM-L6-v2
+# truncates input beyond EMBEDDING_MAX_SEQ_LENGTH WordPiece tokens (including the
+# two special tokens), and chunk sizes are counted with the model's own tokenizer
+EMBEDDING_MAX_SEQ_LENGTH = 256
+DEFAULT_CHUNK_SIZE = EMBEDDING_MAX_SEQ_LENGTH - 2
+DEFAULT_CHUNK_OVERLAP = 32  # whole sentences up to this many tokens are repeated in the next chunk
 SUPPORTED_FORMATS = ['.pdf', '.docx', '.txt', '.eml']
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+PDF_PAGES_PER_TASK = 50  # large PDFs are split into page ranges of this size
+PARSE_WORKER_NICE = 10  # parse workers run at lower CPU priority than query serving
+EMBED_BATCH_SIZE = 256  # chunks encoded per step; ingestion yields to queries between steps
+INGEST_BATCH_SIZE = 2048  # chunks held in memory per index append; each append is searchable at once
+INGESTION_YIELD_MAX_WAIT = 0.5  # seconds ingestion waits for in-flight queries before continuing
 
 # Vector Store Configuration
 DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
@@ -20,14 +30,66 @@ DEFAULT_EMBEDDING_DIMENSION = 384
 DEFAULT_SEARCH_THRESHOLD = 0.3
 DEFAULT_TOP_K = 5
 
+# Index type: "flat" (exact), "ivf" (IVF-Flat), "hnsw", "sq8" (int8 scalar
+# quantization), "pq" (product quantization), or "auto" (flat until the corpus
+# reaches ANN_THRESHOLD chunks, then ANN_AUTO_INDEX_TYPE)
+DEFAULT_INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")
+ANN_THRESHOLD = 50000
+ANN_AUTO_INDEX_TYPE = "hnsw"
+IVF_NLIST = 1024
+IVF_NPROBE = 16
+IVF_TRAINING_SAMPLE = 100000
+# ivf, sq8 and pq are trained on the vectors present when they are created; retrain
+# once the corpus has grown this many times past that, until IVF_TRAINING_SAMPLE
+RETRAIN_GROWTH_FACTOR = 4
+COMPACTION_TOMBSTONE_RATIO = 0.2  # compact in the background once removed chunks exceed this fraction of the index
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# Quantized indexes store codes instead of 4 bytes per dimension: sq8 one byte
+# per dimension, pq PQ_M bytes per vector (PQ_M must divide the dimension)
+PQ_M = 48
+PQ_NBITS = 8
+# Re-score the top RESCORE_FACTOR * k quantized candidates against float vectors
+RESCORE_ENABLED = os.getenv("RESCORE_ENABLED", "true").lower() == "true"
+RESCORE_FACTOR = 4
+
+# Retrieval mode: "dense" (embeddings only), "lexical" (BM25 only) or "hybrid"
+# (both, fused with reciprocal rank fusion). The similarity threshold only
+# applies to dense hits, so lexical and hybrid return sources for any query
+# sharing a term with the corpus; they are opt-in per request or here.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # rank offset in 1 / (RRF_K + rank)
+HYBRID_CANDIDATES = 4  # each retriever contributes top_k * HYBRID_CANDIDATES candidates
+# Filtered searches matching at most this many chunks are scored exactly
+# instead of through the ANN index, which loses recall under tight filters
+FILTER_EXACT_LIMIT = 4096
+
 # LLM Configuration
 DEFAULT_LLM_MODEL = "llama3.2:3b"
 DEFAULT_TEMPERATURE = 0.1
 DEFAULT_MAX_TOKENS = 2048
+# "ollama", or "fake" for the deterministic offline FakeLLM (benchmarks, development)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")
+# Ollama servers generations are spread over, least outstanding requests first
+OLLAMA_BASE_URLS = [u.strip() for u in os.getenv("OLLAMA_BASE_URLS", "http://localhost:11434").split(",") if u.strip()]
+# Circuit breaker: a server is ejected after LLM_BREAKER_FAILURES consecutive
+# failed calls, or once its average time to first token (over at least
+# LLM_LATENCY_SAMPLES calls) exceeds both LLM_SLOW_MIN_SECONDS and
+# LLM_SLOW_FACTOR times the median of the servers still in use. It gets one
+# trial request after LLM_BREAKER_COOLDOWN seconds.
+LLM_BREAKER_FAILURES = 3
+LLM_BREAKER_COOLDOWN = 30.0
+LLM_SLOW_FACTOR = 3.0
+LLM_SLOW_MIN_SECONDS = 2.0
+LLM_LATENCY_SAMPLES = 5
 
 # API Configuration
 API_HOST = "0.0.0.0"
 API_PORT = 8000
+API_WORKERS = int(os.getenv("API_WORKERS", 1))  # server processes; see SERVING_MODE
 API_TITLE = "Intelligent Query-Retrieval System API"
 API_DESCRIPTION = "LLM-Powered system for processing documents and answering queries in insurance, legal, HR, and compliance domains"
 
@@ -35,6 +97,38 @@ API_DESCRIPTION = "LLM-Powered system for processing documents and answering que
 UPLOAD_DIR = Path("uploads")
 SAMPLE_DOCS_DIR = Path("sample_docs")
 SYSTEM_BACKUP_DIR = Path("backups")
+SNAPSHOT_PATH = SYSTEM_BACKUP_DIR / "vector_store"  # the server boots from this snapshot
+AUTO_SAVE_SNAPSHOT = True  # re-save the snapshot after ingestion changes the index
+# Each save writes a whole generation, so ingestion changes are published at
+# most once per interval, or sooner once this many changes are pending
+SNAPSHOT_PUBLISH_INTERVAL = float(os.getenv("SNAPSHOT_PUBLISH_INTERVAL", 30.0))  # seconds
+SNAPSHOT_PUBLISH_MAX_PENDING = int(os.getenv("SNAPSHOT_PUBLISH_MAX_PENDING", 20))
+INGESTION_QUEUE_PATH = SYSTEM_BACKUP_DIR / "ingestion_jobs.json"
+SNAPSHOT_KEEP_GENERATIONS = 3  # published snapshot generations left on disk
+
+# Serving mode: "single" (one process ingests and serves) or "shared" (several
+# workers, e.g. uvicorn --workers N: the one holding WRITER_LOCK_PATH ingests
+# and publishes snapshot generations, the others serve them read-only)
+SERVING_MODE = os.getenv("SERVING_MODE", "single")
+WRITER_LOCK_PATH = SYSTEM_BACKUP_DIR / "writer.lock"
+INGESTION_INBOX_DIR = SYSTEM_BACKUP_DIR / "ingestion_inbox"  # jobs submitted by read-only workers
+SNAPSHOT_POLL_INTERVAL = 2.0  # seconds between read-only workers' checks for a new generation
+
+# Sharding: with SHARD_ADDRESSES set ("host:port,host:port"), chunks are
+# partitioned by source across shard processes (python sharded_store.py serve)
+# and this process only embeds, routes and merges
+SHARD_ADDRESSES = [a.strip() for a in os.getenv("SHARD_ADDRESSES", "").split(",") if a.strip()]
+# Calls are pickled, so anyone holding the key can run code in a shard: with
+# the default key, shards only bind loopback addresses
+DEFAULT_SHARD_AUTHKEY = b"rag-shards"
+SHARD_AUTHKEY = os.getenv("SHARD_AUTHKEY", DEFAULT_SHARD_AUTHKEY.decode()).encode()
+SHARD_TIMEOUT = 30.0  # seconds to wait for a shard's reply
+SHARD_DATA_DIR = SYSTEM_BACKUP_DIR / "shards"  # each shard saves its snapshot under here
+SHARD_MOVE_BATCH = 1024  # chunks moved per call while rebalancing
+# Shard list saved whenever shards are added, removed or rebalanced; once it
+# exists, coordinators use it instead of SHARD_ADDRESSES so no shard holding
+# moved sources is forgotten on restart
+SHARD_LIST_PATH = SYSTEM_BACKUP_DIR / "shards.json"
 
 # Create necessary directories
 UPLOAD_DIR.mkdir(exist_ok=True)
@@ -84,8 +178,21 @@ QUERY_TEMPLATES = {
 # Performance Configuration
 MAX_DOCUMENT_SIZE = 50 * 1024 * 1024  # 50MB
 MAX_BATCH_SIZE = 100
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", 8))  # threads serving queries off the event loop
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 2))  # simultaneous LLM generations per Ollama server
+RETRIEVAL_CONCURRENCY = int(os.getenv("RETRIEVAL_CONCURRENCY", 4))  # simultaneous embed + search calls
 CACHE_ENABLED = True
 CACHE_TTL = 3600  # 1 hour
+CACHE_MAX_ENTRIES = 1024
+# Cosine similarity at which a different query counts as a cache hit; None disables
+CACHE_SIMILARITY_THRESHOLD = None
+
+# Optional cross-encoder re-ranking of retrieved chunks before generation
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 20  # first-stage candidates fetched per query when re-ranking
+RERANK_BATCH_SIZE = 16
+RERANK_BUDGET_MS = 150.0  # per request; first-stage order is kept when exceeded
 
 # Logging Configuration
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -100,19 +207,28 @@ MAX_REQUESTS_PER_MINUTE = 60
 ENABLE_GPU_ACCELERATION = False
 MODEL_CACHE_DIR = Path("model_cache")
 MODEL_CACHE_DIR.mkdir(exist_ok=True)
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_DIR = Path("embedding_cache")
 
 # Response Configuration
 MAX_RESPONSE_LENGTH = 2000
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))  # tiktoken tokens of retrieved context per prompt
+CONTEXT_MIN_FRAGMENT_TOKENS = 64  # a chunk cut by the budget is dropped rather than kept shorter than this
 ENABLE_SOURCE_CITING = True
 ENABLE_CONFIDENCE_SCORING = True
 ENABLE_DOMAIN_CLASSIFICATION = True
 
 # Error Handling
-RETRY_ATTEMPTS = 3
-RETRY_DELAY = 1  # seconds
-TIMEOUT_SECONDS = 30
+RETRY_ATTEMPTS = 3  # LLM calls per generation, each on another server where possible
+RETRY_DELAY = 1  # seconds before retrying on a server that already failed this generation
+TIMEOUT_SECONDS = 30  # longest wait for an Ollama server's first or next token
 
 # Development Configuration
 DEBUG_MODE = os.getenv("DEBUG", "False").lower() == "true"
-ENABLE_PROFILING = False
-ENABLE_METRICS = True 
\ No newline at end of file
+# Sampling profiler, also started and stopped at runtime through POST /profiling
+ENABLE_PROFILING = os.getenv("ENABLE_PROFILING", "false").lower() == "true"
+PROFILER_INTERVAL_MS = 10  # time between stack samples
+PROFILER_MAX_STACKS = 5000  # distinct stacks kept; samples of further stacks are counted as dropped
+# Prometheus metrics at GET /metrics
+ENABLE_METRICS = os.getenv("ENABLE_METRICS", "true").lower() == "true"
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
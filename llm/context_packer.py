@@ -0,0 +1,137 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from document_processor import DocumentChunk
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_MIN_FRAGMENT_TOKENS, DEFAULT_CHUNK_OVERLAP
+
+# Sections that only restate the document type add nothing to the prompt
+REDUNDANT_SECTIONS = ("document", "email")
+EMAIL_HEADERS = (("subject", "Subject"), ("sender", "From"), ("date", "Date"))
+
+def overlap_length(a: List[int], b: List[int], limit: int = DEFAULT_CHUNK_OVERLAP) -> int:
+    """Number of tokens in the longest suffix of a that is also a prefix of b, up to limit."""
+    for length in range(min(limit, len(a), len(b)), 0, -1):
+        if a[-length:] == b[:length]:
+            return length
+    return 0
+
+def _contains(ids: List[int], part: List[int]) -> bool:
+    first = part[0]
+    return any(ids[i:i + len(part)] == part
+               for i in range(len(ids) - len(part) + 1) if ids[i] == first)
+
+def merge_overlapping(chunks: List[DocumentChunk],
+                      encode: Callable[[DocumentChunk], List[int]]) -> List[Tuple[List[DocumentChunk], List[int]]]:
+    """Group chunks from the same source whose token ids overlap, joining them into one sequence.
+
+    Chunks are windows with overlap, so neighbours repeat each other's edges.
+    Groups keep the rank order of their best chunk; exact duplicates (the
+    same text indexed from another copy) are dropped.
+    """
+    groups: List[Tuple[List[DocumentChunk], List[int]]] = []
+    seen = set()
+    for chunk in chunks:
+        if chunk.content in seen:
+            continue
+        seen.add(chunk.content)
+        ids = encode(chunk)
+        if not ids:
+            continue
+
+        for i, (members, group_ids) in enumerate(groups):
+            if members[0].source != chunk.source:
+                continue
+            if _contains(group_ids, ids):
+                members.append(chunk)
+                break
+            after = overlap_length(group_ids, ids)
+            if after:
+                groups[i] = (members + [chunk], group_ids + ids[after:])
+                break
+            before = overlap_length(ids, group_ids)
+            if before:
+                groups[i] = ([chunk] + members, ids + group_ids[before:])
+                break
+        else:
+            groups.append(([chunk], ids))
+    return groups
+
+def _header(n: int, chunk: DocumentChunk) -> str:
+    parts = [f"[{n}] {chunk.source}"]
+    if chunk.page_number:
+        parts.append(f"page {chunk.page_number}")
+    if chunk.section and chunk.section not in REDUNDANT_SECTIONS:
+        parts.append(f"section {chunk.section}")
+    metadata = chunk.metadata or {}
+    parts.extend(f"{label}: {metadata[key]}" for key, label in EMAIL_HEADERS if metadata.get(key))
+    return " | ".join(parts)
+
+class ContextPacker:
+    """Assembles retrieved chunks into prompt context within a token budget.
+
+    Overlapping neighbours are merged, each group gets a one-line header
+    instead of full metadata, and groups are added in rank order until the
+    budget is reached; the last one is truncated if enough room remains.
+    Tokens are counted with the document processor's tiktoken encoder; each
+    chunk is encoded once and groups are joined as token ids.
+    """
+
+    def __init__(self, tokenizer, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 min_fragment_tokens: int = CONTEXT_MIN_FRAGMENT_TOKENS):
+        self.tokenizer = tokenizer
+        self.token_budget = token_budget
+        self.min_fragment_tokens = min_fragment_tokens
+        self.separator = "\n\n"
+        self.separator_tokens = len(tokenizer.encode(self.separator))
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text))
+
+    def encode_chunk(self, chunk: DocumentChunk) -> List[int]:
+        # Chunks start at a sentence, which follows whitespace in the chunk
+        # before; the space makes the first word encode as it does there
+        return self.tokenizer.encode(" " + chunk.content)
+
+    def pack(self, chunks: List[DocumentChunk], cache: Optional[Dict[Any, List[int]]] = None,
+             token_budget: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+        """Return the context string and packing stats (tokens used, groups merged and packed).
+
+        cache, keyed by source and chunk id, lets a batch encode each chunk
+        shared between queries only once.
+        """
+        def encode(chunk: DocumentChunk) -> List[int]:
+            if cache is None:
+                return self.encode_chunk(chunk)
+            key = (chunk.source, chunk.chunk_id)
+            ids = cache.get(key)
+            if ids is None:
+                ids = cache[key] = self.encode_chunk(chunk)
+            return ids
+
+        budget = self.token_budget if token_budget is None else token_budget
+        groups = merge_overlapping(chunks, encode)
+        parts = []
+        used = 0
+        truncated = False
+
+        for n, (members, ids) in enumerate(groups, start=1):
+            header = self.tokenizer.encode(f"{_header(n, members[0])}\n")
+            tokens = header + ids
+            cost = len(tokens) + (self.separator_tokens if parts else 0)
+            if used + cost <= budget:
+                parts.append(self.tokenizer.decode(tokens))
+                used += cost
+                continue
+
+            remaining = budget - used - (self.separator_tokens if parts else 0)
+            if remaining >= self.min_fragment_tokens:
+                parts.append(self.tokenizer.decode(tokens[:remaining]))
+                used = budget
+                truncated = True
+            break
+
+        return self.separator.join(parts), {
+            "context_tokens": used,
+            "chunks": len(chunks),
+            "groups": len(groups),
+            "groups_packed": len(parts),
+            "truncated": truncated
+        }
@@ -1,6 +1,10 @@
 import os
 import re
-from typing import List, Dict, Any, Optional
+import time
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from pathlib import Path
 import PyPDF2
 from docx import Document
@@ -10,6 +14,43 @@ from email.parser import BytesParser
 import tiktoken
 from dataclasses import dataclass
 from datetime import datetime
+from config import (
+    PARSE_WORKERS, PDF_PAGES_PER_TASK, PARSE_WORKER_NICE, MAX_DOCUMENT_SIZE,
+    DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP, DEFAULT_EMBEDDING_MODEL
+)
+
+# Runs of text without blank lines, i.e. paragraphs
+PARAGRAPH_PATTERN = re.compile(r'\S(?:[^\n]|\n(?![ \t]*\n))*')
+# Cut points between sentences and before list items; other line breaks are
+# usually PDF line wrapping inside a sentence
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=["\'(\[]?[A-Z0-9])|\s*\n(?=[ \t]*(?:[-*\u2022]|\d+[.)])\s)\s*')
+
+def load_embedding_tokenizer(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """The embedding model's own tokenizer, loaded without the model weights.
+
+    Bare names resolve to the sentence-transformers organisation on the
+    Hugging Face hub, as SentenceTransformer resolves them.
+    """
+    from transformers import AutoTokenizer
+    if "/" not in model_name and not os.path.isdir(model_name):
+        model_name = f"sentence-transformers/{model_name}"
+    return AutoTokenizer.from_pretrained(model_name)
+
+def sentence_spans(text: str) -> List[Tuple[int, int, bool]]:
+    """(start, end, starts_paragraph) character spans of the sentences in text."""
+    spans = []
+    for paragraph in PARAGRAPH_PATTERN.finditer(text):
+        start = paragraph.start()
+        end = start + len(paragraph.group().rstrip())
+        first = True
+        for boundary in SENTENCE_BOUNDARY.finditer(text, start, end):
+            if boundary.start() > start:
+                spans.append((start, boundary.start(), first))
+                first = False
+            start = boundary.end()
+        if start < end:
+            spans.append((start, end, first))
+    return spans
 
 @dataclass
 class DocumentChunk:
@@ -21,29 +62,41 @@ class DocumentChunk:
     section: Optional[str] = None
     timestamp: Optional[datetime] = None
     metadata: Optional[Dict[str, Any]] = None
+    document_id: Optional[str] = None
+    # Character offsets of content within the page or document text it came from
+    start_char: Optional[int] = None
+    end_char: Optional[int] = None
 
 class DocumentProcessor:
     """Handles processing of PDF, DOCX, and email documents."""
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+                 workers: int = PARSE_WORKERS, embedding_model: str = DEFAULT_EMBEDDING_MODEL):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.workers = workers
+        self.embedding_model = embedding_model
+        self._tokenizer = None
+        self._embedding_tokenizer = None
+        self.last_run_stats: Dict[str, Any] = {}
     
-    def process_pdf(self, file_path: str) -> List[DocumentChunk]:
-        """Extract text from PDF file and chunk it."""
+    def process_pdf(self, file_path: str, page_range: Optional[Tuple[int, int]] = None) -> List[DocumentChunk]:
+        """Extract text from PDF file (or a [start, end) range of its pages) and chunk it."""
         chunks = []
         try:
             with open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
                 
-                for page_num, page in enumerate(pdf_reader.pages):
+                start, end = page_range or (0, len(pdf_reader.pages))
+                for page_num in range(start, end):
+                    page = pdf_reader.pages[page_num]
                     text = page.extract_text()
                     if text.strip():
                         page_chunks = self._chunk_text(
                             text, 
                             f"{Path(file_path).stem}_page_{page_num + 1}",
-                            page_num + 1
+                            page_num + 1,
+                            metadata={'type': 'pdf'}
                         )
                         chunks.extend(page_chunks)
                         
@@ -68,7 +121,8 @@ class DocumentProcessor:
                 chunks = self._chunk_text(
                     text, 
                     f"{Path(file_path).stem}",
-                    section="document"
+                    section="document",
+                    metadata={'type': 'docx'}
                 )
                 
         except Exception as e:
@@ -119,51 +173,237 @@ class DocumentProcessor:
             
         return chunks
     
+    @property
+    def tokenizer(self):
+        """cl100k encoder for counting prompt tokens (see ContextPacker); chunks use the embedding tokenizer."""
+        if self._tokenizer is None:
+            self._tokenizer = tiktoken.get_encoding("cl100k_base")
+        return self._tokenizer
+
+    @property
+    def embedding_tokenizer(self):
+        """Tokenizer of the embedding model, loaded on first use (once per parse worker)."""
+        if self._embedding_tokenizer is None:
+            self._embedding_tokenizer = load_embedding_tokenizer(self.embedding_model)
+        return self._embedding_tokenizer
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Embedding model tokens in each text, without the special tokens the model adds."""
+        if not texts:
+            return []
+        return [len(ids) for ids in self.embedding_tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]]
+
     def _chunk_text(self, text: str, source: str, page_number: Optional[int] = None, 
                     section: Optional[str] = None, metadata: Optional[Dict] = None) -> List[DocumentChunk]:
-        """Split text into overlapping chunks."""
+        """Split text into chunks of whole sentences of at most chunk_size embedding model tokens.
+        
+        Chunks end at a paragraph break once half full; otherwise the next
+        chunk repeats trailing sentences of up to chunk_overlap tokens.
+        Content is sliced from the text by character offsets, which are
+        recorded on each chunk.
+        """
         chunks = []
+        current = []
+        current_tokens = 0
         
-        # Tokenize text
-        tokens = self.tokenizer.encode(text)
+        def emit():
+            start, end = current[0][0], current[-1][1]
+            chunks.append(DocumentChunk(
+                content=text[start:end],
+                source=source,
+                chunk_id=f"{source}_chunk_{len(chunks)}",
+                page_number=page_number,
+                section=section,
+                timestamp=datetime.now(),
+                metadata=metadata or {},
+                start_char=start,
+                end_char=end
+            ))
         
-        # Create chunks with overlap
-        for i in range(0, len(tokens), self.chunk_size - self.chunk_overlap):
-            chunk_tokens = tokens[i:i + self.chunk_size]
-            chunk_text = self.tokenizer.decode(chunk_tokens)
+        for piece in self._pieces(text):
+            tokens, starts_paragraph = piece[2], piece[3]
+            paragraph_break = starts_paragraph and current_tokens >= self.chunk_size // 2
+            if current and (paragraph_break or current_tokens + tokens > self.chunk_size):
+                emit()
+                
+                # Carry trailing sentences over as overlap, unless a new paragraph starts
+                carry, carry_tokens = [], 0
+                for previous in ([] if paragraph_break else reversed(current)):
+                    if carry_tokens + previous[2] > self.chunk_overlap:
+                        break
+                    carry.insert(0, previous)
+                    carry_tokens += previous[2]
+                if carry_tokens + tokens > self.chunk_size:
+                    carry, carry_tokens = [], 0
+                current, current_tokens = carry, carry_tokens
             
-            if chunk_text.strip():
-                chunk = DocumentChunk(
-                    content=chunk_text,
-                    source=source,
-                    chunk_id=f"{source}_chunk_{i//self.chunk_size}",
-                    page_number=page_number,
-                    section=section,
-                    timestamp=datetime.now(),
-                    metadata=metadata or {}
-                )
-                chunks.append(chunk)
+            current.append(piece)
+            current_tokens += tokens
         
+        if current:
+            emit()
         return chunks
     
-    def process_directory(self, directory_path: str) -> List[DocumentChunk]:
-        """Process all supported documents in a directory."""
-        all_chunks = []
+    def _pieces(self, text: str) -> List[Tuple[int, int, int, bool]]:
+        """(start, end, tokens, starts_paragraph) for each sentence, with over-long ones cut up."""
+        spans = sentence_spans(text)
+        if not spans:
+            return []
+        counts = self.count_tokens([text[s:e] for s, e, _ in spans])
+        
+        pieces = []
+        for (start, end, starts_paragraph), tokens in zip(spans, counts):
+            if tokens <= self.chunk_size:
+                pieces.append((start, end, tokens, starts_paragraph))
+                continue
+            
+            # Tables and unpunctuated text: cut at whitespace near the token limit
+            step = max(1, int((end - start) * self.chunk_size * 0.9 / tokens))
+            while start < end:
+                cut = min(end, start + step)
+                if cut < end:
+                    space = text.rfind(' ', start + step // 2, cut)
+                    if space > start:
+                        cut = space
+                pieces.append((start, cut, self.count_tokens([text[start:cut]])[0], starts_paragraph))
+                starts_paragraph = False
+                start = cut
+                while start < end and text[start].isspace():
+                    start += 1
+        return pieces
+    
+    def list_documents(self, directory_path: str) -> List[Path]:
+        """List supported documents in a directory in processing order."""
         directory = Path(directory_path)
+        files = []
+        for pattern in ("*.pdf", "*.docx", "*.eml"):
+            files.extend(directory.glob(pattern))
+        return files
+    
+    def process_file(self, file_path: str) -> List[DocumentChunk]:
+        """Process a single document, dispatching on its extension."""
+        suffix = Path(file_path).suffix.lower()
+        if suffix == ".pdf":
+            return self.process_pdf(str(file_path))
+        if suffix == ".docx":
+            return self.process_docx(str(file_path))
+        if suffix == ".eml":
+            return self.process_email(str(file_path))
+        return []
+    
+    def _plan_tasks(self, file_paths: List[Path]) -> Tuple[List[Tuple[str, Optional[Tuple[int, int]]]], List[int], int]:
+        """Split files into parse tasks: one per file, or per page range for large PDFs.
         
-        # Process PDFs
-        for pdf_file in directory.glob("*.pdf"):
-            chunks = self.process_pdf(str(pdf_file))
-            all_chunks.extend(chunks)
+        Returns the tasks, the index of the file each task belongs to, and the
+        total page count (DOCX and email files count as one page). Files over
+        MAX_DOCUMENT_SIZE get no tasks.
+        """
+        tasks = []
+        owners = []
+        total_pages = 0
         
-        # Process DOCX files
-        for docx_file in directory.glob("*.docx"):
-            chunks = self.process_docx(str(docx_file))
-            all_chunks.extend(chunks)
+        for owner, file_path in enumerate(file_paths):
+            file_path = str(file_path)
+            size = os.path.getsize(file_path)
+            if size > MAX_DOCUMENT_SIZE:
+                print(f"Skipping {file_path}: {size} bytes exceeds MAX_DOCUMENT_SIZE ({MAX_DOCUMENT_SIZE})")
+                continue
+            
+            if Path(file_path).suffix.lower() != ".pdf":
+                tasks.append((file_path, None))
+                owners.append(owner)
+                total_pages += 1
+                continue
+            
+            try:
+                with open(file_path, 'rb') as file:
+                    page_count = len(PyPDF2.PdfReader(file).pages)
+            except Exception as e:
+                print(f"Error reading PDF {file_path}: {e}")
+                continue
+            
+            total_pages += page_count
+            if page_count <= PDF_PAGES_PER_TASK:
+                tasks.append((file_path, None))
+                owners.append(owner)
+                continue
+            
+            for start in range(0, page_count, PDF_PAGES_PER_TASK):
+                tasks.append((file_path, (start, min(start + PDF_PAGES_PER_TASK, page_count))))
+                owners.append(owner)
+        
+        return tasks, owners, total_pages
+    
+    def _run_task(self, task: Tuple[str, Optional[Tuple[int, int]]]) -> List[DocumentChunk]:
+        file_path, page_range = task
+        if page_range is not None:
+            return self.process_pdf(file_path, page_range)
+        return self.process_file(file_path)
+    
+    def iter_chunks(self, file_paths: List[Path], workers: Optional[int] = None) -> Iterator[Tuple[int, List[DocumentChunk]]]:
+        """Parse files lazily, yielding (file index, chunks) per parse task in input order.
+        
+        At most two tasks per worker are in flight, so memory is bounded by the
+        task size (PDF_PAGES_PER_TASK pages, or one file of at most
+        MAX_DOCUMENT_SIZE bytes) rather than by the whole batch of files.
+        last_run_stats carries the page count as soon as iteration starts.
+        """
+        workers = self.workers if workers is None else workers
+        start_time = time.perf_counter()
+        tasks, owners, total_pages = self._plan_tasks(file_paths)
+        workers = min(workers, len(tasks)) if workers > 1 and len(tasks) > 1 else 1
+        self.last_run_stats = {"files": len(file_paths), "pages": total_pages, "chunks": 0, "workers": workers}
+        
+        if workers > 1:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(self.chunk_size, self.chunk_overlap, self.embedding_model)
+            ) as executor:
+                queued = iter(zip(owners, tasks))
+                in_flight = deque(
+                    (owner, executor.submit(_run_worker_task, task)) for owner, task in islice(queued, 2 * workers)
+                )
+                while in_flight:
+                    owner, future = in_flight.popleft()
+                    chunks = future.result()
+                    next_task = next(queued, None)
+                    if next_task is not None:
+                        in_flight.append((next_task[0], executor.submit(_run_worker_task, next_task[1])))
+                    self.last_run_stats["chunks"] += len(chunks)
+                    yield owner, chunks
+        else:
+            for owner, task in zip(owners, tasks):
+                chunks = self._run_task(task)
+                self.last_run_stats["chunks"] += len(chunks)
+                yield owner, chunks
         
-        # Process email files
-        for email_file in directory.glob("*.eml"):
-            chunks = self.process_email(str(email_file))
+        elapsed = time.perf_counter() - start_time
+        self.last_run_stats.update(
+            seconds=round(elapsed, 3),
+            pages_per_sec=round(total_pages / elapsed, 1) if elapsed > 0 else 0.0
+        )
+        if file_paths:
+            print(f"Parsed {len(file_paths)} files ({total_pages} pages) in {elapsed:.2f}s: "
+                  f"{self.last_run_stats['pages_per_sec']} pages/sec with {workers} workers")
+    
+    def process_files(self, file_paths: List[Path], workers: Optional[int] = None) -> List[List[DocumentChunk]]:
+        """Process files, in parallel when workers > 1, returning chunks per file in input order.
+        
+        Chunk ids depend only on the file, page and position within the page,
+        so the output is identical to processing the files serially.
+        """
+        per_file = [[] for _ in file_paths]
+        for owner, chunks in self.iter_chunks(file_paths, workers):
+            per_file[owner].extend(chunks)
+        return per_file
+    
+    def process_directory(self, directory_path: str, workers: Optional[int] = None) -> List[DocumentChunk]:
+        """Process all supported documents in a directory."""
+        all_chunks = []
+        
+        # PDFs first, then DOCX, then email files
+        for chunks in self.process_files(self.list_documents(directory_path), workers=workers):
             all_chunks.extend(chunks)
         
         return all_chunks
@@ -174,4 +414,17 @@ class DocumentProcessor:
         text = re.sub(r'\s+', ' ', text)
         # Remove special characters but keep punctuation
         text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)]', '', text)
-        return text.strip() 
\ No newline at end of file
+        return text.strip() 
+
+# Per-process state for parallel parsing; each worker builds its own tokenizer once
+_worker_processor: Optional[DocumentProcessor] = None
+
+def _init_worker(chunk_size: int, chunk_overlap: int, embedding_model: str):
+    global _worker_processor
+    if PARSE_WORKER_NICE and hasattr(os, "nice"):
+        # Parsing is background work; leave the CPU to query serving first
+        os.nice(PARSE_WORKER_NICE)
+    _worker_processor = DocumentProcessor(chunk_size, chunk_overlap, workers=1, embedding_model=embedding_model)
+
+def _run_worker_task(task: Tuple[str, Optional[Tuple[int, int]]]) -> List[DocumentChunk]:
+    return _worker_processor._run_task(task)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List
+import numpy as np
+
+KEY_SIZE = 16
+
+class EmbeddingCache:
+    """On-disk cache of text embeddings keyed by (model name, content hash).
+
+    Each model gets its own directory holding an append-only float32 matrix
+    (vectors.f32) that is read through a memory map, and a parallel file of
+    fixed-size content hashes (keys.bin) giving the row of each vector.
+    Vectors are always written before their keys, so a crash can only leave
+    unreferenced rows that are truncated on the next open.
+    """
+
+    def __init__(self, directory: str, model_name: str, dimension: int):
+        safe_name = re.sub(r'[^\w\-.]', '_', model_name)
+        self.directory = Path(directory) / safe_name
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.dimension = dimension
+        self.vectors_path = self.directory / "vectors.f32"
+        self.keys_path = self.directory / "keys.bin"
+        self.rows: Dict[bytes, int] = {}
+        self._vectors = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+        self._open()
+
+    def _open(self):
+        meta_path = self.directory / "meta.json"
+        meta = {"model_name": self.model_name, "dimension": self.dimension}
+        if meta_path.exists():
+            with open(meta_path, 'r') as f:
+                stored = json.load(f)
+            if stored != meta:
+                # A different model or dimension invalidates every stored vector
+                print(f"Embedding cache at {self.directory} does not match {meta}; resetting")
+                self.vectors_path.unlink(missing_ok=True)
+                self.keys_path.unlink(missing_ok=True)
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+
+        keys = self.keys_path.read_bytes() if self.keys_path.exists() else b''
+        row_bytes = self.dimension * 4
+        vector_rows = self.vectors_path.stat().st_size // row_bytes if self.vectors_path.exists() else 0
+        count = min(len(keys) // KEY_SIZE, vector_rows)
+
+        # Drop any partially written tail
+        if len(keys) != count * KEY_SIZE:
+            with open(self.keys_path, 'r+b') as f:
+                f.truncate(count * KEY_SIZE)
+        if self.vectors_path.exists() and self.vectors_path.stat().st_size != count * row_bytes:
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(count * row_bytes)
+
+        self.rows = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(count)}
+        self._remap()
+
+    def _remap(self):
+        if self.rows:
+            self._vectors = np.memmap(self.vectors_path, dtype='float32', mode='r',
+                                      shape=(len(self.rows), self.dimension))
+        else:
+            self._vectors = None
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        """Content hash used as the cache key for a text."""
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=KEY_SIZE).digest()
+
+    def encode(self, texts: List[str], encoder: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Return embeddings for texts, calling encoder only for texts not yet cached.
+
+        Duplicate texts within the batch are encoded once.
+        """
+        keys = [self.key(text) for text in texts]
+        result = np.empty((len(texts), self.dimension), dtype='float32')
+
+        with self._lock:
+            missing: Dict[bytes, List[int]] = {}
+            for i, key in enumerate(keys):
+                row = self.rows.get(key)
+                if row is not None:
+                    result[i] = self._vectors[row]
+                else:
+                    missing.setdefault(key, []).append(i)
+            self.stats["hits"] += len(texts) - sum(len(p) for p in missing.values())
+            self.stats["misses"] += len(missing)
+
+        if not missing:
+            return result
+
+        new_keys = list(missing)
+        new_vectors = np.asarray(encoder([texts[missing[k][0]] for k in new_keys]), dtype='float32')
+        for key, vector in zip(new_keys, new_vectors):
+            result[missing[key]] = vector
+
+        with self._lock:
+            # Another thread may have added some of these meanwhile
+            fresh = [(k, v) for k, v in zip(new_keys, new_vectors) if k not in self.rows]
+            if fresh:
+                with open(self.vectors_path, 'ab') as f:
+                    f.write(np.stack([v for _, v in fresh]).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self.keys_path, 'ab') as f:
+                    f.write(b''.join(k for k, _ in fresh))
+                for key, _ in fresh:
+                    self.rows[key] = len(self.rows)
+                self._remap()
+
+        return result
+
+    def get_statistics(self) -> Dict[str, int]:
+        """Get statistics about the embedding cache."""
+        return {**self.stats, "entries": len(self.rows)}
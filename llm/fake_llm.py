@@ -0,0 +1,48 @@
+import hashlib
+import re
+import time
+from typing import Any, Iterator, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+class FakeLLM(LLM):
+    """Deterministic offline stand-in for OllamaLLM, for benchmarks and development.
+
+    The answer is built from words of the prompt's context, chosen by a hash
+    of the prompt, so the same prompt always gets the same answer. Latency
+    is simulated as a fixed time to first token plus a generation rate.
+    """
+
+    model: str = "fake-llm"
+    first_token_ms: float = 0.0
+    tokens_per_second: float = 0.0  # 0 generates instantly
+    answer_words: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _answer_words(self, prompt: str) -> List[str]:
+        seed = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8], 16)
+        context = prompt.split("## User Query:")[0]
+        words = re.findall(r"[A-Za-z][A-Za-z0-9'-]*", context) or ["No", "relevant", "information", "found"]
+        start = seed % len(words)
+        picked = [words[(start + i) % len(words)] for i in range(self.answer_words)]
+        return ["Based", "on", "the", "provided", "documents,"] + picked
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        if self.first_token_ms:
+            time.sleep(self.first_token_ms / 1000)
+        for i, word in enumerate(self._answer_words(prompt)):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            chunk = GenerationChunk(text=word if i == 0 else f" {word}")
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Fake Ollama HTTP server, and a check of the LLM pool against several of them.
+
+The server answers /api/generate (streamed NDJSON or a single JSON reply),
+/api/tags and /api/version like Ollama does, generating deterministic text
+with FakeLLM. Latency and failures can be injected per server, so the
+pool's balancing, timeouts, retries and circuit breaker can be exercised
+without a model (see also tests/test_llm_pool.py).
+
+The check starts a healthy, a slow, a failing and a hanging server on
+loopback ports, sends concurrent generations through ollama_pool() and
+verifies that every generation succeeds, that the failing, hanging and
+slow servers are ejected and that the healthy one serves the most.
+
+Examples:
+  python fake_ollama.py serve --port 11435 --first-token-ms 200 --tokens-per-second 50
+  python fake_ollama.py serve --port 11436 --error-rate 0.2
+  OLLAMA_BASE_URLS=http://127.0.0.1:11435,http://127.0.0.1:11436 python api_server.py
+  python fake_ollama.py check --requests 60 --concurrency 8 --json llm_pool.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from fake_llm import FakeLLM
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Ollama look-alike; the latency and failure settings can be changed while it runs."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], model: str = "fake-llm", first_token_ms: float = 0.0,
+                 tokens_per_second: float = 0.0, error_rate: float = 0.0, answer_words: int = 20,
+                 error_after_tokens: Optional[int] = None):
+        super().__init__(address, FakeOllamaHandler)
+        self.model = model
+        self.first_token_ms = first_token_ms
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.answer_words = answer_words
+        # Streams fail with an error line after this many tokens, as Ollama reports mid-stream errors
+        self.error_after_tokens = error_after_tokens
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    server: FakeOllamaServer
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": self.server.model, "model": self.server.model}]})
+        elif self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-fake"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        server.requests += 1
+        if random.random() < server.error_rate:
+            self._send_json(500, {"error": "injected failure"})
+            return
+
+        llm = FakeLLM(model=server.model, first_token_ms=server.first_token_ms,
+                      tokens_per_second=server.tokens_per_second, answer_words=server.answer_words)
+        started = time.perf_counter()
+
+        def message(text: str, done: bool) -> Dict[str, Any]:
+            reply = {"model": request.get("model", server.model),
+                     "created_at": datetime.now(timezone.utc).isoformat(), "response": text, "done": done}
+            if done:
+                reply.update(done_reason="stop", total_duration=int((time.perf_counter() - started) * 1e9))
+            return reply
+
+        if request.get("stream", True) is False:
+            self._send_json(200, message(llm.invoke(request.get("prompt", "")), True))
+            return
+
+        # HTTP/1.0 without a Content-Length: the reply ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for i, token in enumerate(llm.stream(request.get("prompt", ""))):
+                if i == server.error_after_tokens:
+                    self.wfile.write(json.dumps({"error": "injected failure"}).encode('utf-8') + b"\n")
+                    return
+                self.wfile.write(json.dumps(message(token, False)).encode('utf-8') + b"\n")
+                self.wfile.flush()
+            self.wfile.write(json.dumps(message("", True)).encode('utf-8') + b"\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up, e.g. on its timeout
+
+def start_fake_ollama(port: int = 0, **settings: Any) -> FakeOllamaServer:
+    """Serve a FakeOllamaServer on a loopback port (0 picks a free one) from a daemon thread."""
+    server = FakeOllamaServer(("127.0.0.1", port), **settings)
+    threading.Thread(target=server.serve_forever, name=f"fake-ollama-{server.server_address[1]}",
+                     daemon=True).start()
+    return server
+
+def check(args) -> Dict[str, Any]:
+    from llm_pool import ollama_pool
+
+    servers = {
+        "healthy": start_fake_ollama(first_token_ms=args.first_token_ms),
+        "slow": start_fake_ollama(first_token_ms=args.first_token_ms * 10),
+        "failing": start_fake_ollama(error_rate=1.0),
+        "hanging": start_fake_ollama(first_token_ms=args.timeout * 1000 * 3)
+    }
+    names = {server.url: name for name, server in servers.items()}
+    # A short cooldown would let ejected servers back in during the run
+    llm = ollama_pool("fake-llm", [server.url for server in servers.values()], timeout=args.timeout,
+                      retry_delay=0.1, cooldown=3600.0, slow_min_seconds=args.first_token_ms * 3 / 1000)
+
+    def generate(i: int) -> Tuple[bool, float]:
+        start = time.perf_counter()
+        try:
+            llm.invoke(f"## Context: policy clause {i} covers water damage.\n## User Query: question {i}")
+            return True, (time.perf_counter() - start) * 1000
+        except Exception as e:
+            print(f"Generation {i} failed: {e}")
+            return False, (time.perf_counter() - start) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(generate, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    stats = llm.pool.get_statistics()
+    nodes = {names[url]: {**node, "server_requests": servers[names[url]].requests}
+             for url, node in stats["nodes"].items()}
+    for server in servers.values():
+        server.shutdown()
+
+    latencies = sorted(latency for _, latency in outcomes)
+    served = {name: node["requests"] - node["failures"] for name, node in nodes.items()}
+    results = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "timeout_s": args.timeout,
+        "seconds": round(elapsed, 3),
+        "succeeded": sum(1 for ok, _ in outcomes if ok),
+        "retries": stats["retries"],
+        "p50_ms": round(latencies[len(latencies) // 2], 1),
+        "max_ms": round(latencies[-1], 1),
+        "nodes": nodes
+    }
+    results["ok"] = (results["succeeded"] == args.requests
+                     and all(nodes[name]["state"] == "open" for name in ("failing", "hanging", "slow"))
+                     and max(served, key=served.get) == "healthy")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server and LLM pool check")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Serve a fake Ollama API")
+    serve.add_argument("--port", type=int, default=11435, help="Port on 127.0.0.1 (default: 11435)")
+    serve.add_argument("--model", type=str, default="fake-llm", help="Model name to report (default: fake-llm)")
+    serve.add_argument("--first-token-ms", type=float, default=0.0, help="Time to first token")
+    serve.add_argument("--tokens-per-second", type=float, default=0.0, help="Generation rate (0: instant)")
+    serve.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    run = commands.add_parser("check", help="Check the LLM pool against healthy, slow and broken fake servers")
+    run.add_argument("--requests", type=int, default=60, help="Generations to send (default: 60)")
+    run.add_argument("--concurrency", type=int, default=8, help="Generations in flight (default: 8)")
+    run.add_argument("--first-token-ms", type=float, default=20.0, help="Healthy server time to first token")
+    run.add_argument("--timeout", type=float, default=1.0, help="Per-call timeout in seconds (default: 1.0)")
+    run.add_argument("--json", type=str, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = FakeOllamaServer(("127.0.0.1", args.port), model=args.model, first_token_ms=args.first_token_ms,
+                                  tokens_per_second=args.tokens_per_second, error_rate=args.error_rate)
+        print(f"Fake Ollama serving {args.model} on {server.url}")
+        server.serve_forever()
+        return
+
+    results = check(args)
+    print(json.dumps(results, indent=2))
+    print(f"Result: {'OK' if results['ok'] else 'FAILED'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    sys.exit(0 if results["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
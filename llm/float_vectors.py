@@ -0,0 +1,148 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+import numpy as np
+
+class FloatVectors:
+    """Full-precision embeddings kept beside a quantized index, for re-scoring and rebuilds.
+
+    Vectors from a loaded snapshot stay in a memory-mapped file, so only the
+    rows that are read occupy RAM; vectors added since load are appended to
+    one growable float32 matrix (4 bytes per dimension, like the snapshot)
+    until the next save. Both parts are sorted by id. Removed ids are masked
+    until compacted() or the next save.
+    """
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.removed: set = set()
+        self._removed_array: Optional[np.ndarray] = None
+        self._base_ids = np.zeros(0, dtype='int64')
+        self._base_vectors = np.zeros((0, dimension), dtype='float32')
+        # Rows [0, _size) of _ids and _vectors hold vectors added since load
+        self._ids = np.zeros(0, dtype='int64')
+        self._vectors = np.zeros((0, dimension), dtype='float32')
+        self._size = 0
+
+    def add(self, ids: Iterable[int], vectors: np.ndarray):
+        ids = np.asarray(ids if isinstance(ids, np.ndarray) else list(ids), dtype='int64')
+        vectors = np.asarray(vectors, dtype='float32')
+        end = self._size + len(ids)
+        if end > len(self._ids):
+            capacity = max(2 * len(self._ids), end, 1024)
+            grown_ids = np.zeros(capacity, dtype='int64')
+            grown_vectors = np.zeros((capacity, self.dimension), dtype='float32')
+            grown_ids[:self._size] = self._ids[:self._size]
+            grown_vectors[:self._size] = self._vectors[:self._size]
+            self._ids, self._vectors = grown_ids, grown_vectors
+        self._ids[self._size:end] = ids
+        self._vectors[self._size:end] = vectors
+        ascending = (self._size == 0 or len(ids) == 0 or ids[0] > self._ids[self._size - 1]) \
+            and bool(np.all(np.diff(ids) > 0))
+        self._size = end
+        if not ascending:
+            # Chunk ids are handed out in order, so this only happens when rebuilding from unsorted input
+            order = np.argsort(self._ids[:end], kind='stable')
+            self._ids[:end] = self._ids[:end][order]
+            self._vectors[:end] = self._vectors[:end][order]
+
+    def remove(self, ids: Iterable[int]):
+        ids = np.asarray(list(ids), dtype='int64')
+        found, _ = self._locate(ids)
+        self.removed.update(ids[found].tolist())
+        self._removed_array = None
+
+    def _locate(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Per id: whether it is stored and live, and its row (in the base when below len(base), else appended)."""
+        found = np.zeros(len(ids), dtype=bool)
+        rows = np.zeros(len(ids), dtype='int64')
+        for part, offset, size in ((self._base_ids, 0, len(self._base_ids)),
+                                   (self._ids, len(self._base_ids), self._size)):
+            if size == 0:
+                continue
+            part_rows = np.minimum(np.searchsorted(part[:size], ids), size - 1)
+            hit = ~found & (np.asarray(part[part_rows]) == ids)
+            found |= hit
+            rows[hit] = part_rows[hit] + offset
+        if self.removed:
+            if self._removed_array is None:
+                self._removed_array = np.fromiter(self.removed, dtype='int64', count=len(self.removed))
+            found &= ~np.isin(ids, self._removed_array)
+        return found, rows
+
+    def get(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectors for the given ids as (found mask, vectors of the found ids)."""
+        ids = np.asarray(ids, dtype='int64')
+        found, rows = self._locate(ids)
+        rows = rows[found]
+        in_base = rows < len(self._base_ids)
+        vectors = np.zeros((len(rows), self.dimension), dtype='float32')
+        vectors[in_base] = self._base_vectors[rows[in_base]]
+        vectors[~in_base] = self._vectors[rows[~in_base] - len(self._base_ids)]
+        return found, vectors
+
+    def export(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Every live (id, vector), sorted by id."""
+        removed = np.fromiter(self.removed, dtype='int64', count=len(self.removed))
+        base_keep = ~np.isin(self._base_ids, removed)
+        keep = ~np.isin(self._ids[:self._size], removed)
+        ids = np.concatenate([self._base_ids[base_keep], self._ids[:self._size][keep]])
+        vectors = np.vstack([np.asarray(self._base_vectors)[base_keep], self._vectors[:self._size][keep]])
+        order = np.argsort(ids, kind='stable')
+        return ids[order], vectors[order]
+
+    def compacted(self) -> "FloatVectors":
+        """A copy sharing the mapped base, with removed appended vectors dropped and the matrix trimmed."""
+        removed = np.fromiter(self.removed, dtype='int64', count=len(self.removed))
+        keep = ~np.isin(self._ids[:self._size], removed)
+        store = FloatVectors(self.dimension)
+        store._base_ids, store._base_vectors = self._base_ids, self._base_vectors
+        store.removed = set(np.asarray(self._base_ids)[np.isin(self._base_ids, removed)].tolist())
+        store._ids = self._ids[:self._size][keep]
+        store._vectors = self._vectors[:self._size][keep]
+        store._size = len(store._ids)
+        return store
+
+    def __len__(self) -> int:
+        return len(self._base_ids) + self._size - len(self.removed)
+
+    def write(self, directory: Path):
+        ids, vectors = self.export()
+        np.save(directory / "vectors.ids.npy", ids)
+        np.save(directory / "vectors.npy", vectors)
+
+    @classmethod
+    def read(cls, directory: Path, dimension: int) -> Optional["FloatVectors"]:
+        """Open the float vectors of a snapshot, or return None if it has none."""
+        directory = Path(directory)
+        if not (directory / "vectors.npy").exists():
+            return None
+        store = cls(dimension)
+        store._base_ids = np.load(directory / "vectors.ids.npy", mmap_mode='r')
+        store._base_vectors = np.load(directory / "vectors.npy", mmap_mode='r')
+        return store
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            "vectors": len(self),
+            "in_memory_bytes": self._vectors.nbytes + self._ids.nbytes
+        }
+
+def rescore(query_embeddings: np.ndarray, labels: np.ndarray, vectors: FloatVectors,
+            k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Re-rank candidate labels by exact inner product, returning the top k shaped like index.search.
+
+    Candidates without a stored float vector are dropped.
+    """
+    scores = np.full((len(query_embeddings), k), -np.inf, dtype='float32')
+    top_labels = np.full((len(query_embeddings), k), -1, dtype='int64')
+    for i, (query, row) in enumerate(zip(query_embeddings, labels)):
+        candidates = row[row >= 0]
+        found, candidate_vectors = vectors.get(candidates)
+        candidates = candidates[found]
+        if len(candidates) == 0:
+            continue
+        similarities = candidate_vectors @ query
+        order = np.argsort(-similarities, kind='stable')[:k]
+        scores[i, :len(order)] = similarities[order]
+        top_labels[i, :len(order)] = candidates[order]
+    return scores, top_labels
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Recall, latency and memory report for the FAISS index types supported by VectorStore.
+
+Each ANN and quantized configuration is compared against an exact flat-index
+baseline on the same vectors; quantized indexes are also measured with float
+re-scoring of their top candidates. Vectors come from a saved vector store (--store) or are generated
+synthetically so the report runs without the embedding model.
+
+Examples:
+  python index_report.py --size 200000
+  python index_report.py --store system_backup --json report.json
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import List, Dict, Any, Optional
+import faiss
+import numpy as np
+from config import DEFAULT_EMBEDDING_DIMENSION
+from float_vectors import FloatVectors, rescore
+from vector_store import create_index, export_vectors
+from config import RESCORE_FACTOR
+
+def synthetic_vectors(n: int, dimension: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Generate clustered, L2-normalised vectors that resemble sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dimension)).astype('float32')
+    assignment = rng.integers(0, clusters, n)
+    vectors = centroids[assignment] + 0.5 * rng.standard_normal((n, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def recall_at_k(ground_truth: np.ndarray, found: np.ndarray) -> float:
+    """Fraction of the exact top-k neighbours that the approximate search returned."""
+    k = ground_truth.shape[1]
+    hits = sum(len(set(gt) & set(f)) for gt, f in zip(ground_truth, found))
+    return hits / (len(ground_truth) * k)
+
+def _timed_search(index: faiss.Index, queries: np.ndarray, k: int, params=None,
+                  float_vectors: Optional[FloatVectors] = None):
+    """Search one query at a time, as the API does, and return (indices, latencies_ms).
+
+    With float_vectors, RESCORE_FACTOR * k candidates are fetched and re-scored.
+    """
+    latencies = []
+    fetch = k * RESCORE_FACTOR if float_vectors is not None else k
+    found = np.empty((len(queries), k), dtype='int64')
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        if params is not None:
+            _, idx = index.search(query[None, :], fetch, params=params)
+        else:
+            _, idx = index.search(query[None, :], fetch)
+        if float_vectors is not None:
+            _, idx = rescore(query[None, :], idx, float_vectors, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[i] = idx[0]
+    return found, np.array(latencies)
+
+def index_bytes(index: faiss.Index) -> int:
+    """Serialized size of an index, close to its resident size."""
+    return len(faiss.serialize_index(index))
+
+def _row(name: str, param: str, found: np.ndarray, latencies: np.ndarray,
+         ground_truth: np.ndarray, build_seconds: float, bytes_per_vector: float) -> Dict[str, Any]:
+    return {
+        "index": name,
+        "param": param,
+        "recall": round(recall_at_k(ground_truth, found), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "build_s": round(build_seconds, 2),
+        "bytes_per_vector": round(bytes_per_vector, 1)
+    }
+
+def recall_latency_report(vectors: np.ndarray, queries: np.ndarray, k: int = 5,
+                          nprobes: Optional[List[int]] = None,
+                          ef_searches: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """Measure recall@k and per-query latency of each index type against exact search."""
+    nprobes = nprobes or [1, 4, 16, 64]
+    ef_searches = ef_searches or [16, 32, 64, 128]
+    dimension = vectors.shape[1]
+    rows = []
+
+    start = time.perf_counter()
+    ids = np.arange(len(vectors), dtype='int64')
+    flat = create_index("flat", dimension, vectors)
+    flat.add_with_ids(vectors, ids)
+    build = time.perf_counter() - start
+    flat_bytes = index_bytes(flat) / len(vectors)
+    ground_truth, latencies = _timed_search(flat, queries, k)
+    rows.append(_row("flat", "-", ground_truth, latencies, ground_truth, build, flat_bytes))
+
+    start = time.perf_counter()
+    ivf = create_index("ivf", dimension, vectors)
+    ivf.add_with_ids(vectors, ids)
+    nlist = faiss.extract_index_ivf(ivf).nlist
+    build = time.perf_counter() - start
+    ivf_bytes = index_bytes(ivf) / len(vectors)
+    for nprobe in nprobes:
+        found, latencies = _timed_search(ivf, queries, k, faiss.SearchParametersIVF(nprobe=nprobe))
+        rows.append(_row(f"ivf{nlist}", f"nprobe={nprobe}", found, latencies, ground_truth, build, ivf_bytes))
+
+    start = time.perf_counter()
+    hnsw = create_index("hnsw", dimension, vectors)
+    hnsw.add_with_ids(vectors, ids)
+    build = time.perf_counter() - start
+    hnsw_bytes = index_bytes(hnsw) / len(vectors)
+    for ef_search in ef_searches:
+        found, latencies = _timed_search(hnsw, queries, k, faiss.SearchParametersHNSW(efSearch=ef_search))
+        rows.append(_row("hnsw", f"efSearch={ef_search}", found, latencies, ground_truth, build, hnsw_bytes))
+
+    # Float vectors for re-scoring live on disk (memory-mapped), so they are not counted
+    float_vectors = FloatVectors(dimension)
+    float_vectors.add(ids, vectors)
+    for index_type in ("sq8", "pq"):
+        start = time.perf_counter()
+        index = create_index(index_type, dimension, vectors)
+        index.add_with_ids(vectors, ids)
+        build = time.perf_counter() - start
+        quantized_bytes = index_bytes(index) / len(vectors)
+        found, latencies = _timed_search(index, queries, k)
+        rows.append(_row(index_type, "-", found, latencies, ground_truth, build, quantized_bytes))
+        found, latencies = _timed_search(index, queries, k, float_vectors=float_vectors)
+        rows.append(_row(index_type, f"rescore x{RESCORE_FACTOR}", found, latencies, ground_truth, build,
+                         quantized_bytes))
+
+    return rows
+
+def load_store_vectors(filepath: str) -> np.ndarray:
+    """Read every vector from a saved vector store, at full precision where it was kept."""
+    if os.path.exists(f"{filepath}.snapshot/vectors.npy"):
+        return np.load(f"{filepath}.snapshot/vectors.npy")
+    if os.path.isdir(f"{filepath}.snapshot"):
+        index = faiss.read_index(f"{filepath}.snapshot/index.faiss")
+    else:
+        index = faiss.read_index(f"{filepath}.index")
+    _, vectors = export_vectors(index, index.d)
+    return vectors
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall, latency and memory report for VectorStore index types")
+    parser.add_argument("--store", type=str, help="Saved vector store path (without extension)")
+    parser.add_argument("--size", type=int, default=100000, help="Synthetic corpus size (default: 100000)")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries (default: 200)")
+    parser.add_argument("--k", type=int, default=5, help="Neighbours per query (default: 5)")
+    parser.add_argument("--json", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    if args.store:
+        vectors = load_store_vectors(args.store)
+    else:
+        vectors = synthetic_vectors(args.size, DEFAULT_EMBEDDING_DIMENSION)
+
+    # Queries are perturbed corpus vectors, so each has real near neighbours
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)].copy()
+    queries += 0.05 * rng.standard_normal(queries.shape).astype('float32')
+    faiss.normalize_L2(queries)
+
+    print(f"Corpus: {len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+    rows = recall_latency_report(vectors, queries, k=args.k)
+
+    print(f"{'index':<10} {'param':<14} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'build s':>8} {'B/vec':>7}")
+    print("-" * 68)
+    for row in rows:
+        print(f"{row['index']:<10} {row['param']:<14} {row['recall']:>7.4f} "
+              f"{row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} {row['build_s']:>8.2f} {row['bytes_per_vector']:>7.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"corpus_size": len(vectors), "queries": len(queries), "k": args.k, "results": rows}, f, indent=2)
+        print(f"Report written to: {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+class QueryActivity:
+    """Counts query work in progress so background ingestion can yield to it."""
+
+    def __init__(self):
+        self._active = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def track(self):
+        with self._condition:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                if self._active == 0:
+                    self._condition.notify_all()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def wait_idle(self, timeout: float) -> bool:
+        """Block until no query work is running, or the timeout passes.
+
+        The timeout keeps ingestion moving under sustained query load.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._active == 0, timeout=timeout)
+
+def new_job(files: List[str], action: str = "ingest") -> Dict[str, Any]:
+    """A queued job record; action is "ingest" (add or replace files) or "remove"."""
+    return {
+        'id': uuid.uuid4().hex,
+        'action': action,
+        'status': 'queued',
+        'files': files,
+        'created': datetime.now().isoformat(),
+        'started': None,
+        'finished': None,
+        'progress': {},
+        'error': None
+    }
+
+class IngestionJobQueue:
+    """Persistent FIFO queue of ingestion jobs processed by one background worker.
+
+    Jobs are stored in a JSON file rewritten on every state change. Jobs that
+    were queued or running when the process stopped are run again on start;
+    the ingestion manifest makes re-running a finished file a no-op. If inbox
+    is given, jobs that other processes drop there (see RemoteJobQueue) are
+    adopted while the worker runs.
+    """
+
+    def __init__(self, path: str, run_job: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 keep_finished: int = 100, inbox: Optional[str] = None, inbox_poll: float = 1.0):
+        self.path = path
+        self.run_job = run_job
+        self.keep_finished = keep_finished
+        self.inbox = Path(inbox) if inbox else None
+        if self.inbox is not None:
+            self.inbox.mkdir(parents=True, exist_ok=True)
+        self.inbox_poll = inbox_poll
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: List[str] = []
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                jobs = json.load(f).get('jobs', [])
+        except Exception as e:
+            print(f"Error loading ingestion queue {self.path}: {e}")
+            return
+
+        for job in jobs:
+            if job['status'] in ('queued', 'running'):
+                job['status'] = 'queued'
+                self._queue.append(job['id'])
+            self.jobs[job['id']] = job
+        if self._queue:
+            print(f"Recovered {len(self._queue)} unfinished ingestion jobs")
+
+    def _save(self):
+        # Keep every unfinished job plus the most recent finished ones
+        jobs = sorted(self.jobs.values(), key=lambda j: j['created'])
+        finished = [j for j in jobs if j['status'] in ('completed', 'failed')]
+        for job in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self.jobs[job['id']]
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'jobs': sorted(self.jobs.values(), key=lambda j: j['created'])}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def submit(self, files: List[str], action: str = "ingest") -> Dict[str, Any]:
+        """Queue files for ingestion (or removal) and return the new job record."""
+        job = new_job(files, action)
+        with self._condition:
+            self.jobs[job['id']] = job
+            self._queue.append(job['id'])
+            self._save()
+            self._condition.notify()
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of a job record, including its queue position if queued."""
+        with self._condition:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            if job['status'] == 'queued':
+                job['queue_position'] = self._queue.index(job_id) + 1
+            return job
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Return copies of all known jobs, oldest first."""
+        with self._condition:
+            return [dict(j) for j in sorted(self.jobs.values(), key=lambda j: j['created'])]
+
+    def start(self):
+        """Start the background worker thread."""
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._work, name="ingestion", daemon=True)
+            self._worker.start()
+
+    def _adopt_inbox(self):
+        """Move jobs submitted by other processes into the queue, oldest first."""
+        entries, adopted = [], []
+        for entry in self.inbox.glob("*.json"):
+            try:
+                with open(entry, 'r') as f:
+                    job = json.load(f)
+            except Exception as e:
+                print(f"Skipping unreadable inbox job {entry}: {e}")
+                continue
+            entries.append(entry)
+            if job['id'] not in self.jobs:
+                adopted.append(job)
+        for job in sorted(adopted, key=lambda j: j['created']):
+            self.jobs[job['id']] = job
+            self._queue.append(job['id'])
+        if adopted:
+            self._save()
+        # Removed only once the queue file lists them, so no job is ever invisible
+        for entry in entries:
+            entry.unlink(missing_ok=True)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                if self.inbox is None:
+                    self._condition.wait_for(lambda: self._queue)
+                else:
+                    self._adopt_inbox()
+                    while not self._queue:
+                        self._condition.wait(self.inbox_poll)
+                        self._adopt_inbox()
+                job = self.jobs[self._queue.pop(0)]
+                job['status'] = 'running'
+                job['started'] = datetime.now().isoformat()
+                self._save()
+
+            try:
+                progress = self.run_job(job)
+                status, error = 'completed', None
+            except Exception as e:
+                print(f"Ingestion job {job['id']} failed: {e}")
+                progress, status, error = job.get('progress', {}), 'failed', str(e)
+
+            with self._condition:
+                job.update(status=status, error=error, progress=progress,
+                           finished=datetime.now().isoformat())
+                self._save()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Count jobs by status."""
+        with self._condition:
+            counts: Dict[str, int] = {}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+class RemoteJobQueue:
+    """Job queue view for processes that do not run ingestion themselves.
+
+    Jobs are submitted by writing them to the inbox of the process that owns
+    the IngestionJobQueue, and read back from that queue's JSON file, so the
+    same job ids and statuses are visible from every process.
+    """
+
+    def __init__(self, path: str, inbox: str):
+        self.path = path
+        self.inbox = Path(inbox)
+        self.inbox.mkdir(parents=True, exist_ok=True)
+
+    def submit(self, files: List[str], action: str = "ingest") -> Dict[str, Any]:
+        job = new_job(files, action)
+        tmp_path = self.inbox / f".{job['id']}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self.inbox / f"{job['id']}.json")
+        return dict(job)
+
+    def _jobs(self) -> Dict[str, Dict[str, Any]]:
+        jobs = {}
+        for entry in self.inbox.glob("*.json"):
+            try:
+                with open(entry, 'r') as f:
+                    job = json.load(f)
+                jobs[job['id']] = job
+            except Exception:
+                continue  # adopted while being read
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                jobs.update({job['id']: job for job in json.load(f).get('jobs', [])})
+        return jobs
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._jobs().get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return sorted(self._jobs().values(), key=lambda j: j['created'])
+
+    def get_statistics(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs().values():
+            counts[job['status']] = counts.get(job['status'], 0) + 1
+        return counts
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+class IngestionManifest:
+    """Tracks which files have been ingested, keyed by content hash, mtime and size."""
+
+    VERSION = 1
+
+    def __init__(self):
+        # path -> {'sha256', 'mtime', 'size'}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        # sha256 -> {'chunks'}
+        self.documents: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _key(file_path: str) -> str:
+        return str(Path(file_path).resolve())
+
+    @staticmethod
+    def hash_file(file_path: str, block_size: int = 1024 * 1024) -> str:
+        """Compute the SHA-256 digest of a file's content."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def check(self, file_path: str) -> Tuple[str, str]:
+        """Return (status, digest) where status is 'new', 'changed' or 'unchanged'.
+
+        The content hash is only recomputed when mtime or size differ from the
+        recorded entry, so unchanged files cost a single stat() call.
+        """
+        stat = os.stat(file_path)
+        entry = self.files.get(self._key(file_path))
+
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            return 'unchanged', entry['sha256']
+
+        digest = self.hash_file(file_path)
+        if entry is None:
+            return 'new', digest
+        if entry['sha256'] == digest:
+            # Touched but identical content: refresh the stat fields only
+            entry['mtime'] = stat.st_mtime
+            entry['size'] = stat.st_size
+            return 'unchanged', digest
+        return 'changed', digest
+
+    def update(self, file_path: str, digest: str) -> Optional[str]:
+        """Point a file path at a new digest.
+
+        Returns the previous digest if no other path references it any more,
+        meaning its chunks are stale and should be removed from the index.
+        """
+        key = self._key(file_path)
+        stat = os.stat(file_path)
+        previous = self.files.get(key, {}).get('sha256')
+        self.files[key] = {'sha256': digest, 'mtime': stat.st_mtime, 'size': stat.st_size}
+
+        if previous and previous != digest and not self._is_referenced(previous):
+            self.documents.pop(previous, None)
+            return previous
+        return None
+
+    def forget(self, file_path: str) -> Optional[str]:
+        """Stop tracking a file path.
+
+        Returns its digest if no other path references it any more, meaning
+        its chunks should be removed from the index.
+        """
+        entry = self.files.pop(self._key(file_path), None)
+        if entry is None:
+            return None
+        digest = entry['sha256']
+        if not self._is_referenced(digest):
+            self.documents.pop(digest, None)
+            return digest
+        return None
+
+    def has_document(self, digest: str) -> bool:
+        """Check whether content with this digest is already indexed."""
+        return digest in self.documents
+
+    def add_document(self, digest: str, chunk_count: int):
+        """Record that content with this digest has been indexed."""
+        self.documents[digest] = {'chunks': chunk_count}
+
+    def _is_referenced(self, digest: str) -> bool:
+        return any(entry['sha256'] == digest for entry in self.files.values())
+
+    def save(self, filepath: str):
+        """Save the manifest to disk atomically."""
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': self.VERSION,
+                'files': self.files,
+                'documents': self.documents
+            }, f)
+        os.replace(tmp_path, filepath)
+
+    def load(self, filepath: str):
+        """Load the manifest from disk."""
+        with open(filepath, 'r') as f:
+            data = json.load(f)
+        self.files = data.get('files', {})
+        self.documents = data.get('documents', {})
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get statistics about the manifest."""
+        return {
+            "tracked_files": len(self.files),
+            "indexed_documents": len(self.documents),
+            "indexed_chunks": sum(d['chunks'] for d in self.documents.values())
+        }
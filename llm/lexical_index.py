@@ -0,0 +1,331 @@
+import bisect
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from snapshot import StringColumn
+from config import BM25_K1, BM25_B
+
+# Identifiers such as "4.2(b)", "POL-2023/114" or "s.12" are kept whole and
+# also split into their parts, so both exact and partial matches score
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:(?:[./\-][a-z0-9]+)|(?:\([a-z0-9]+\)))*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Very common words have huge posting lists and carry no signal
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have if in into is it its of on or
+that the their then there these this to was were will with what which who how
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase text into BM25 terms, keeping compound identifiers as extra terms."""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(part for part in parts if part not in STOPWORDS)
+    return terms
+
+class LexicalIndex:
+    """BM25 inverted index over chunk ids, kept alongside the FAISS index.
+
+    Postings from a loaded snapshot stay in memory-mapped arrays, ascending
+    by id within each term, and terms are found by binary search over the
+    sorted, mapped term column, so loading builds no per-term structures;
+    chunks added afterwards go into in-memory dicts.
+    A query only touches the postings of its own terms and scores them with
+    numpy. Terms are taken rarest first, and once the remaining terms cannot
+    lift a new chunk into the top k (MaxScore), their postings are only
+    looked up for the chunks already found, so a common term such as
+    "policy" does not cost a pass over most of the corpus. Removed ids are
+    masked until the next compaction or save.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        # term -> {chunk_id: term frequency}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        # chunk_id -> length in terms, for chunks added since load
+        self.lengths: Dict[int, int] = {}
+        self.removed: set = set()
+        self._removed_in_memory: set = set()
+        self._removed_array: Optional[np.ndarray] = None
+        # Lengths of chunks added since load, indexed by chunk id, for vectorised scoring
+        self._memory_lengths = np.zeros(0, dtype='int32')
+        self.count = 0
+        self.total_length = 0
+        # Memory-mapped postings from a snapshot
+        # Sorted terms; the postings of term i are at _base_offsets[i]:_base_offsets[i + 1]
+        self._base_terms: Sequence[str] = []
+        self._base_offsets = None
+        self._base_ids = None
+        self._base_tfs = None
+        self._base_lengths = None
+        # Sorted chunk ids and their lengths, for removing snapshot chunks
+        self._base_doc_ids = None
+        self._base_doc_lengths = None
+
+    @staticmethod
+    def analyze(text: str) -> Tuple[Counter, int]:
+        """Term counts and length of a text; safe to call outside any lock."""
+        terms = tokenize(text)
+        return Counter(terms), len(terms)
+
+    def add(self, chunk_id: int, analyzed: Tuple[Counter, int]):
+        """Index a chunk from the output of analyze()."""
+        counts, length = analyzed
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+        self.lengths[chunk_id] = length
+        if chunk_id >= len(self._memory_lengths):
+            grown = np.zeros(max(2 * len(self._memory_lengths), chunk_id + 1, 1024), dtype='int32')
+            grown[:len(self._memory_lengths)] = self._memory_lengths
+            self._memory_lengths = grown
+        self._memory_lengths[chunk_id] = length
+        self.count += 1
+        self.total_length += length
+
+    def remove(self, chunk_ids: Iterable[int]):
+        """Mask chunks from results; postings are dropped on compact() or save."""
+        for chunk_id in chunk_ids:
+            if chunk_id in self.removed:
+                continue
+            length = self.lengths.pop(chunk_id, None)
+            if length is not None:
+                self._removed_in_memory.add(chunk_id)
+            else:
+                length = self._base_length(chunk_id)
+                if length is None:
+                    continue
+            self.removed.add(chunk_id)
+            self._removed_array = None
+            self.count -= 1
+            self.total_length -= length
+
+    def _base_length(self, chunk_id: int) -> Optional[int]:
+        if self._base_doc_ids is None:
+            return None
+        row = int(np.searchsorted(self._base_doc_ids, chunk_id))
+        if row < len(self._base_doc_ids) and int(self._base_doc_ids[row]) == chunk_id:
+            return int(self._base_doc_lengths[row])
+        return None
+
+    def _base_entry(self, term: str) -> Optional[int]:
+        entry = bisect.bisect_left(self._base_terms, term)
+        if entry < len(self._base_terms) and self._base_terms[entry] == term:
+            return entry
+        return None
+
+    def _base_postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        entry = self._base_entry(term)
+        if entry is None:
+            return None
+        start, end = int(self._base_offsets[entry]), int(self._base_offsets[entry + 1])
+        return self._base_ids[start:end], self._base_tfs[start:end], self._base_lengths[start:end]
+
+    def _removed_ids(self) -> np.ndarray:
+        if self._removed_array is None:
+            self._removed_array = np.fromiter(self.removed, dtype='int64', count=len(self.removed))
+        return self._removed_array
+
+    def _weights(self, idf: float, tfs: np.ndarray, lengths: np.ndarray, avgdl: float) -> np.ndarray:
+        tfs = tfs.astype('float64')
+        return idf * tfs * (self.k1 + 1) / (tfs + self.k1 * (1 - self.b + self.b * lengths / avgdl))
+
+    def _term_scores(self, idf: float, memory: Dict[int, int], base, avgdl: float,
+                     allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Ids and BM25 contributions of every live (and allowed) chunk containing a term."""
+        ids, tfs, lengths = [], [], []
+        if base is not None:
+            ids.append(np.asarray(base[0]))
+            tfs.append(np.asarray(base[1]))
+            lengths.append(np.asarray(base[2]))
+        if memory:
+            memory_ids = np.fromiter(memory.keys(), dtype='int64', count=len(memory))
+            ids.append(memory_ids)
+            tfs.append(np.fromiter(memory.values(), dtype='int32', count=len(memory)))
+            lengths.append(self._memory_lengths[memory_ids])
+        ids, tfs, lengths = np.concatenate(ids), np.concatenate(tfs), np.concatenate(lengths)
+
+        keep = None
+        if self.removed:
+            keep = ~np.isin(ids, self._removed_ids())
+        if allowed is not None:
+            in_allowed = np.isin(ids, allowed)
+            keep = in_allowed if keep is None else keep & in_allowed
+        if keep is not None:
+            ids, tfs, lengths = ids[keep], tfs[keep], lengths[keep]
+        return ids, self._weights(idf, tfs, lengths, avgdl)
+
+    def _candidate_scores(self, idf: float, memory: Dict[int, int], base, avgdl: float,
+                          ids: np.ndarray) -> np.ndarray:
+        """BM25 contributions of a term to the given chunks only (0 where absent)."""
+        tfs = np.zeros(len(ids), dtype='int32')
+        lengths = np.zeros(len(ids), dtype='int32')
+        if base is not None and len(base[0]):
+            rows = np.minimum(np.searchsorted(base[0], ids), len(base[0]) - 1)
+            found = np.asarray(base[0][rows]) == ids
+            tfs[found] = base[1][rows[found]]
+            lengths[found] = base[2][rows[found]]
+        if memory:
+            memory_tfs = np.fromiter((memory.get(chunk_id, 0) for chunk_id in ids.tolist()), dtype='int32',
+                                     count=len(ids))
+            found = memory_tfs > 0
+            tfs[found] = memory_tfs[found]
+            lengths[found] = self._memory_lengths[ids[found]]
+        return np.where(tfs > 0, self._weights(idf, tfs, lengths, avgdl), 0.0)
+
+    def search(self, query: str, k: int = 5, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Return the top-k (chunk_id, BM25 score) pairs for a query.
+
+        allowed, a sorted id array, restricts scoring to those chunks.
+        """
+        if self.count <= 0 or k <= 0:
+            return []
+
+        avgdl = self.total_length / self.count
+        terms = []
+        for term in set(tokenize(query)):
+            memory = self.postings.get(term, {})
+            base = self._base_postings(term)
+            idf = self._idf(memory, base)
+            if idf is not None:
+                terms.append((idf, memory, base))
+        # Rarest first: the shortest posting lists with the highest score bounds
+        terms.sort(key=lambda term: term[0], reverse=True)
+        bounds = [idf * (self.k1 + 1) for idf, _, _ in terms]
+
+        ids = np.zeros(0, dtype='int64')
+        scores = np.zeros(0, dtype='float64')
+        for i, (idf, memory, base) in enumerate(terms):
+            if len(ids) >= k and sum(bounds[i:]) <= np.partition(scores, len(scores) - k)[len(scores) - k]:
+                # A chunk found by none of the terms so far cannot reach the top k any more
+                for idf, memory, base in terms[i:]:
+                    scores += self._candidate_scores(idf, memory, base, avgdl, ids)
+                break
+            term_ids, term_scores = self._term_scores(idf, memory, base, avgdl, allowed)
+            ids, inverse = np.unique(np.concatenate([ids, term_ids]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([scores, term_scores]), minlength=len(ids))
+
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return [(int(chunk_id), float(score)) for chunk_id, score in zip(ids[order], scores[order])]
+
+    def _idf(self, memory: Dict[int, int], base) -> Optional[float]:
+        df = len(memory) + (len(base[0]) if base is not None else 0)
+        if df == 0:
+            return None
+        return math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+
+    def score_bound(self, query: str) -> float:
+        """Upper bound of any chunk's BM25 score for a query: the sum of idf * (k1 + 1) over its terms.
+
+        Dividing by it puts scores from indexes with different statistics
+        (e.g. shards) on a common 0-1 scale.
+        """
+        if self.count <= 0:
+            return 0.0
+        bound = 0.0
+        for term in set(tokenize(query)):
+            idf = self._idf(self.postings.get(term, {}), self._base_postings(term))
+            if idf is not None:
+                bound += idf * (self.k1 + 1)
+        return bound
+
+    def compact(self):
+        """Drop removed chunks from the in-memory postings."""
+        if not self._removed_in_memory:
+            return
+        for term in list(self.postings):
+            postings = self.postings[term]
+            for chunk_id in self._removed_in_memory.intersection(postings):
+                del postings[chunk_id]
+            if not postings:
+                del self.postings[term]
+        self.removed -= self._removed_in_memory
+        self._removed_in_memory = set()
+        self._removed_array = None
+
+    def write(self, directory: Path):
+        """Write base and in-memory postings, minus removed chunks, as snapshot columns."""
+        base_entries = {self._base_terms[entry]: entry for entry in range(len(self._base_terms))}
+        terms = sorted(set(base_entries) | set(self.postings))
+        offsets = np.zeros(len(terms) + 1, dtype='int64')
+        ids, tfs, lengths = [], [], []
+        removed = np.fromiter(self.removed, dtype='int64')
+        position = 0
+        for i, term in enumerate(terms):
+            entry = base_entries.get(term)
+            if entry is not None:
+                start, end = int(self._base_offsets[entry]), int(self._base_offsets[entry + 1])
+                base = self._base_ids[start:end], self._base_tfs[start:end], self._base_lengths[start:end]
+                keep = ~np.isin(base[0], removed)
+                ids.append(np.asarray(base[0])[keep])
+                tfs.append(np.asarray(base[1])[keep])
+                lengths.append(np.asarray(base[2])[keep])
+                position += int(keep.sum())
+            memory = sorted((chunk_id, tf) for chunk_id, tf in self.postings.get(term, {}).items()
+                            if chunk_id not in self.removed)
+            if memory:
+                ids.append(np.array([chunk_id for chunk_id, _ in memory], dtype='int64'))
+                tfs.append(np.array([tf for _, tf in memory], dtype='int32'))
+                lengths.append(np.array([self.lengths[chunk_id] for chunk_id, _ in memory], dtype='int32'))
+                position += len(memory)
+            offsets[i + 1] = position
+
+        # Per-chunk lengths, sorted by id
+        doc_lengths = dict(self.lengths)
+        if self._base_doc_ids is not None:
+            keep = ~np.isin(self._base_doc_ids, removed)
+            doc_lengths.update(zip(np.asarray(self._base_doc_ids)[keep].tolist(),
+                                   np.asarray(self._base_doc_lengths)[keep].tolist()))
+        doc_ids = sorted(doc_lengths)
+        doc_lengths = np.array([doc_lengths[i] for i in doc_ids], dtype='int32')
+
+        StringColumn.write(directory, "lexical.terms", terms)
+        np.save(directory / "lexical.offsets.npy", offsets)
+        np.save(directory / "lexical.ids.npy", np.concatenate(ids) if ids else np.zeros(0, dtype='int64'))
+        np.save(directory / "lexical.tfs.npy", np.concatenate(tfs) if tfs else np.zeros(0, dtype='int32'))
+        np.save(directory / "lexical.lengths.npy", np.concatenate(lengths) if lengths else np.zeros(0, dtype='int32'))
+        np.save(directory / "lexical.doc_ids.npy", np.array(doc_ids, dtype='int64'))
+        np.save(directory / "lexical.doc_lengths.npy", doc_lengths)
+        # Chunk count and total length, so loading need not sum the lengths
+        np.save(directory / "lexical.totals.npy", np.array([len(doc_ids), doc_lengths.sum(dtype='int64')],
+                                                           dtype='int64'))
+
+    @classmethod
+    def read(cls, directory: Path) -> Optional["LexicalIndex"]:
+        """Open the postings of a snapshot, or return None if it has none."""
+        directory = Path(directory)
+        if not (directory / "lexical.offsets.npy").exists():
+            return None
+
+        index = cls()
+        index._base_terms = StringColumn(directory, "lexical.terms")
+        index._base_offsets = np.load(directory / "lexical.offsets.npy", mmap_mode='r')
+        index._base_ids = np.load(directory / "lexical.ids.npy", mmap_mode='r')
+        index._base_tfs = np.load(directory / "lexical.tfs.npy", mmap_mode='r')
+        index._base_lengths = np.load(directory / "lexical.lengths.npy", mmap_mode='r')
+        index._base_doc_ids = np.load(directory / "lexical.doc_ids.npy", mmap_mode='r')
+        index._base_doc_lengths = np.load(directory / "lexical.doc_lengths.npy", mmap_mode='r')
+        if (directory / "lexical.totals.npy").exists():
+            index.count, index.total_length = (int(v) for v in np.load(directory / "lexical.totals.npy"))
+        else:
+            index.count = len(index._base_doc_ids)
+            index.total_length = int(np.asarray(index._base_doc_lengths, dtype='int64').sum())
+        return index
+
+    def get_statistics(self):
+        """Get statistics about the lexical index."""
+        return {
+            "documents": self.count,
+            "terms": len(self._base_terms) + sum(1 for term in self.postings if self._base_entry(term) is None),
+            "average_length": round(self.total_length / self.count, 1) if self.count else 0.0,
+            "removed_pending": len(self.removed)
+        }
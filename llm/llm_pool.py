@@ -0,0 +1,234 @@
+import random
+import statistics
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from metrics import metrics
+from config import (
+    DEFAULT_LLM_MODEL, OLLAMA_BASE_URLS, RETRY_ATTEMPTS, RETRY_DELAY, TIMEOUT_SECONDS,
+    LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN, LLM_SLOW_FACTOR, LLM_SLOW_MIN_SECONDS, LLM_LATENCY_SAMPLES
+)
+
+# Moving-average weight of each new time-to-first-token sample
+LATENCY_ALPHA = 0.3
+
+def _is_timeout(error: Exception) -> bool:
+    # httpx, ollama and the standard library use different timeout classes
+    return isinstance(error, TimeoutError) or "timeout" in type(error).__name__.lower()
+
+class LLMNode:
+    """One backend of an LLMPool, with its load and circuit breaker state.
+
+    state is "closed" (taking requests), "open" (ejected until the cooldown
+    passes) or "half_open" (one trial request decides whether it returns).
+    """
+
+    def __init__(self, name: str, llm: LLM):
+        self.name = name
+        self.llm = llm
+        self.outstanding = 0
+        self.state = "closed"
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+        # Moving average of seconds to first token
+        self.latency: Optional[float] = None
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.stats = {"requests": 0, "failures": 0, "timeouts": 0, "ejections": 0, "last_error": None}
+
+class LLMPool:
+    """Spreads generations over several LLM backends.
+
+    Each call goes to the available node with the fewest requests in
+    flight. A call that fails before its first token is retried on another
+    node, up to retry_attempts calls in all; once tokens have been returned
+    a failure is raised, as a retry would repeat them. Nodes that keep
+    failing, or whose time to first token falls far behind their peers',
+    are ejected by a circuit breaker for cooldown seconds and then win back
+    their place with one trial request. If every node is ejected, the one
+    ejected longest ago is still tried rather than failing outright.
+    """
+
+    def __init__(self, nodes: Dict[str, LLM], retry_attempts: int = RETRY_ATTEMPTS, retry_delay: float = RETRY_DELAY,
+                 failure_threshold: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN,
+                 slow_factor: float = LLM_SLOW_FACTOR, slow_min_seconds: float = LLM_SLOW_MIN_SECONDS,
+                 latency_samples: int = LLM_LATENCY_SAMPLES):
+        if not nodes:
+            raise ValueError("An LLM pool needs at least one node")
+        self.nodes = [LLMNode(name, llm) for name, llm in nodes.items()]
+        self.retry_attempts = max(1, retry_attempts)
+        self.retry_delay = retry_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.slow_factor = slow_factor
+        self.slow_min_seconds = slow_min_seconds
+        self.latency_samples = latency_samples
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def _available(self, node: LLMNode, now: float) -> bool:
+        if node.state == "open" and now - node.opened_at >= self.cooldown:
+            node.state = "half_open"
+        if node.state == "half_open":
+            return not node.trial_running
+        return node.state == "closed"
+
+    def _acquire(self, tried: set) -> LLMNode:
+        """Count a request on the least loaded available node, preferring ones not tried yet."""
+        with self._lock:
+            now = time.monotonic()
+            available = [node for node in self.nodes if self._available(node, now)]
+            candidates = [node for node in available if node.name not in tried] or available
+            if not candidates:
+                # Everything is ejected: a degraded answer beats none
+                candidates = [min(self.nodes, key=lambda node: node.opened_at)]
+            node = min(candidates, key=lambda node: (node.outstanding, node.latency or 0.0, random.random()))
+            if node.state == "half_open":
+                node.trial_running = True
+            node.outstanding += 1
+            node.stats["requests"] += 1
+            return node
+
+    def _has_untried(self, tried: set) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            return any(node.name not in tried and self._available(node, now) for node in self.nodes)
+
+    def _is_slow(self, node: LLMNode, trial: bool) -> bool:
+        """Whether a node's time to first token is an outlier among the nodes in use."""
+        if node.latency is None or (node.samples < self.latency_samples and not trial):
+            return False
+        peers = [peer.latency for peer in self.nodes
+                 if peer is not node and peer.state == "closed" and peer.latency is not None]
+        if not peers:
+            return False
+        return node.latency > max(self.slow_min_seconds, self.slow_factor * statistics.median(peers))
+
+    def _eject(self, node: LLMNode, reason: str):
+        if node.state != "open":
+            node.stats["ejections"] += 1
+            metrics.inc("rag_llm_ejections_total", node=node.name, reason=reason)
+            print(f"Ejected LLM node {node.name} ({reason}) for {self.cooldown}s")
+        node.state = "open"
+        node.opened_at = time.monotonic()
+
+    def _release(self, node: LLMNode, first_token: Optional[float], error: Optional[Exception]):
+        """Record a finished call and update the node's circuit breaker."""
+        with self._lock:
+            node.outstanding -= 1
+            trial, node.trial_running = node.trial_running, False
+            if error is not None:
+                node.consecutive_failures += 1
+                node.stats["failures"] += 1
+                if _is_timeout(error):
+                    node.stats["timeouts"] += 1
+                node.stats["last_error"] = f"{type(error).__name__}: {error}"
+                if trial or node.consecutive_failures >= self.failure_threshold:
+                    self._eject(node, "failures")
+                return
+
+            node.consecutive_failures = 0
+            if first_token is not None:
+                if node.latency is None or trial:
+                    node.latency = first_token
+                else:
+                    node.latency += LATENCY_ALPHA * (first_token - node.latency)
+                node.samples += 1
+            if self._is_slow(node, trial):
+                self._eject(node, "slow")
+            elif node.state != "closed":
+                node.state = "closed"
+                print(f"LLM node {node.name} is back in the pool")
+
+    def stream(self, prompt: str, stop: Optional[List[str]] = None, **kwargs: Any) -> Iterator[str]:
+        """Stream a generation from the pool, retrying failures that happen before the first token."""
+        tried: set = set()
+        for attempt in range(1, self.retry_attempts + 1):
+            if attempt > 1:
+                self.retries += 1
+                if not self._has_untried(tried):
+                    time.sleep(self.retry_delay)
+            node = self._acquire(tried)
+            tried.add(node.name)
+
+            start = time.perf_counter()
+            first_token, error = None, None
+            try:
+                for token in node.llm.stream(prompt, stop=stop, **kwargs):
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                        metrics.observe("rag_llm_first_token_seconds", first_token, node=node.name)
+                    yield token
+            except Exception as e:
+                error = e
+            finally:
+                # Also runs when the caller stops reading early
+                self._release(node, first_token, error)
+
+            if error is None:
+                metrics.inc("rag_llm_calls_total", node=node.name, outcome="ok")
+                return
+            metrics.inc("rag_llm_calls_total", node=node.name, outcome="timeout" if _is_timeout(error) else "error")
+            if first_token is not None or attempt == self.retry_attempts:
+                raise error
+            print(f"LLM node {node.name} failed ({type(error).__name__}: {error}), retrying")
+
+    def collect_gauges(self):
+        """Per-node samples for the metrics registry's collectors."""
+        with self._lock:
+            now = time.monotonic()
+            for node in self.nodes:
+                yield "rag_llm_outstanding", {"node": node.name}, node.outstanding
+                yield "rag_llm_node_available", {"node": node.name}, int(self._available(node, now))
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "nodes": {
+                    node.name: {
+                        "state": node.state,
+                        "outstanding": node.outstanding,
+                        "first_token_ms": round(node.latency * 1000, 1) if node.latency is not None else None,
+                        **node.stats
+                    }
+                    for node in self.nodes
+                }
+            }
+
+class PooledLLM(LLM):
+    """LangChain LLM whose generations are served by an LLMPool."""
+
+    model: str = DEFAULT_LLM_MODEL
+    pool: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled"
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        for text in self.pool.stream(prompt, stop=stop, **kwargs):
+            chunk = GenerationChunk(text=text)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+def ollama_pool(model: str = DEFAULT_LLM_MODEL, base_urls: Optional[List[str]] = None,
+                timeout: float = TIMEOUT_SECONDS, **pool_options: Any) -> PooledLLM:
+    """A PooledLLM over one OllamaLLM per server URL (default OLLAMA_BASE_URLS).
+
+    timeout bounds each wait on a server: connecting, the first token and
+    every token after it.
+    """
+    from langchain_ollama import OllamaLLM
+    nodes = {url: OllamaLLM(model=model, base_url=url, client_kwargs={"timeout": timeout})
+             for url in (base_urls or OLLAMA_BASE_URLS)}
+    return PooledLLM(model=model, pool=LLMPool(nodes, **pool_options))
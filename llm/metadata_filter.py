@@ -0,0 +1,283 @@
+import bisect
+import math
+import re
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from document_processor import DocumentChunk
+from snapshot import InternedColumn, StringColumn
+from config import DOMAINS
+
+# Categorical fields that can be filtered on; dates are filtered by range
+FILTER_FIELDS = ("source", "section", "type", "domain")
+RANGE_KEYS = ("date_from", "date_to")
+
+def classify_domain(text: str) -> Optional[str]:
+    """Domain (see config.DOMAINS) whose keywords occur most often in the text."""
+    words = re.findall(r"[a-z]+", text.lower())
+    counts = {domain: sum(words.count(keyword) for keyword in keywords) for domain, keywords in DOMAINS.items()}
+    domain, hits = max(counts.items(), key=lambda item: item[1])
+    return domain if hits else None
+
+def source_key(source: str) -> str:
+    """Document name of a chunk source, without the per-page suffix, as indexed for filtering."""
+    return re.sub(r"_page_\d+$", "", source).lower()
+
+def chunk_fields(chunk: DocumentChunk) -> Tuple[Dict[str, Optional[str]], float]:
+    """Filterable field values of a chunk, plus its date as a POSIX timestamp (nan if unknown).
+
+    source is the document name without the per-page suffix; type falls back
+    to what the section implies for chunks indexed before processors
+    recorded it. Emails are dated by their Date header.
+    """
+    metadata = chunk.metadata or {}
+    chunk_type = metadata.get('type')
+    if chunk_type is None:
+        chunk_type = "email" if chunk.section == "email" else "docx" if chunk.section == "document" else "pdf"
+
+    fields = {
+        "source": source_key(chunk.source),
+        "section": chunk.section.lower() if chunk.section else None,
+        "type": chunk_type.lower(),
+        "domain": classify_domain(chunk.content)
+    }
+
+    date = None
+    if metadata.get('date'):
+        try:
+            date = parsedate_to_datetime(metadata['date'])
+        except (TypeError, ValueError):
+            date = None
+    date = date or chunk.timestamp
+    return fields, date.timestamp() if date else math.nan
+
+def _timestamp(value: Any) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+def filter_key(filters: Optional[Dict[str, Any]]) -> Optional[Tuple]:
+    """Hashable, order-independent form of a filter dict, for cache and coalescing keys."""
+    if not filters:
+        return None
+    key = []
+    for name, value in sorted(filters.items()):
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = tuple(sorted(str(v).lower() for v in value))
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        key.append((name, value))
+    return tuple(key) or None
+
+class MetadataIndex:
+    """Per-field posting lists over chunk ids, used to push filters into searches.
+
+    Each categorical field maps a value to the ids carrying it; dates are
+    sorted for range lookups when first queried after a change. Snapshot postings are written sorted and
+    memory-mapped on load (values found by binary search), so opening a
+    generation builds nothing; chunks added later are held in sets. A filter
+    resolves to a sorted id array that searches restrict themselves to.
+    """
+
+    def __init__(self):
+        # field -> value -> ids added since load
+        self.postings: Dict[str, Dict[str, set]] = {field: {} for field in FILTER_FIELDS}
+        # (timestamp, id) for ids added since load; sorted and purged of
+        # removed ids lazily (see _sorted_dates), so bulk adds stay O(n log n)
+        self.dates: List[Tuple[float, int]] = []
+        self._dates_sorted = True
+        self._dates_removed = False
+        # id -> (fields, timestamp) for ids added since load, so removal is O(1)
+        self._entries: Dict[int, Tuple[Dict[str, Optional[str]], float]] = {}
+        # Removed snapshot ids, masked until the next load
+        self.removed: set = set()
+        # Snapshot postings per field: sorted values, and the ids of value i at ids[starts[i]:starts[i + 1]]
+        self._base_values: Dict[str, Sequence[str]] = {field: [] for field in FILTER_FIELDS}
+        self._base_starts: Dict[str, np.ndarray] = {field: np.zeros(1, dtype='int64') for field in FILTER_FIELDS}
+        self._base_ids: Dict[str, np.ndarray] = {field: np.zeros(0, dtype='int64') for field in FILTER_FIELDS}
+        self._base_dates = np.zeros(0, dtype='float64')
+        self._base_date_ids = np.zeros(0, dtype='int64')
+
+    def add(self, chunk_id: int, entry: Tuple[Dict[str, Optional[str]], float]):
+        """Index a chunk from the output of chunk_fields()."""
+        fields, date = entry
+        for field, value in fields.items():
+            if value is not None:
+                self.postings[field].setdefault(value, set()).add(chunk_id)
+        if not math.isnan(date):
+            self.dates.append((date, chunk_id))
+            self._dates_sorted = False
+        self._entries[chunk_id] = entry
+
+    def remove(self, chunk_ids: Iterable[int]):
+        """Drop chunks from every posting list."""
+        for chunk_id in chunk_ids:
+            entry = self._entries.pop(chunk_id, None)
+            if entry is None:
+                self.removed.add(chunk_id)
+                continue
+            fields, date = entry
+            for field, value in fields.items():
+                if value is not None:
+                    ids = self.postings[field][value]
+                    ids.discard(chunk_id)
+                    if not ids:
+                        del self.postings[field][value]
+            if not math.isnan(date):
+                self._dates_removed = True
+
+    def _sorted_dates(self) -> List[Tuple[float, int]]:
+        """The in-memory dates of live ids, sorted."""
+        if self._dates_removed:
+            # Chunk ids are never reused, so an id without an entry was removed
+            self.dates = [item for item in self.dates if item[1] in self._entries]
+            self._dates_removed = False
+        if not self._dates_sorted:
+            self.dates.sort()
+            self._dates_sorted = True
+        return self.dates
+
+    def matching_ids(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Sorted ids matching every given field (any of its values) and the date range.
+
+        Field values may be a string or a list of strings; date_from and
+        date_to take datetimes, ISO strings or POSIX timestamps. Returns None
+        if the filters constrain nothing.
+        """
+        unknown = set(filters) - set(FILTER_FIELDS) - set(RANGE_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown filter fields {sorted(unknown)}, expected {FILTER_FIELDS + RANGE_KEYS}")
+
+        selections = []
+        for field in FILTER_FIELDS:
+            values = filters.get(field)
+            if not values:
+                continue
+            if isinstance(values, str):
+                values = [values]
+            parts = []
+            for value in values:
+                value = value.lower()
+                if value in self.postings[field]:
+                    parts.append(np.fromiter(self.postings[field][value], dtype='int64'))
+                base = self._base_postings(field, value)
+                if base is not None:
+                    parts.append(base)
+            selections.append(np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype='int64'))
+
+        if filters.get("date_from") is not None or filters.get("date_to") is not None:
+            low = _timestamp(filters["date_from"]) if filters.get("date_from") is not None else -math.inf
+            high = _timestamp(filters["date_to"]) if filters.get("date_to") is not None else math.inf
+            start = np.searchsorted(self._base_dates, low, side='left')
+            end = np.searchsorted(self._base_dates, high, side='right')
+            dates = self._sorted_dates()
+            in_memory = [chunk_id for _, chunk_id in dates[
+                bisect.bisect_left(dates, (low, -1)):bisect.bisect_right(dates, (high, math.inf))]]
+            selections.append(np.unique(np.concatenate([
+                self._base_date_ids[start:end], np.array(in_memory, dtype='int64')
+            ])))
+
+        if not selections:
+            return None
+        ids = selections[0]
+        for selection in selections[1:]:
+            ids = np.intersect1d(ids, selection, assume_unique=True)
+        if self.removed and len(ids):
+            ids = ids[~np.isin(ids, np.fromiter(self.removed, dtype='int64'))]
+        return ids
+
+    def _base_postings(self, field: str, value: str) -> Optional[np.ndarray]:
+        values = self._base_values[field]
+        entry = bisect.bisect_left(values, value)
+        if entry == len(values) or values[entry] != value:
+            return None
+        starts = self._base_starts[field]
+        return self._base_ids[field][int(starts[entry]):int(starts[entry + 1])]
+
+    def _live_postings(self, field: str) -> Dict[str, np.ndarray]:
+        """Sorted live ids per value of a field, snapshot and in-memory merged."""
+        removed = np.fromiter(self.removed, dtype='int64', count=len(self.removed))
+        values, starts, ids = self._base_values[field], self._base_starts[field], self._base_ids[field]
+        postings = {}
+        for entry in range(len(values)):
+            base = np.asarray(ids[int(starts[entry]):int(starts[entry + 1])])
+            postings[values[entry]] = base[~np.isin(base, removed)] if len(removed) else base
+        for value, memory in self.postings[field].items():
+            postings[value] = np.union1d(postings.get(value, np.zeros(0, dtype='int64')),
+                                         np.fromiter(memory, dtype='int64', count=len(memory)))
+        return {value: ids for value, ids in postings.items() if len(ids)}
+
+    def write(self, directory: Path):
+        """Write the live postings as snapshot columns (filter.<field>.*, filter.dates.npy, filter.date_ids.npy)."""
+        for field in FILTER_FIELDS:
+            postings = self._live_postings(field)
+            values = sorted(postings)
+            starts = np.zeros(len(values) + 1, dtype='int64')
+            starts[1:] = np.cumsum([len(postings[value]) for value in values])
+            StringColumn.write(directory, f"filter.{field}.values", values)
+            np.save(directory / f"filter.{field}.starts.npy", starts)
+            np.save(directory / f"filter.{field}.ids.npy", np.concatenate(
+                [postings[value] for value in values]).astype('int64') if values else np.zeros(0, dtype='int64'))
+
+        keep = ~np.isin(self._base_date_ids, np.fromiter(self.removed, dtype='int64', count=len(self.removed)))
+        in_memory = self._sorted_dates()
+        dates = np.concatenate([np.asarray(self._base_dates)[keep], np.array([date for date, _ in in_memory])])
+        ids = np.concatenate([np.asarray(self._base_date_ids)[keep],
+                              np.array([chunk_id for _, chunk_id in in_memory], dtype='int64')])
+        order = np.lexsort((ids, dates))
+        np.save(directory / "filter.dates.npy", dates[order].astype('float64'))
+        np.save(directory / "filter.date_ids.npy", ids[order].astype('int64'))
+
+    @classmethod
+    def read(cls, directory: Path) -> Optional["MetadataIndex"]:
+        """Open the posting lists of a snapshot, or return None if it has none."""
+        directory = Path(directory)
+        index = cls()
+        if (directory / "filter.dates.npy").exists():
+            for field in FILTER_FIELDS:
+                index._base_values[field] = StringColumn(directory, f"filter.{field}.values")
+                index._base_starts[field] = np.load(directory / f"filter.{field}.starts.npy", mmap_mode='r')
+                index._base_ids[field] = np.load(directory / f"filter.{field}.ids.npy", mmap_mode='r')
+            index._base_dates = np.load(directory / "filter.dates.npy", mmap_mode='r')
+            index._base_date_ids = np.load(directory / "filter.date_ids.npy", mmap_mode='r')
+        elif (directory / "filter.date.npy").exists():
+            # Version 2 snapshots hold per-row filter values; sort them into postings here
+            ids = np.load(directory / "ids.npy")
+            for field in FILTER_FIELDS:
+                column = InternedColumn(directory, f"filter.{field}")
+                table = [column.table[entry] for entry in range(len(column.table))]
+                ranks = np.empty(len(table), dtype='int64')
+                ranks[np.argsort(np.array(table, dtype=object), kind='stable')] = np.arange(len(table))
+                indices = np.asarray(column.indices)
+                rows = np.flatnonzero(indices >= 0)
+                row_ranks = ranks[indices[rows]]
+                order = np.lexsort((ids[rows], row_ranks))
+                index._base_values[field] = sorted(table)
+                index._base_starts[field] = np.searchsorted(row_ranks[order], np.arange(len(table) + 1))
+                index._base_ids[field] = ids[rows][order]
+            dates = np.load(directory / "filter.date.npy")
+            known = ~np.isnan(dates)
+            order = np.lexsort((ids[known], dates[known]))
+            index._base_dates = dates[known][order]
+            index._base_date_ids = ids[known][order]
+        else:
+            return None
+        return index
+
+    def value_counts(self, field: str) -> Dict[str, int]:
+        """Number of live chunks carrying each value of a field."""
+        return {value: len(ids) for value, ids in self._live_postings(field).items()}
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Number of distinct values per field."""
+        return {
+            field: len(self._base_values[field]) + sum(
+                1 for value in self.postings[field] if self._base_postings(field, value) is None)
+            for field in FILTER_FIELDS
+        }
@@ -0,0 +1,287 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from config import ENABLE_METRICS, METRICS_BUCKETS, PROFILER_INTERVAL_MS, PROFILER_MAX_STACKS
+
+# Every metric the system exports: name -> (type, help). Stage latencies share
+# one histogram labelled by pipeline ("query" or "ingest") and stage
+METRICS = {
+    "rag_stage_seconds": ("histogram", "Time spent in each stage of the query and ingestion pipelines"),
+    "rag_queries_total": ("counter", "Queries answered, by entry point and outcome"),
+    "rag_query_cache_total": ("counter", "Query cache lookups, by result"),
+    "rag_ingested_files_total": ("counter", "Files parsed and indexed"),
+    "rag_ingested_chunks_total": ("counter", "Chunks added to the index"),
+    "rag_removed_chunks_total": ("counter", "Chunks removed from the index"),
+    "rag_http_requests_total": ("counter", "HTTP requests, by method, route and status code"),
+    "rag_http_request_seconds": ("histogram", "HTTP request latency, by method and route"),
+    "rag_llm_calls_total": ("counter", "Calls to LLM pool nodes, by node and outcome (ok, error, timeout)"),
+    "rag_llm_first_token_seconds": ("histogram", "Time to first token of LLM pool nodes, by node"),
+    "rag_llm_ejections_total": ("counter", "LLM pool nodes ejected by the circuit breaker, by node and reason"),
+    "rag_indexed_chunks": ("gauge", "Live chunks in the index"),
+    "rag_tombstoned_chunks": ("gauge", "Removed chunks awaiting compaction"),
+    "rag_active_queries": ("gauge", "Queries running on the query executor"),
+    "rag_ingestion_running": ("gauge", "1 while an ingestion run is in progress"),
+    "rag_llm_outstanding": ("gauge", "Requests in flight on each LLM pool node"),
+    "rag_llm_node_available": ("gauge", "1 while an LLM pool node takes requests, 0 while it is ejected"),
+    "rag_snapshot_generation": ("gauge", "Snapshot generation the index was loaded from or last saved as"),
+    "rag_profiler_running": ("gauge", "1 while the sampling profiler is running"),
+    "rag_profiler_samples_total": ("counter", "Stack samples taken by the sampling profiler"),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class MetricsRegistry:
+    """Counters and latency histograms, rendered in the Prometheus text format.
+
+    Updates are a dict lookup and an addition under a lock, so stages can be
+    timed on every request. Gauges are read from collector callbacks when
+    the metrics are rendered. A disabled registry ignores all updates.
+    """
+
+    def __init__(self, enabled: bool = ENABLE_METRICS, buckets: Tuple[float, ...] = METRICS_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        # name -> labels -> [per-bucket counts..., +Inf count, sum]
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, Any], float]]]] = []
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Add value to a counter."""
+        if not self.enabled:
+            return
+        if METRICS[name][0] != "counter":
+            raise ValueError(f"{name} is not a counter")
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one observation in a histogram."""
+        if not self.enabled:
+            return
+        if METRICS[name][0] != "histogram":
+            raise ValueError(f"{name} is not a histogram")
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def stage(self, pipeline: str, stage: str) -> Iterator[None]:
+        """Time the enclosed block as one stage of a pipeline, including when it raises."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("rag_stage_seconds", time.perf_counter() - start, pipeline=pipeline, stage=stage)
+
+    @contextmanager
+    def acquire(self, semaphore: threading.Semaphore, pipeline: str, stage: str) -> Iterator[None]:
+        """Hold semaphore for the enclosed block, timing the wait for it as a stage."""
+        with self.stage(pipeline, stage):
+            semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def add_collector(self, collect: Callable[[], Iterable[Tuple[str, Dict[str, Any], float]]]):
+        """Register a callback yielding (name, labels, value) samples at render time."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        samples: Dict[str, List[Tuple[LabelKey, float]]] = {}
+        for collect in self._collectors:
+            try:
+                for name, labels, value in collect():
+                    samples.setdefault(name, []).append((_label_key(labels), value))
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: list(counts) for key, counts in series.items()}
+                          for name, series in self._histograms.items()}
+
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            if name not in counters and name not in histograms and name not in samples:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(counters.get(name, {}).items()) + sorted(samples.get(name, [])):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for key, counts in sorted(histograms.get(name, {}).items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', repr(float(bound))))} "
+                                 f"{_format_value(cumulative)}")
+                total = cumulative + counts[len(self.buckets)]
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {_format_value(total)}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(counts[-1])}")
+                lines.append(f"{name}_count{_format_labels(key)} {_format_value(total)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+# Leaf frames of threads that are blocked rather than working
+IDLE_FRAMES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("selectors.py", "select"),
+    ("thread.py", "_worker"), ("queue.py", "get"), ("socket.py", "accept")
+}
+
+class SamplingProfiler:
+    """Statistical profiler that samples every thread's stack at a fixed interval.
+
+    Off by default; it can be started and stopped at runtime. Stacks are
+    aggregated as collapsed "thread;file:function;..." lines with sample
+    counts, the input format of flame graph tools. Threads blocked on a lock,
+    queue or socket are skipped so the profile shows where CPU time goes.
+    """
+
+    def __init__(self, interval_ms: float = PROFILER_INTERVAL_MS, max_stacks: int = PROFILER_MAX_STACKS,
+                 max_depth: int = 64):
+        self.interval_ms = interval_ms
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.dropped = 0
+        self.started_at: Optional[float] = None
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: Optional[float] = None) -> bool:
+        """Start sampling; if it is already running, only the interval is changed and False returned."""
+        with self._lock:
+            if interval_ms is not None:
+                self.interval_ms = interval_ms
+            if self.running:
+                return False
+            self._stop.clear()
+            self.started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        print(f"Profiler started ({self.interval_ms}ms interval)")
+        return True
+
+    def stop(self) -> bool:
+        """Stop sampling, keeping the collected stacks; returns False if it was not running."""
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return False
+            self._stop.set()
+            self._thread = None
+        thread.join()
+        self.elapsed += time.monotonic() - self.started_at
+        print(f"Profiler stopped ({self.samples} samples)")
+        return True
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.dropped = 0
+            self.elapsed = 0.0
+            if self.running:
+                self.started_at = time.monotonic()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_ms / 1000):
+            self._sample()
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        collapsed = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            collapsed.append(";".join([names.get(ident, str(ident))] + stack[::-1]))
+
+        with self._lock:
+            self.samples += 1
+            for stack in collapsed:
+                if stack in self.stacks or len(self.stacks) < self.max_stacks:
+                    self.stacks[stack] += 1
+                else:
+                    self.dropped += 1
+
+    def top(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """The most frequently sampled stacks, with their share of samples."""
+        with self._lock:
+            samples = max(self.samples, 1)
+            return [{"stack": stack, "samples": count, "share": round(count / samples, 4)}
+                    for stack, count in self.stacks.most_common(limit)]
+
+    def collapsed(self) -> str:
+        """Every sampled stack as "frames count" lines, for flamegraph.pl or speedscope."""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def get_statistics(self) -> Dict[str, Any]:
+        elapsed = self.elapsed + (time.monotonic() - self.started_at if self.running else 0.0)
+        return {
+            "running": self.running,
+            "interval_ms": self.interval_ms,
+            "samples": self.samples,
+            "distinct_stacks": len(self.stacks),
+            "dropped_samples": self.dropped,
+            "seconds": round(elapsed, 1)
+        }
+
+# Process-wide instances shared by the RAG system and the API server
+metrics = MetricsRegistry()
+profiler = SamplingProfiler()
@@ -0,0 +1,130 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import numpy as np
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for cache lookup: case, whitespace and trailing punctuation."""
+    query = re.sub(r'\s+', ' ', query.strip().lower())
+    return query.rstrip('?!. ')
+
+class QueryCache:
+    """Bounded LRU + TTL cache of query responses.
+
+    Entries are keyed by the normalized query text plus the retrieval
+    parameters, so "What is the deductible?" and "what is the deductible"
+    share an entry. When a similarity threshold is set, a miss falls back to
+    the cached query with the closest embedding under the same parameters.
+    Every entry is tied to an index version and the whole cache is dropped
+    as soon as a newer version is seen. Versions only grow, so lookups and
+    results computed against an older version than the cache's (a query
+    that finished after an ingest) are ignored rather than rolling it back.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600,
+                 similarity_threshold: Optional[float] = None,
+                 embed: Optional[Callable[[str], np.ndarray]] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold if embed is not None else None
+        self.embed = embed
+        self._entries: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "normalized_hits": 0, "semantic_hits": 0,
+                      "misses": 0, "evictions": 0, "invalidations": 0, "stale_puts": 0}
+
+    def _check_version(self, version: Any) -> bool:
+        """Move to a newer version, dropping every entry; False if version is older than the cache's."""
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+            self._version = version
+        return True
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["created"] > self.ttl
+
+    def get(self, query: str, params: Tuple, version: Any) -> Optional[Any]:
+        """Return the cached value for a query, or None on a miss."""
+        key = (normalize_query(query), params)
+        with self._lock:
+            if not self._check_version(version):
+                self.stats["misses"] += 1
+                return None
+
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits" if entry["query"] == query else "normalized_hits"] += 1
+                return entry["value"]
+
+            if self.similarity_threshold is None:
+                self.stats["misses"] += 1
+                return None
+            candidates = [(k, e) for k, e in self._entries.items()
+                          if k[1] == params and e["embedding"] is not None and not self._expired(e)]
+
+        # Embed outside the lock; encoding is the slow part
+        if candidates:
+            embedding = self.embed(query)
+            best_key, best_score = None, self.similarity_threshold
+            for k, e in candidates:
+                score = float(np.dot(embedding, e["embedding"]))
+                if score >= best_score:
+                    best_key, best_score = k, score
+            if best_key is not None:
+                with self._lock:
+                    entry = self._entries.get(best_key)
+                    if entry is not None and self._version == version:
+                        self._entries.move_to_end(best_key)
+                        self.stats["semantic_hits"] += 1
+                        return entry["value"]
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, query: str, params: Tuple, version: Any, value: Any):
+        """Store a value for a query computed against the given index version."""
+        embedding = self.embed(query) if self.similarity_threshold is not None else None
+        key = (normalize_query(query), params)
+        with self._lock:
+            if not self._check_version(version):
+                # Computed before the index changed; caching it would serve a stale answer
+                self.stats["stale_puts"] += 1
+                return
+            self._entries[key] = {"query": query, "value": value,
+                                  "embedding": embedding, "created": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get hit/miss statistics for the cache."""
+        with self._lock:
+            hits = self.stats["exact_hits"] + self.stats["normalized_hits"] + self.stats["semantic_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "hits": hits,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "similarity_threshold": self.similarity_threshold
+            }
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Tuple
+from query_cache import normalize_query
+
+class QueryExecutor:
+    """Runs blocking query work off the event loop on a bounded thread pool.
+
+    Identical queries that arrive while one is already being computed share
+    that computation instead of starting their own.
+    """
+
+    def __init__(self, max_workers: int = 8, throughput_window: float = 60.0):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query")
+        self._in_flight: Dict[Tuple, asyncio.Future] = {}
+        self._completed_at = deque()
+        self.throughput_window = throughput_window
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "coalesced": 0,
+                      "active": 0, "peak_active": 0, "total_latency_ms": 0.0}
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking callable on the pool and await its result."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self.stats["submitted"] += 1
+        self.stats["active"] += 1
+        self.stats["peak_active"] = max(self.stats["peak_active"], self.stats["active"])
+        try:
+            result = await loop.run_in_executor(self._pool, partial(fn, *args, **kwargs))
+            self.stats["completed"] += 1
+            return result
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.stats["active"] -= 1
+            self.stats["total_latency_ms"] += (time.perf_counter() - start) * 1000
+            now = time.monotonic()
+            self._completed_at.append(now)
+            while self._completed_at and now - self._completed_at[0] > self.throughput_window:
+                self._completed_at.popleft()
+
+    async def run_coalesced(self, key: Tuple, fn: Callable, *args, **kwargs) -> Any:
+        """Like run(), but concurrent calls with the same key share one computation."""
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            # Shield so one cancelled client does not cancel the others
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(self.run(fn, *args, **kwargs))
+        self._in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    @staticmethod
+    def query_key(query: str, **params) -> Tuple:
+        """Coalescing key for a query and its retrieval parameters."""
+        return (normalize_query(query), tuple(sorted(params.items())))
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get load and throughput statistics for the executor."""
+        finished = self.stats["completed"] + self.stats["failed"]
+        now = time.monotonic()
+        recent = sum(1 for t in self._completed_at if now - t <= self.throughput_window)
+        return {
+            **{k: v for k, v in self.stats.items() if k != "total_latency_ms"},
+            "max_workers": self.max_workers,
+            "in_flight_keys": len(self._in_flight),
+            "mean_latency_ms": round(self.stats["total_latency_ms"] / finished, 1) if finished else 0.0,
+            "throughput_qps": round(recent / self.throughput_window, 3)
+        }
+
+    def shutdown(self):
+        """Stop accepting work and wait for running calls to finish."""
+        self._pool.shutdown(wait=True)
@@ -1,11 +1,32 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 from pydantic import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
-from langchain_ollama import OllamaLLM
 from document_processor import DocumentProcessor, DocumentChunk
 from vector_store import VectorStore
+from sharded_store import ShardedVectorStore
+from ingestion_manifest import IngestionManifest
+from query_cache import QueryCache
+from metadata_filter import filter_key
+from reranker import Reranker
+from context_packer import ContextPacker
+from ingestion_jobs import QueryActivity
+from fake_llm import FakeLLM
+from llm_pool import PooledLLM, ollama_pool
+from metrics import metrics
+from config import (
+    CACHE_ENABLED, CACHE_TTL, CACHE_MAX_ENTRIES, CACHE_SIMILARITY_THRESHOLD,
+    LLM_CONCURRENCY, RETRIEVAL_CONCURRENCY, MAX_BATCH_SIZE, INGESTION_YIELD_MAX_WAIT,
+    RERANK_ENABLED, RERANK_CANDIDATES, INGEST_BATCH_SIZE, LLM_BACKEND, EMBEDDING_CACHE_ENABLED,
+    SHARD_ADDRESSES
+)
 import json
+import os
+from pathlib import Path
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 class QueryResponse(BaseModel):
@@ -17,14 +38,61 @@ class QueryResponse(BaseModel):
     relevant_clauses: List[str] = Field(description="Relevant clauses or sections found")
     domain: str = Field(description="Domain classification (insurance, legal, hr, compliance)")
     timestamp: str = Field(description="Timestamp of the response")
+    prompt_tokens: Optional[int] = Field(default=None, description="Prompt size sent to the LLM, in tokens")
 
 class IntelligentQuerySystem:
-    """Main RAG system for intelligent query processing."""
+    """Main RAG system for intelligent query processing.
     
-    def __init__(self, llm_model: str = "llama3.2:3b"):
-        self.llm = OllamaLLM(model=llm_model)
+    A read_only system only serves snapshots written by another process: it
+    refuses ingestion and saves, and leaves the shared embedding cache alone.
+    With SHARD_ADDRESSES set, the index lives in shard processes instead
+    (see sharded_store.py).
+    """
+    
+    def __init__(self, llm_model: str = "llama3.2:3b", llm=None, read_only: bool = False):
+        if llm is None:
+            llm = FakeLLM() if LLM_BACKEND == "fake" else ollama_pool(llm_model)
+        self.llm = llm
+        self.read_only = read_only
         self.document_processor = DocumentProcessor()
-        self.vector_store = VectorStore()
+        if SHARD_ADDRESSES:
+            self.vector_store = ShardedVectorStore(SHARD_ADDRESSES, read_only=read_only,
+                                                   use_embedding_cache=EMBEDDING_CACHE_ENABLED and not read_only)
+        else:
+            self.vector_store = VectorStore(use_embedding_cache=EMBEDDING_CACHE_ENABLED and not read_only)
+        self.manifest = IngestionManifest()
+        # Per-run counters (files_seen .. embeddings) reset at the start of each run
+        self.ingestion_progress = {
+            "state": "idle",
+            "source": None,
+            "files_seen": 0,
+            "files_pending": 0,
+            "pages": 0,
+            "chunks": 0,
+            "embeddings": 0,
+            "files_indexed": 0,
+            "chunks_indexed": 0,
+            "last_completed": None,
+            "last_error": None
+        }
+        self.cache = QueryCache(
+            max_entries=CACHE_MAX_ENTRIES,
+            ttl=CACHE_TTL,
+            similarity_threshold=CACHE_SIMILARITY_THRESHOLD,
+            embed=self.vector_store.embed_query
+        ) if CACHE_ENABLED else None
+        self.reranker = Reranker() if RERANK_ENABLED else None
+        self.context_packer = ContextPacker(self.document_processor.tokenizer)
+        
+        # Separate limits so slow generations cannot starve retrieval; every
+        # pooled LLM server adds its own share of generation slots
+        self.retrieval_slots = threading.BoundedSemaphore(RETRIEVAL_CONCURRENCY)
+        endpoints = len(self.llm.pool.nodes) if isinstance(self.llm, PooledLLM) else 1
+        self.llm_slots = threading.BoundedSemaphore(LLM_CONCURRENCY * endpoints)
+        # Serialises ingestion runs and snapshot writes
+        self.ingestion_lock = threading.RLock()
+        # Ingestion pauses between embedding batches while queries are running
+        self.query_activity = QueryActivity()
         
         # Define the RAG prompt template
         self.prompt_template = ChatPromptTemplate.from_template("""
@@ -53,132 +121,543 @@ Provide a clear, concise answer based on the document context. If the documents
         """)
         
         self.chain = self.prompt_template | self.llm
+        # Template tokens around the context and query, counted once
+        self.prompt_overhead_tokens = self.context_packer.count_tokens(
+            self.prompt_template.format(documents="", query="")
+        )
     
-    def add_documents(self, directory_path: str):
-        """Process and add documents to the system."""
+    def add_documents(self, directory_path: str) -> int:
+        """Process and add new or changed documents to the system.
+        
+        Files are tracked in the ingestion manifest by content hash, so
+        unchanged files are skipped, changed files have their previous chunks
+        replaced, and identical copies in other directories are indexed once.
+        Returns the number of documents added or replaced.
+        """
         print(f"Processing documents from: {directory_path}")
+        return self.add_files(self.document_processor.list_documents(directory_path), source=str(directory_path))
+    
+    def add_files(self, file_paths: List[Path], source: Optional[str] = None) -> int:
+        """Process and add specific files; see add_documents."""
+        self._require_writable()
+        with self.ingestion_lock:
+            return self._add_files(file_paths, source)
+    
+    def _add_files(self, file_paths: List[Path], source: Optional[str]) -> int:
+        progress = self.ingestion_progress
+        progress.update(state="scanning", source=source, files_seen=0, files_pending=0,
+                        pages=0, chunks=0, embeddings=0)
+        
+        pending = {}
+        skipped = 0
+        # (path, digest) pairs written to the manifest only once their content is indexed
+        changed = []
+        
+        for file_path in file_paths:
+            progress["files_seen"] += 1
+            status, digest = self.manifest.check(str(file_path))
+            if status == 'unchanged':
+                skipped += 1
+                continue
+            
+            changed.append((file_path, digest))
+            if self.manifest.has_document(digest) or digest in pending:
+                # Same content already indexed from another path
+                skipped += 1
+                continue
+            pending[digest] = file_path
         
-        # Process documents
-        chunks = self.document_processor.process_directory(directory_path)
-        print(f"Processed {len(chunks)} document chunks")
+        # Stream parsed chunks into the index in bounded batches; each batch
+        # is searchable as soon as it is appended
+        progress.update(state="parsing", files_pending=len(pending))
+        digests = list(pending)
+        chunk_counts = {digest: 0 for digest in digests}
+        indexed = 0
+        batch: List[DocumentChunk] = []
         
-        # Add to vector store
-        self.vector_store.add_documents(chunks)
-        print("Documents added to vector store")
+        def flush():
+            nonlocal indexed, batch
+            progress["state"] = "embedding"
+            offset = indexed
+            self.vector_store.add_documents(
+                batch,
+                before_batch=lambda: self.query_activity.wait_idle(INGESTION_YIELD_MAX_WAIT),
+                on_progress=lambda done: progress.update(embeddings=offset + done)
+            )
+            indexed += len(batch)
+            batch = []
+            progress["state"] = "parsing"
+        
+        try:
+            parsed = self.document_processor.iter_chunks(list(pending.values()))
+            while True:
+                with metrics.stage("ingest", "parse"):
+                    item = next(parsed, None)
+                if item is None:
+                    break
+                owner, task_chunks = item
+                progress["pages"] = self.document_processor.last_run_stats["pages"]
+                for chunk in task_chunks:
+                    chunk.document_id = digests[owner]
+                chunk_counts[digests[owner]] += len(task_chunks)
+                progress["chunks"] += len(task_chunks)
+                batch.extend(task_chunks)
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    flush()
+            if batch:
+                flush()
+        except Exception as e:
+            # The manifest is untouched, so these files count as new or changed on the next run;
+            # drop the batches already indexed so the retry does not duplicate them
+            if indexed:
+                self.vector_store.remove_documents(digests)
+            progress.update(state="idle", files_pending=0, last_error=f"{type(e).__name__}: {e}")
+            raise
+        
+        stale_documents = []
+        for file_path, digest in changed:
+            stale = self.manifest.update(str(file_path), digest)
+            if stale:
+                stale_documents.append(stale)
+        for digest, count in chunk_counts.items():
+            self.manifest.add_document(digest, count)
+        metrics.inc("rag_ingested_files_total", len(pending))
+        metrics.inc("rag_ingested_chunks_total", indexed)
+        print(f"Indexed {indexed} document chunks ({skipped} unchanged files skipped)")
+        
+        # Drop replaced versions only once their replacements are searchable
+        if stale_documents:
+            with metrics.stage("ingest", "remove"):
+                removed = self.vector_store.remove_documents(stale_documents)
+            metrics.inc("rag_removed_chunks_total", removed)
+            print(f"Removed {removed} stale chunks from {len(stale_documents)} changed documents")
+        
+        progress["files_indexed"] += len(pending)
+        progress["chunks_indexed"] += indexed
+        progress.update(state="idle", files_pending=0, last_completed=datetime.now().isoformat(), last_error=None)
+        return len(pending) + len(stale_documents)
     
-    def query(self, user_query: str, top_k: int = 5, threshold: float = 0.3) -> QueryResponse:
-        """Process a user query and return structured response."""
+    def remove_files(self, file_paths: List[Path]) -> int:
+        """Stop tracking files and remove their chunks from the index.
+
+        Content still referenced by another tracked path stays indexed.
+        Returns the number of chunks removed.
+        """
+        self._require_writable()
+        with self.ingestion_lock:
+            digests = [d for d in (self.manifest.forget(str(p)) for p in file_paths) if d]
+            with metrics.stage("ingest", "remove"):
+                removed = self.vector_store.remove_documents(digests)
+            metrics.inc("rag_removed_chunks_total", removed)
+            print(f"Removed {removed} chunks from {len(digests)} documents")
+            return removed
+    
+    def query(self, user_query: str, top_k: int = 5, threshold: float = 0.3, nprobe: Optional[int] = None,
+              ef_search: Optional[int] = None, mode: Optional[str] = None,
+              filters: Optional[Dict[str, Any]] = None, rerank: Optional[bool] = None,
+              rerank_budget_ms: Optional[float] = None) -> QueryResponse:
+        """Process a user query and return structured response.
         
-        # Perform semantic search
-        relevant_chunks = self.vector_store.semantic_search(
-            user_query, 
-            k=top_k, 
-            threshold=threshold
-        )
+        mode selects dense, lexical or hybrid retrieval and filters restricts
+        it by chunk metadata (see VectorStore.search_batch). When the
+        re-ranker is enabled, rerank=False skips it for this request and
+        rerank_budget_ms overrides its latency budget.
+        """
+        if self.cache is None:
+            return self._record_query("query", self._query_uncached(
+                user_query, top_k, threshold, nprobe, ef_search, mode, filters, rerank, rerank_budget_ms))
         
-        if not relevant_chunks:
-            return QueryResponse(
-                answer="No relevant documents found to answer your query.",
-                confidence=0.0,
-                sources=[],
-                reasoning="No documents matched the query criteria.",
-                relevant_clauses=[],
-                domain="unknown",
-                timestamp=datetime.now().isoformat()
+        params = (top_k, threshold, nprobe, ef_search, mode, filter_key(filters), self._use_reranker(rerank))
+        version = self.vector_store.version
+        cached = self._cache_lookup(user_query, params, version)
+        if cached is not None:
+            return self._record_query("query", cached.copy(), cached=True)
+        
+        response = self._query_uncached(user_query, top_k, threshold, nprobe, ef_search, mode, filters,
+                                        rerank, rerank_budget_ms)
+        if not response.reasoning.startswith("Error"):
+            self.cache.put(user_query, params, version, response)
+        return self._record_query("query", response)
+    
+    def _cache_lookup(self, user_query: str, params: Tuple, version: int) -> Optional[QueryResponse]:
+        """Look a query up in the response cache, counting hits and misses."""
+        with metrics.stage("query", "cache_lookup"):
+            cached = self.cache.get(user_query, params, version)
+        metrics.inc("rag_query_cache_total", result="hit" if cached is not None else "miss")
+        return cached
+    
+    def _record_query(self, entry: str, response: QueryResponse, cached: bool = False) -> QueryResponse:
+        """Count a finished query by entry point (query, stream, batch) and outcome."""
+        if cached:
+            outcome = "cached"
+        elif response.reasoning.startswith("Error"):
+            outcome = "error"
+        elif not response.sources:
+            outcome = "no_results"
+        else:
+            outcome = "answered"
+        metrics.inc("rag_queries_total", entry=entry, outcome=outcome)
+        return response
+    
+    def _query_uncached(self, user_query: str, top_k: int, threshold: float, nprobe: Optional[int],
+                        ef_search: Optional[int], mode: Optional[str] = None,
+                        filters: Optional[Dict[str, Any]] = None, rerank: Optional[bool] = None,
+                        rerank_budget_ms: Optional[float] = None) -> QueryResponse:
+        """Run retrieval and generation for a query, bypassing the cache."""
+        
+        # Perform semantic search, over-fetching candidates for the re-ranker
+        with metrics.acquire(self.retrieval_slots, "query", "retrieval_wait"), self.query_activity.track():
+            relevant_chunks = self.vector_store.semantic_search(
+                user_query, 
+                k=self._retrieval_k(top_k, rerank), 
+                threshold=threshold,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                mode=mode,
+                filters=filters
             )
+            relevant_chunks, _ = self._rerank(user_query, relevant_chunks, top_k, rerank, rerank_budget_ms)
+        
+        if not relevant_chunks:
+            return self._no_results_response()
+        
+        return self._generate(user_query, relevant_chunks, top_k)
+    
+    def _use_reranker(self, rerank: Optional[bool]) -> bool:
+        return self.reranker is not None and rerank is not False
+    
+    def _retrieval_k(self, top_k: int, rerank: Optional[bool]) -> int:
+        """Number of first-stage candidates to fetch for a request."""
+        return max(top_k, RERANK_CANDIDATES) if self._use_reranker(rerank) else top_k
+    
+    def _rerank(self, user_query: str, chunks: List[DocumentChunk], top_k: int, rerank: Optional[bool],
+                budget_ms: Optional[float]) -> Tuple[List[DocumentChunk], Optional[Dict[str, Any]]]:
+        """Keep the top_k candidates, re-ranked by the cross-encoder when enabled."""
+        if not self._use_reranker(rerank):
+            return chunks[:top_k], None
+        with metrics.stage("query", "rerank"):
+            return self.reranker.rerank(user_query, chunks, top_k, budget_ms)
+    
+    def _generate(self, user_query: str, relevant_chunks: List[DocumentChunk], top_k: int,
+                  context_cache: Optional[Dict[Any, List[int]]] = None) -> QueryResponse:
+        """Generate the answer for already-retrieved chunks."""
         
         # Prepare context from retrieved chunks
-        context = self._prepare_context(relevant_chunks)
+        context, prompt_tokens = self._prepare_context(user_query, relevant_chunks, context_cache)
         
         # Generate response using LLM
         try:
-            llm_response = self.chain.invoke({
-                "documents": context,
-                "query": user_query
-            })
+            with metrics.acquire(self.llm_slots, "query", "llm_wait"), self.query_activity.track(), \
+                    metrics.stage("query", "generation"):
+                llm_response = self.chain.invoke({
+                    "documents": context,
+                    "query": user_query
+                })
             
             # Extract the answer from the LLM response
             answer = llm_response.content if hasattr(llm_response, 'content') else str(llm_response)
             
-            # Determine confidence based on number of relevant chunks
-            confidence = min(len(relevant_chunks) / top_k, 1.0)
-            
-            # Determine domain based on content analysis
-            domain = self._classify_domain(user_query, answer)
-            
-            # Extract relevant clauses (first few words of each chunk)
-            relevant_clauses = [chunk.content[:100] + "..." for chunk in relevant_chunks[:3]]
-            
-            return QueryResponse(
-                answer=answer,
-                confidence=confidence,
-                sources=[chunk.source for chunk in relevant_chunks],
-                reasoning=f"Found {len(relevant_chunks)} relevant document chunks that match the query.",
-                relevant_clauses=relevant_clauses,
-                domain=domain,
-                timestamp=datetime.now().isoformat()
-            )
+            return self._build_response(user_query, answer, relevant_chunks, top_k, prompt_tokens)
             
         except Exception as e:
             print(f"Error generating response: {e}")
-            return QueryResponse(
-                answer="Error processing your query. Please try again.",
-                confidence=0.0,
-                sources=[chunk.source for chunk in relevant_chunks],
-                reasoning=f"Error occurred during response generation: {str(e)}",
-                relevant_clauses=[],
-                domain="unknown",
-                timestamp=datetime.now().isoformat()
+            return self._error_response(relevant_chunks, e)
+    
+    def query_stream(self, user_query: str, top_k: int = 5, threshold: float = 0.3, nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None, mode: Optional[str] = None,
+                     filters: Optional[Dict[str, Any]] = None, rerank: Optional[bool] = None,
+                     rerank_budget_ms: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Process a user query, yielding events as the answer is generated.
+        
+        Yields a 'sources' event once retrieval finishes, a 'token' event per
+        streamed LLM chunk, and a final 'response' event carrying the full
+        QueryResponse plus time-to-first-token.
+        """
+        start_time = time.perf_counter()
+        
+        params = (top_k, threshold, nprobe, ef_search, mode, filter_key(filters), self._use_reranker(rerank))
+        version = self.vector_store.version
+        cached = self._cache_lookup(user_query, params, version) if self.cache is not None else None
+        if cached is not None:
+            self._record_query("stream", cached, cached=True)
+            yield {"event": "sources", "data": {"sources": cached.sources, "relevant_clauses": cached.relevant_clauses}}
+            yield {"event": "token", "data": cached.answer}
+            yield {
+                "event": "response",
+                "data": {
+                    "response": cached.dict(),
+                    "time_to_first_token_ms": round((time.perf_counter() - start_time) * 1000, 1),
+                    "total_time_ms": round((time.perf_counter() - start_time) * 1000, 1),
+                    "cached": True
+                }
+            }
+            return
+        
+        with metrics.acquire(self.retrieval_slots, "query", "retrieval_wait"), self.query_activity.track():
+            relevant_chunks = self.vector_store.semantic_search(
+                user_query,
+                k=self._retrieval_k(top_k, rerank),
+                threshold=threshold,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                mode=mode,
+                filters=filters
             )
+            relevant_chunks, rerank_info = self._rerank(user_query, relevant_chunks, top_k, rerank, rerank_budget_ms)
+        
+        yield {
+            "event": "sources",
+            "data": {
+                "sources": [chunk.source for chunk in relevant_chunks],
+                "relevant_clauses": [chunk.content[:100] + "..." for chunk in relevant_chunks[:3]],
+                "rerank": rerank_info
+            }
+        }
+        
+        time_to_first_token = None
+        if not relevant_chunks:
+            response = self._no_results_response()
+        else:
+            context, prompt_tokens = self._prepare_context(user_query, relevant_chunks)
+            answer_parts = []
+            # Generation runs on its own thread, which holds the LLM slot only while the LLM
+            # produces tokens; a slow or departed client cannot keep the slot (see _stream_answer)
+            tokens = queue.Queue()
+            cancelled = threading.Event()
+            threading.Thread(target=self._stream_answer, args=(context, user_query, tokens, cancelled),
+                             name="llm-stream", daemon=True).start()
+            try:
+                while True:
+                    token = tokens.get()
+                    if token is None:
+                        break
+                    if isinstance(token, Exception):
+                        raise token
+                    if time_to_first_token is None:
+                        time_to_first_token = time.perf_counter() - start_time
+                        metrics.observe("rag_stage_seconds", time_to_first_token, pipeline="query",
+                                        stage="time_to_first_token")
+                    answer_parts.append(token)
+                    yield {"event": "token", "data": token}
+                
+                response = self._build_response(user_query, "".join(answer_parts), relevant_chunks, top_k,
+                                                prompt_tokens)
+                
+            except Exception as e:
+                print(f"Error generating response: {e}")
+                response = self._error_response(relevant_chunks, e)
+            finally:
+                # Also reached when the client goes away (GeneratorExit at a yield)
+                cancelled.set()
+        
+        if self.cache is not None and not response.reasoning.startswith("Error"):
+            self.cache.put(user_query, params, version, response)
+        self._record_query("stream", response)
+        
+        total_time = time.perf_counter() - start_time
+        if time_to_first_token is not None:
+            print(f"Streamed query: first token {time_to_first_token * 1000:.0f}ms, total {total_time * 1000:.0f}ms")
+        
+        yield {
+            "event": "response",
+            "data": {
+                "response": response.dict(),
+                "time_to_first_token_ms": round(time_to_first_token * 1000, 1) if time_to_first_token is not None else None,
+                "total_time_ms": round(total_time * 1000, 1),
+                "cached": False
+            }
+        }
     
-    def _prepare_context(self, chunks: List[DocumentChunk]) -> str:
-        """Prepare context string from document chunks."""
-        context_parts = []
-        
-        for i, chunk in enumerate(chunks):
-            context_part = f"""
-                Document {i+1}: {chunk.source}{'='*50}
-                Content: {chunk.content}
-            """
-            if chunk.page_number:
-                context_part += f"Page: {chunk.page_number}\n"
-            if chunk.section:
-                context_part += f"Section: {chunk.section}\n"
-            if chunk.metadata:
-                context_part += f"Metadata: {json.dumps(chunk.metadata, indent=2)}\n"
-            
-            context_parts.append(context_part)
+    def _stream_answer(self, context: str, user_query: str, tokens: queue.Queue, cancelled: threading.Event):
+        """Put streamed LLM tokens on a queue, then None, or the exception that ended generation.
         
-        return "\n".join(context_parts)
+        Holds an LLM slot and counts as query activity only while generating,
+        and stops early once cancelled (the client disconnected).
+        """
+        try:
+            with metrics.acquire(self.llm_slots, "query", "llm_wait"), self.query_activity.track(), \
+                    metrics.stage("query", "generation"):
+                if cancelled.is_set():
+                    return
+                stream = self.chain.stream({
+                    "documents": context,
+                    "query": user_query
+                })
+                try:
+                    for token in stream:
+                        if cancelled.is_set():
+                            break
+                        tokens.put(token.content if hasattr(token, 'content') else str(token))
+                finally:
+                    # Ends the LLM request, releasing its pool node
+                    stream.close()
+            tokens.put(None)
+        except Exception as e:
+            tokens.put(e)
+    
+    def _build_response(self, user_query: str, answer: str, relevant_chunks: List[DocumentChunk],
+                        top_k: int, prompt_tokens: Optional[int] = None) -> QueryResponse:
+        """Build the structured response for a generated answer."""
+        # Determine confidence based on number of relevant chunks
+        confidence = min(len(relevant_chunks) / top_k, 1.0)
+        
+        # Determine domain based on content analysis
+        domain = self._classify_domain(user_query, answer)
+        
+        # Extract relevant clauses (first few words of each chunk)
+        relevant_clauses = [chunk.content[:100] + "..." for chunk in relevant_chunks[:3]]
+        
+        return QueryResponse(
+            answer=answer,
+            confidence=confidence,
+            sources=[chunk.source for chunk in relevant_chunks],
+            reasoning=f"Found {len(relevant_chunks)} relevant document chunks that match the query.",
+            relevant_clauses=relevant_clauses,
+            domain=domain,
+            timestamp=datetime.now().isoformat(),
+            prompt_tokens=prompt_tokens
+        )
+    
+    def _no_results_response(self) -> QueryResponse:
+        """Response returned when retrieval finds nothing above the threshold."""
+        return QueryResponse(
+            answer="No relevant documents found to answer your query.",
+            confidence=0.0,
+            sources=[],
+            reasoning="No documents matched the query criteria.",
+            relevant_clauses=[],
+            domain="unknown",
+            timestamp=datetime.now().isoformat()
+        )
+    
+    def _error_response(self, relevant_chunks: List[DocumentChunk], error: Exception) -> QueryResponse:
+        """Response returned when answer generation fails."""
+        return QueryResponse(
+            answer="Error processing your query. Please try again.",
+            confidence=0.0,
+            sources=[chunk.source for chunk in relevant_chunks],
+            reasoning=f"Error occurred during response generation: {str(error)}",
+            relevant_clauses=[],
+            domain="unknown",
+            timestamp=datetime.now().isoformat()
+        )
+    
+    def _prepare_context(self, user_query: str, chunks: List[DocumentChunk],
+                         context_cache: Optional[Dict[Any, List[int]]] = None) -> Tuple[str, int]:
+        """Pack retrieved chunks into the context budget; returns the context and prompt token count.
+        
+        context_cache lets a batch encode the chunks it shares between queries
+        only once.
+        """
+        with metrics.stage("query", "context"):
+            context, packing = self.context_packer.pack(chunks, context_cache)
+        prompt_tokens = (self.prompt_overhead_tokens + packing["context_tokens"]
+                         + self.context_packer.count_tokens(user_query))
+        print(f"Prompt: {prompt_tokens} tokens ({packing['groups_packed']}/{packing['groups']} groups "
+              f"from {packing['chunks']} chunks{', truncated' if packing['truncated'] else ''})")
+        return context, prompt_tokens
+    
+    def _require_writable(self):
+        if self.read_only:
+            raise RuntimeError("This system is a read-only replica; changes must go through the writer")
     
     def save_system(self, filepath: str):
         """Save the entire system state."""
-        self.vector_store.save(filepath)
+        self._require_writable()
+        with self.ingestion_lock, metrics.stage("ingest", "save"):
+            self.vector_store.save(filepath)
+            self.manifest.save(f"{filepath}.manifest.json")
         print(f"System saved to: {filepath}")
     
-    def load_system(self, filepath: str):
-        """Load the system state."""
-        self.vector_store.load(filepath)
+    def load_system(self, filepath: str) -> bool:
+        """Load the system state. Returns True if a saved store was found."""
+        loaded = self.vector_store.load(filepath)
+        
+        # The manifest must describe the loaded index, so start fresh without one
+        self.manifest = IngestionManifest()
+        if loaded and os.path.exists(f"{filepath}.manifest.json"):
+            self.manifest.load(f"{filepath}.manifest.json")
         print(f"System loaded from: {filepath}")
+        return loaded
     
     def get_system_stats(self) -> Dict[str, Any]:
         """Get system statistics."""
         return {
             "vector_store": self.vector_store.get_statistics(),
             "llm_model": self.llm.model,
+            "llm_pool": self.llm.pool.get_statistics() if isinstance(self.llm, PooledLLM) else None,
+            "ingestion": {**self.manifest.get_statistics(), "progress": dict(self.ingestion_progress)},
+            "cache": self.cache.get_statistics() if self.cache is not None else {"enabled": False},
+            "reranker": self.reranker.get_statistics() if self.reranker is not None else {"enabled": False},
             "document_processor": {
                 "chunk_size": self.document_processor.chunk_size,
-                "chunk_overlap": self.document_processor.chunk_overlap
+                "chunk_overlap": self.document_processor.chunk_overlap,
+                "workers": self.document_processor.workers,
+                "last_run": self.document_processor.last_run_stats
             }
         }
     
-    def batch_query(self, queries: List[str]) -> List[QueryResponse]:
-        """Process multiple queries in batch."""
-        responses = []
-        for query in queries:
-            response = self.query(query)
-            responses.append(response)
-        return responses 
+    def batch_query(self, queries: List[str], top_k: int = 5, threshold: float = 0.3,
+                    nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                    mode: Optional[str] = None, filters: Optional[Dict[str, Any]] = None,
+                    rerank: Optional[bool] = None) -> List[QueryResponse]:
+        """Process multiple queries in batch.
+        
+        Cache misses are embedded as one matrix and searched with a single
+        index call; answers are then generated concurrently, bounded by the
+        LLM concurrency limit. A failing query gets an error response without
+        affecting the others.
+        """
+        if len(queries) > MAX_BATCH_SIZE:
+            raise ValueError(f"Batch of {len(queries)} queries exceeds MAX_BATCH_SIZE ({MAX_BATCH_SIZE})")
+        
+        params = (top_k, threshold, nprobe, ef_search, mode, filter_key(filters), self._use_reranker(rerank))
+        version = self.vector_store.version
+        responses: List[Optional[QueryResponse]] = [None] * len(queries)
+        
+        if self.cache is not None:
+            for i, query in enumerate(queries):
+                cached = self._cache_lookup(query, params, version)
+                if cached is not None:
+                    responses[i] = self._record_query("batch", cached.copy(), cached=True)
+        
+        pending = [i for i, response in enumerate(responses) if response is None]
+        if not pending:
+            return responses
+        
+        with metrics.acquire(self.retrieval_slots, "query", "retrieval_wait"), self.query_activity.track():
+            retrieved = self.vector_store.semantic_search_batch(
+                [queries[i] for i in pending],
+                k=self._retrieval_k(top_k, rerank),
+                threshold=threshold,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                mode=mode,
+                filters=filters
+            )
+        
+        # Chunks retrieved by several queries are formatted once
+        context_cache: Dict[Any, List[int]] = {}
+        
+        def answer(i: int, relevant_chunks: List[DocumentChunk]) -> QueryResponse:
+            if not relevant_chunks:
+                return self._no_results_response()
+            try:
+                with metrics.acquire(self.retrieval_slots, "query", "retrieval_wait"), self.query_activity.track():
+                    relevant_chunks, _ = self._rerank(queries[i], relevant_chunks, top_k, rerank, None)
+                return self._generate(queries[i], relevant_chunks, top_k, context_cache)
+            except Exception as e:
+                return self._error_response(relevant_chunks, e)
+        
+        with ThreadPoolExecutor(max_workers=LLM_CONCURRENCY) as executor:
+            results = list(executor.map(answer, pending, retrieved))
+        
+        for i, response in zip(pending, results):
+            responses[i] = self._record_query("batch", response)
+            if self.cache is not None and not response.reasoning.startswith("Error"):
+                self.cache.put(queries[i], params, version, response)
+        
+        return responses
 
     def _classify_domain(self, query: str, answer: str) -> str:
         """Classify the domain based on query and answer content."""
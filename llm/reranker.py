@@ -0,0 +1,81 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from sentence_transformers import CrossEncoder
+from document_processor import DocumentChunk
+from config import RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_BUDGET_MS
+
+class Reranker:
+    """Second-stage re-ranking of retrieved chunks with a small CPU cross-encoder.
+
+    Candidates are scored in batches against a per-request latency budget.
+    If the budget runs out, or the measured cost per pair predicts that it
+    will, the first-stage order is kept instead.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE,
+                 budget_ms: float = RERANK_BUDGET_MS):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.model = CrossEncoder(model_name, device="cpu")
+        # Moving average of scoring cost, used to skip work that cannot finish in time
+        self._ms_per_pair: Optional[float] = None
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "reranked": 0, "over_budget": 0, "skipped": 0, "total_ms": 0.0}
+
+    def rerank(self, query: str, chunks: List[DocumentChunk], top_n: int,
+               budget_ms: Optional[float] = None) -> Tuple[List[DocumentChunk], Dict[str, Any]]:
+        """Return the top_n chunks by cross-encoder score, plus what happened.
+
+        Falls back to chunks[:top_n] (first-stage order) when the budget is
+        exceeded.
+        """
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        start = time.perf_counter()
+        with self._lock:
+            self.stats["requests"] += 1
+            ms_per_pair = self._ms_per_pair
+
+        if len(chunks) <= 1:
+            return chunks[:top_n], {"reranked": False, "reason": "too_few_candidates", "elapsed_ms": 0.0}
+
+        if ms_per_pair is not None and ms_per_pair * len(chunks) > budget_ms:
+            with self._lock:
+                self.stats["skipped"] += 1
+            return chunks[:top_n], {"reranked": False, "reason": "predicted_over_budget", "elapsed_ms": 0.0}
+
+        scores = []
+        for i in range(0, len(chunks), self.batch_size):
+            batch = chunks[i:i + self.batch_size]
+            scores.extend(self.model.predict([(query, chunk.content) for chunk in batch],
+                                             batch_size=self.batch_size, show_progress_bar=False))
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms > budget_ms and len(scores) < len(chunks):
+                self._record(elapsed_ms, len(scores), over_budget=True)
+                return chunks[:top_n], {"reranked": False, "reason": "over_budget", "elapsed_ms": round(elapsed_ms, 1)}
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._record(elapsed_ms, len(scores), over_budget=False)
+        order = np.argsort(-np.asarray(scores), kind='stable')[:top_n]
+        return [chunks[i] for i in order], {"reranked": True, "elapsed_ms": round(elapsed_ms, 1)}
+
+    def _record(self, elapsed_ms: float, pairs: int, over_budget: bool):
+        with self._lock:
+            per_pair = elapsed_ms / pairs
+            self._ms_per_pair = per_pair if self._ms_per_pair is None else 0.8 * self._ms_per_pair + 0.2 * per_pair
+            self.stats["over_budget" if over_budget else "reranked"] += 1
+            self.stats["total_ms"] += elapsed_ms
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get re-ranking counts and latency."""
+        with self._lock:
+            scored = self.stats["reranked"] + self.stats["over_budget"]
+            return {
+                **{k: v for k, v in self.stats.items() if k != "total_ms"},
+                "model": self.model_name,
+                "budget_ms": self.budget_ms,
+                "mean_ms": round(self.stats["total_ms"] / scored, 1) if scored else 0.0,
+                "ms_per_pair": round(self._ms_per_pair, 3) if self._ms_per_pair is not None else None
+            }
@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+from snapshot import snapshot_generation
+from config import SNAPSHOT_POLL_INTERVAL, SNAPSHOT_PUBLISH_INTERVAL, SNAPSHOT_PUBLISH_MAX_PENDING
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+class WriterLock:
+    """Exclusive lock electing the one writer among processes that share a snapshot.
+
+    The lock is an flock on a file, held for the lifetime of the process
+    and released by the OS if it dies, so a restarted worker can take over.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        """Try to take the lock without blocking; returns True if this process is the writer."""
+        if fcntl is None:
+            raise RuntimeError("Shared serving mode needs POSIX file locks (fcntl)")
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+class SnapshotPublisher:
+    """Saves the writer's snapshot after ingestion changes, at most once per interval.
+
+    A save writes a whole generation, so changes are batched: the first one
+    after a quiet interval is published at once, later ones when the
+    interval has passed (by a timer) or max_pending of them have piled up.
+    flush() publishes whatever is left, e.g. on shutdown.
+    """
+
+    def __init__(self, snapshot_path: str, interval: float = SNAPSHOT_PUBLISH_INTERVAL,
+                 max_pending: int = SNAPSHOT_PUBLISH_MAX_PENDING):
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.max_pending = max_pending
+        self.stats = {"publishes": 0, "last_publish": None, "last_error": None}
+        self.pending = 0
+        self._system = None
+        self._last_publish: Optional[float] = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        # Held for the whole save, so two saves never overlap
+        self._publish_lock = threading.Lock()
+
+    def changed(self, system):
+        """Record a change to the system's index and publish it now or schedule it."""
+        with self._lock:
+            self._system = system
+            self.pending += 1
+            wait = 0.0 if self._last_publish is None else self._last_publish + self.interval - time.monotonic()
+            if wait > 0 and self.pending < self.max_pending:
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._publish_on_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """Publish pending changes now, if there are any."""
+        with self._publish_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                pending, system = self.pending, self._system
+                self.pending = 0
+            if not pending:
+                return
+            try:
+                system.save_system(self.snapshot_path)
+            except Exception as e:
+                with self._lock:
+                    self.pending += pending
+                self.stats["last_error"] = str(e)
+                raise
+            with self._lock:
+                self._last_publish = time.monotonic()
+            self.stats["publishes"] += 1
+            self.stats["last_publish"] = datetime.now().isoformat()
+            self.stats["last_error"] = None
+
+    def _publish_on_timer(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error publishing snapshot: {e}")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {"pending_changes": self.pending, "interval": self.interval, "max_pending": self.max_pending,
+                **self.stats}
+
+class SnapshotFollower:
+    """Keeps a read-only system on the newest snapshot generation the writer published.
+
+    Polls where the snapshot path points and loads a new generation when it
+    changes. The store swaps the loaded index in under its reader lock, so
+    each query sees one generation; the old one is unmapped once no query
+    holds it.
+    """
+
+    def __init__(self, system, snapshot_path: str, interval: float = SNAPSHOT_POLL_INTERVAL):
+        self.system = system
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.stats = {"reloads": 0, "failed_reloads": 0, "last_reload": None, "last_error": None}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self) -> bool:
+        """Load the published generation if it differs from the served one; returns True if loaded."""
+        published = snapshot_generation(f"{self.snapshot_path}.snapshot")
+        if published is None or published == self.system.vector_store.generation:
+            return False
+
+        start = time.perf_counter()
+        if not self.system.load_system(self.snapshot_path):
+            # Most likely pruned while being opened; the next poll sees a newer one
+            self.stats["failed_reloads"] += 1
+            self.stats["last_error"] = f"could not load generation {published}"
+            return False
+        self.stats["reloads"] += 1
+        self.stats["last_reload"] = datetime.now().isoformat()
+        print(f"Switched to snapshot generation {self.system.vector_store.generation} "
+              f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="snapshot-follower", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.stats["failed_reloads"] += 1
+                self.stats["last_error"] = str(e)
+                print(f"Error following snapshot: {e}")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            "generation": self.system.vector_store.generation,
+            "published_generation": snapshot_generation(f"{self.snapshot_path}.snapshot"),
+            "poll_interval": self.interval,
+            **self.stats
+        }
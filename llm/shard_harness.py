@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Run several vector store shards on localhost and check them against one store.
+
+Starts shard processes (sharded_store.py serve) on free loopback ports in
+a temporary directory, then:
+  - ingests a synthetic corpus of policy documents into the shards and into
+    a single in-process VectorStore, with the same embeddings
+  - compares search results per retrieval mode (overlap of the top k with
+    the single store's) and per-query latency
+  - removes some documents and checks that none of their chunks come back
+  - adds one more shard, rebalances, and checks that every source sits on
+    its owner, that no chunk was lost and how many chunks moved
+
+Dense results should match the single store exactly with a flat index;
+lexical and hybrid results differ where per-shard BM25 statistics do.
+The embedding model must already be in the local Hugging Face cache;
+tests/test_sharded_store.py covers the same behaviour with injected
+embeddings and in-process shards.
+
+Examples:
+  python shard_harness.py --shards 3 --documents 200 --json shards.json
+  python shard_harness.py --shards 2 --documents 50 --queries 20 --keep
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmark_suite import latency_summary, make_queries, policy_paragraphs
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def start_shard(workdir: Path, index_type: str) -> Dict[str, Any]:
+    """Start one shard process on a free port; returns its address, process and log path."""
+    port = free_port()
+    log = workdir / f"shard_{port}.log"
+    with open(log, "w") as out:
+        process = subprocess.Popen(
+            [sys.executable, str(Path(__file__).with_name("sharded_store.py")), "serve", "--port", str(port),
+             "--data-dir", str(workdir / f"shard_{port}"), "--index-type", index_type],
+            stdout=out, stderr=subprocess.STDOUT, cwd=str(workdir), env={**os.environ, "HF_HUB_OFFLINE": "1"}
+        )
+    return {"address": f"127.0.0.1:{port}", "process": process, "log": str(log)}
+
+def wait_for_shard(shard: Dict[str, Any], timeout: float = 120.0):
+    from sharded_store import ShardClient, ShardError
+    client = ShardClient(shard["address"], timeout=5.0)
+    deadline = time.monotonic() + timeout
+    while True:
+        if shard["process"].poll() is not None:
+            raise RuntimeError(f"Shard {shard['address']} exited, see {shard['log']}")
+        try:
+            client.call("statistics")
+            client.close()
+            return
+        except ShardError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Shard {shard['address']} did not start within {timeout}s")
+            time.sleep(0.2)
+
+def make_chunks(documents: int, seed: int) -> List[Any]:
+    """Chunks of synthetic documents, each document its own source."""
+    from document_processor import DocumentChunk
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(documents):
+        source = f"policy_{i:05d}"
+        for j, paragraph in enumerate(policy_paragraphs(rng, rng.randint(2, 12))):
+            chunks.append(DocumentChunk(content=paragraph, source=source, chunk_id=f"{source}_chunk_{j}",
+                                        section="document", metadata={"type": "txt"}, document_id=f"doc-{i:05d}"))
+    return chunks
+
+def compare(single, sharded, queries: List[str], k: int) -> Dict[str, Any]:
+    """Top-k overlap with the single store and search latency of both, per mode."""
+    results = {}
+    for mode in ("dense", "lexical", "hybrid"):
+        overlaps, single_ms, sharded_ms = [], [], []
+        for query in queries:
+            start = time.perf_counter()
+            expected = single.search(query, k, mode=mode)
+            single_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            found = sharded.search(query, k, mode=mode)
+            sharded_ms.append((time.perf_counter() - start) * 1000)
+            expected_keys = {(chunk.source, chunk.chunk_id) for chunk, _ in expected}
+            found_keys = {(chunk.source, chunk.chunk_id) for chunk, _ in found}
+            if expected_keys:
+                overlaps.append(len(expected_keys & found_keys) / len(expected_keys))
+        results[mode] = {
+            "overlap_at_k": round(sum(overlaps) / max(len(overlaps), 1), 4),
+            "single": latency_summary(single_ms),
+            "sharded": latency_summary(sharded_ms)
+        }
+    return results
+
+def placement(sharded) -> Dict[str, Any]:
+    """Chunks per shard and sources held by a shard other than their owner."""
+    from sharded_store import shard_for
+    names = list(sharded.shards)
+    held = sharded.source_counts()
+    misplaced = sum(1 for name, sources in held.items() for key in sources if shard_for(key, names) != name)
+    return {
+        "chunks_per_shard": {name: sum(sources.values()) for name, sources in held.items()},
+        "misplaced_sources": misplaced
+    }
+
+def run(args, workdir: Path) -> Dict[str, Any]:
+    from sharded_store import ShardedVectorStore
+    from vector_store import VectorStore
+
+    shards = [start_shard(workdir, args.index_type) for _ in range(args.shards)]
+    try:
+        for shard in shards:
+            wait_for_shard(shard)
+        print(f"Started {len(shards)} shards: {', '.join(shard['address'] for shard in shards)}")
+
+        chunks = make_chunks(args.documents, args.seed)
+        single = VectorStore(index_type=args.index_type, use_embedding_cache=False)
+        started = time.perf_counter()
+        embeddings = single.embed_texts([chunk.content for chunk in chunks])
+        embed_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        single.add_documents(chunks, embeddings=embeddings)
+        single_seconds = time.perf_counter() - started
+
+        sharded = ShardedVectorStore([shard["address"] for shard in shards], use_embedding_cache=False,
+                                     shard_list_path=str(workdir / "shards.json"))
+        started = time.perf_counter()
+        sharded.add_documents(chunks, embeddings=embeddings)
+        sharded_seconds = time.perf_counter() - started
+        print(f"Indexed {len(chunks)} chunks: single {single_seconds:.2f}s, sharded {sharded_seconds:.2f}s "
+              f"(embedding {embed_seconds:.2f}s, shared)")
+
+        queries = make_queries(args.queries, seed=args.seed + 1)
+        search = compare(single, sharded, queries, args.k)
+        print("Top-k overlap with the single store: "
+              + ", ".join(f"{mode}={r['overlap_at_k']}" for mode, r in search.items()))
+
+        # Removal reaches whichever shard holds a document
+        removed_ids = [f"doc-{i:05d}" for i in range(0, args.documents, 10)]
+        removed = {"single": single.remove_documents(removed_ids), "sharded": sharded.remove_documents(removed_ids)}
+        leaked = 0
+        for query in queries:
+            for mode in ("dense", "lexical"):
+                leaked += sum(1 for chunk, _ in sharded.search(query, args.k, mode=mode)
+                              if chunk.document_id in removed_ids)
+        removed["returned_after_removal"] = leaked
+        print(f"Removed {removed['sharded']} chunks (single store: {removed['single']}), "
+              f"{leaked} returned afterwards")
+
+        before = placement(sharded)
+        total_before = sum(before["chunks_per_shard"].values())
+        shards.append(start_shard(workdir, args.index_type))
+        wait_for_shard(shards[-1])
+        started = time.perf_counter()
+        moved = sharded.add_shard(shards[-1]["address"])
+        rebalance_seconds = time.perf_counter() - started
+        after = placement(sharded)
+        rebalance = {
+            **moved,
+            "seconds": round(rebalance_seconds, 3),
+            "moved_fraction": round(moved["moved_chunks"] / max(total_before, 1), 4),
+            "expected_fraction": round(1 / len(sharded.shards), 4),
+            "chunks_before": total_before,
+            "chunks_after": sum(after["chunks_per_shard"].values()),
+            "before": before,
+            "after": after
+        }
+        print(f"Added a shard: moved {moved['moved_chunks']} of {total_before} chunks in {rebalance_seconds:.2f}s, "
+              f"{after['misplaced_sources']} sources misplaced")
+        search_after = compare(single, sharded, queries, args.k)
+
+        return {
+            "documents": args.documents,
+            "chunks": len(chunks),
+            "shards": args.shards,
+            "index_type": args.index_type,
+            "k": args.k,
+            "ingest": {"embedding_seconds": round(embed_seconds, 3), "single_seconds": round(single_seconds, 3),
+                       "sharded_seconds": round(sharded_seconds, 3)},
+            "search": search,
+            "removal": removed,
+            "rebalance": rebalance,
+            "search_after_rebalance": search_after,
+            "ok": (search["dense"]["overlap_at_k"] == 1.0 or args.index_type != "flat")
+                  and leaked == 0 and after["misplaced_sources"] == 0
+                  and rebalance["chunks_after"] == rebalance["chunks_before"]
+        }
+    finally:
+        for shard in shards:
+            shard["process"].terminate()
+        for shard in shards:
+            shard["process"].wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run vector store shards on localhost against a single store")
+    parser.add_argument("--shards", type=int, default=3, help="Shards to start with; one more is added (default: 3)")
+    parser.add_argument("--documents", type=int, default=100, help="Synthetic documents (sources) (default: 100)")
+    parser.add_argument("--queries", type=int, default=50, help="Queries per comparison (default: 50)")
+    parser.add_argument("--k", type=int, default=5, help="Chunks retrieved per query (default: 5)")
+    parser.add_argument("--index-type", type=str, default="flat", help="Index type of every store (default: flat)")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus and query seed (default: 0)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary working directory")
+    parser.add_argument("--json", type=str, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    workdir = Path(tempfile.mkdtemp(prefix="rag-shards-"))
+    try:
+        results = run(args, workdir)
+    finally:
+        if args.keep:
+            print(f"Working directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"Result: {'OK' if results['ok'] else 'FAILED'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    sys.exit(0 if results["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
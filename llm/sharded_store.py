@@ -0,0 +1,653 @@
+#!/usr/bin/env python3
+"""
+Vector store partitioned by document source across shard processes.
+
+Each shard is a VectorStore in its own process, served over a
+multiprocessing.connection socket on localhost, or on other interfaces
+once SHARD_AUTHKEY is set to a secret (calls are pickled, so only trusted
+peers may connect). ShardedVectorStore offers the VectorStore interface the RAG
+system uses: it embeds, routes each source to the shard chosen by
+rendezvous hashing, searches all shards in parallel and merges their hits
+into a global top k.
+
+Examples:
+  python sharded_store.py serve --port 7001
+  python sharded_store.py serve --port 7002 --data-dir /var/lib/rag/shard-b
+  SHARD_AUTHKEY=<secret> python sharded_store.py serve --host 0.0.0.0 --port 7003
+  SHARD_ADDRESSES=127.0.0.1:7001,127.0.0.1:7002 python api_server.py
+  python sharded_store.py status --shards 127.0.0.1:7001,127.0.0.1:7002 --json status.json
+  python sharded_store.py rebalance --shards 127.0.0.1:7001,127.0.0.1:7002,127.0.0.1:7003
+
+rebalance (like add_shard and remove_shard) saves the shard list to
+SHARD_LIST_PATH, which coordinators then use instead of SHARD_ADDRESSES.
+"""
+
+import argparse
+import hashlib
+import ipaddress
+import json
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Client, Connection, Listener
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from document_processor import DocumentChunk
+from metadata_filter import source_key
+from snapshot import snapshot_directory
+from vector_store import RETRIEVAL_MODES, VectorStore, reciprocal_rank_fusion
+from metrics import metrics
+from config import (
+    DEFAULT_EMBEDDING_MODEL, DEFAULT_EMBEDDING_DIMENSION, DEFAULT_INDEX_TYPE, EMBEDDING_CACHE_ENABLED,
+    RETRIEVAL_MODE, HYBRID_CANDIDATES, RETRIEVAL_CONCURRENCY,
+    SHARD_ADDRESSES, SHARD_AUTHKEY, DEFAULT_SHARD_AUTHKEY, SHARD_TIMEOUT, SHARD_DATA_DIR, SHARD_MOVE_BATCH,
+    SHARD_LIST_PATH
+)
+
+Hit = Tuple[DocumentChunk, float]
+
+class ShardError(RuntimeError):
+    """A shard could not be reached, timed out or failed a call."""
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def is_loopback(host: str) -> bool:
+    """Whether every address a host name resolves to is a loopback address."""
+    try:
+        return all(ipaddress.ip_address(info[4][0]).is_loopback for info in socket.getaddrinfo(host, None))
+    except (socket.gaierror, ValueError):
+        return False
+
+def shard_for(key: str, shards: List[str]) -> str:
+    """Shard owning a source key (see metadata_filter.source_key), by rendezvous hashing.
+
+    Every shard name is hashed with the key and the highest hash wins, so
+    adding a shard only moves the sources it now wins, about 1/N of them.
+    """
+    return max(shards, key=lambda shard: hashlib.blake2b(f"{shard}\0{key}".encode(), digest_size=8).digest())
+
+def read_shard_list(path) -> Optional[List[str]]:
+    """Shard addresses saved by write_shard_list, or None if there are none."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)["shards"] or None
+    except FileNotFoundError:
+        return None
+
+def write_shard_list(path, addresses: List[str]):
+    """Save the shard list atomically, so a restarted coordinator finds every shard in use."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump({"shards": list(addresses), "updated": datetime.now().isoformat()}, f, indent=2)
+    os.replace(tmp, path)
+
+def _chunk_key(chunk: DocumentChunk) -> Tuple[str, str]:
+    return chunk.source, chunk.chunk_id
+
+def _merge(hit_lists: List[List[Hit]], k: int) -> List[Hit]:
+    """Global top k of per-shard hits by score, keeping one copy of a chunk held by two shards."""
+    merged, seen = [], set()
+    for chunk, score in sorted((hit for hits in hit_lists for hit in hits), key=lambda hit: hit[1], reverse=True):
+        key = _chunk_key(chunk)
+        if key not in seen:
+            seen.add(key)
+            merged.append((chunk, score))
+            if len(merged) == k:
+                break
+    return merged
+
+class ShardService:
+    """One shard: a VectorStore without an encoder, and the calls a coordinator may make on it."""
+
+    CALLS = ("add", "search", "remove_documents", "remove_chunks", "sources", "export_source",
+             "statistics", "save", "load")
+
+    def __init__(self, data_dir: str, index_type: str = DEFAULT_INDEX_TYPE,
+                 dimension: int = DEFAULT_EMBEDDING_DIMENSION):
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.snapshot_path = str(self.data_dir / "vector_store")
+        # Coordinators send embeddings with every add and dense search
+        self.store = VectorStore(dimension=dimension, index_type=index_type, use_embedding_cache=False,
+                                 load_encoder=False)
+
+    def add(self, chunks: List[DocumentChunk], embeddings: np.ndarray) -> Tuple[List[int], int]:
+        return self.store.add_documents(chunks, embeddings=embeddings), self.store.version
+
+    def search(self, queries: List[str], k: int, query_embeddings: Optional[np.ndarray],
+               options: Dict[str, Any]) -> Tuple[List[Tuple[List[Hit], List[Hit]]], int]:
+        """Per-query dense hits (cosine) and lexical hits (BM25 over this shard's score bound, 0-1)."""
+        results = self.store.search_candidates(queries, k, query_embeddings=query_embeddings, **options)
+        with self.store.lock:
+            bounds = [self.store.lexical.score_bound(query) for query in queries]
+        normalized = []
+        for (dense, lexical), bound in zip(results, bounds):
+            normalized.append((dense, [(chunk, score / bound) for chunk, score in lexical] if bound else []))
+        return normalized, self.store.version
+
+    def remove_documents(self, document_ids: List[str]) -> Tuple[int, int]:
+        return self.store.remove_documents(document_ids), self.store.version
+
+    def remove_chunks(self, ids: List[int]) -> Tuple[int, int]:
+        return self.store.remove_chunks(ids), self.store.version
+
+    def sources(self) -> Dict[str, int]:
+        """Chunk count per source key held by this shard."""
+        with self.store.lock:
+            return self.store.metadata_index.value_counts("source")
+
+    def export_source(self, key: str, limit: int) -> Tuple[List[int], List[DocumentChunk], np.ndarray]:
+        """Ids, chunks and stored embeddings of up to limit chunks of a source."""
+        with self.store.lock:
+            ids = self.store.metadata_index.matching_ids({"source": key})
+            ids = [] if ids is None else ids[:limit].tolist()
+            return ids, [self.store.chunks[chunk_id] for chunk_id in ids], self.store.get_vectors(ids)
+
+    def statistics(self) -> Dict[str, Any]:
+        return {**self.store.get_statistics(), "version": self.store.version, "data_dir": str(self.data_dir)}
+
+    def save(self) -> Optional[int]:
+        self.store.save(self.snapshot_path)
+        return self.store.generation
+
+    def load(self) -> bool:
+        """Reload the shard's last saved snapshot, if it has one."""
+        if snapshot_directory(f"{self.snapshot_path}.snapshot") is None:
+            return False
+        return self.store.load(self.snapshot_path)
+
+def _serve_connection(service: ShardService, connection: Connection):
+    with connection:
+        while True:
+            try:
+                method, args = connection.recv()
+            except (EOFError, OSError):
+                return
+            if method not in ShardService.CALLS:
+                reply = ("error", f"Unknown shard call '{method}'")
+            else:
+                try:
+                    reply = ("ok", getattr(service, method)(*args))
+                except Exception as e:
+                    reply = ("error", f"{type(e).__name__}: {e}")
+            try:
+                connection.send(reply)
+            except OSError:
+                return
+
+def serve_shard(address: str, data_dir: str, authkey: bytes = SHARD_AUTHKEY,
+                index_type: str = DEFAULT_INDEX_TYPE, dimension: int = DEFAULT_EMBEDDING_DIMENSION):
+    """Serve a shard until the process is stopped, one thread per coordinator connection.
+
+    Refuses to listen beyond loopback with the default authkey, which would
+    let anyone who can reach the port run code in the shard.
+    """
+    host = parse_address(address)[0]
+    if authkey == DEFAULT_SHARD_AUTHKEY and not is_loopback(host):
+        raise ShardError(f"Refusing to serve on {host} with the default authkey; set SHARD_AUTHKEY to a secret "
+                         f"shared with the coordinators, or bind 127.0.0.1")
+    service = ShardService(data_dir, index_type, dimension)
+    if service.load():
+        print(f"Loaded shard snapshot ({len(service.store.chunks)} chunks)")
+    with Listener(parse_address(address), authkey=authkey) as listener:
+        print(f"Shard serving {data_dir} on {address}")
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                # Failed handshakes (wrong authkey, port scans) must not stop the shard
+                print(f"Rejected shard connection: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(service, connection), name="shard-connection",
+                             daemon=True).start()
+
+class ShardClient:
+    """Calls one shard over a pool of connections.
+
+    Reads wait at most timeout seconds for a reply; writes (adds, removals,
+    saves and loads) wait as long as they take, since giving up would leave
+    the shard's state unknown. A connection whose call failed is dropped.
+    """
+
+    WRITES = ("add", "remove_documents", "remove_chunks", "save", "load")
+
+    def __init__(self, address: str, authkey: bytes = SHARD_AUTHKEY, timeout: float = SHARD_TIMEOUT):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._idle: List[Connection] = []
+        self._lock = threading.Lock()
+
+    def call(self, method: str, *args) -> Any:
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        try:
+            if connection is None:
+                connection = Client(parse_address(self.address), authkey=self.authkey)
+            connection.send((method, args))
+            timeout = None if method in self.WRITES else self.timeout
+            if not connection.poll(timeout):
+                raise ShardError(f"Shard {self.address} did not answer {method} within {timeout}s")
+            status, result = connection.recv()
+        except Exception as e:
+            if connection is not None:
+                connection.close()
+            if isinstance(e, ShardError):
+                raise
+            raise ShardError(f"Shard {self.address} unreachable: {e}") from e
+
+        with self._lock:
+            self._idle.append(connection)
+        if status != "ok":
+            raise ShardError(f"Shard {self.address} failed {method}: {result}")
+        return result
+
+    def close(self):
+        with self._lock:
+            for connection in self._idle:
+                connection.close()
+            self._idle = []
+
+class ShardedVectorStore:
+    """VectorStore interface over shard processes, with chunks partitioned by source.
+
+    Embeddings are computed here, through the embedding cache, and sent with
+    the chunks, so shards never load the model. Searches go to every shard
+    in parallel and each returns its own top k, which are merged into the
+    global top k: cosine scores compare across shards as they are, BM25
+    scores are divided by each shard's score bound for the query (their idf
+    comes from shard statistics), and hybrid mode fuses the merged dense and
+    lexical lists with reciprocal rank fusion like a single store.
+
+    Placement only affects balance: searches and removals reach every shard,
+    so a source stays findable on a shard that no longer owns it. Shards
+    keep their own snapshots in their data directories.
+
+    Adding or removing shards saves the shard list to shard_list_path. When
+    that file exists it takes precedence over addresses, since chunks may
+    have moved onto shards missing from the configured list.
+    """
+
+    def __init__(self, addresses: List[str], model_name: str = DEFAULT_EMBEDDING_MODEL,
+                 dimension: int = DEFAULT_EMBEDDING_DIMENSION, authkey: bytes = SHARD_AUTHKEY,
+                 timeout: float = SHARD_TIMEOUT, use_embedding_cache: bool = EMBEDDING_CACHE_ENABLED,
+                 load_encoder: bool = True, read_only: bool = False,
+                 shard_list_path: Optional[str] = str(SHARD_LIST_PATH)):
+        self.shard_list_path = shard_list_path
+        saved = read_shard_list(shard_list_path) if shard_list_path else None
+        if saved and saved != list(addresses):
+            print(f"Using the shard list saved in {shard_list_path} ({', '.join(saved)}) "
+                  f"instead of {', '.join(addresses) or 'none'}")
+            addresses = saved
+        if not addresses:
+            raise ValueError("A sharded store needs at least one shard address")
+        self.model_name = model_name
+        self.dimension = dimension
+        self.authkey = authkey
+        self.timeout = timeout
+        self.read_only = read_only
+        # Only embeds: it never holds an index
+        self.embedder = VectorStore(model_name, dimension, use_embedding_cache=use_embedding_cache and load_encoder,
+                                    load_encoder=load_encoder)
+        self.embedding_cache = self.embedder.embedding_cache
+        # Replaced, never modified, when shards are added or removed; readers
+        # take it and the pool together under _routing_lock (see _submit)
+        self.shards: Dict[str, ShardClient] = {address: ShardClient(address, authkey, timeout)
+                                               for address in addresses}
+        self.generation: Optional[int] = None
+        # Serialises adds, removals and rebalancing
+        self.write_lock = threading.RLock()
+        self._routing_lock = threading.Lock()
+        self._local_version = 0
+        self._shard_versions: Dict[str, int] = {}
+        # Versions of restarted or removed shards, so the total never goes backwards
+        self._retired_versions = 0
+        self._version_lock = threading.Lock()
+        self._pool = self._new_pool(len(self.shards))
+        # Searches in flight per epoch, so a move can wait out those that started before it (see _move_source)
+        self._search_epoch = 0
+        self._searches: Dict[int, int] = {}
+        self._searches_changed = threading.Condition()
+
+    @staticmethod
+    def _new_pool(shards: int) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=RETRIEVAL_CONCURRENCY * shards, thread_name_prefix="shard")
+
+    def _set_shards(self, shards: Dict[str, ShardClient]):
+        """Switch to a new shard map and a pool sized for it.
+
+        Calls already submitted to the old pool still run; it is shut down
+        without waiting for them.
+        """
+        with self._routing_lock:
+            old_pool = self._pool
+            self.shards, self._pool = shards, self._new_pool(len(shards))
+        old_pool.shutdown(wait=False)
+
+    def _submit(self, method: str, *args) -> Dict[str, Future]:
+        """Start the same call on every shard in parallel."""
+        with self._routing_lock:
+            return {name: self._pool.submit(client.call, method, *args) for name, client in self.shards.items()}
+
+    @contextmanager
+    def _tracked_search(self):
+        with self._searches_changed:
+            epoch = self._search_epoch
+            self._searches[epoch] = self._searches.get(epoch, 0) + 1
+        try:
+            yield
+        finally:
+            with self._searches_changed:
+                self._searches[epoch] -= 1
+                if not self._searches[epoch]:
+                    del self._searches[epoch]
+                    self._searches_changed.notify_all()
+
+    def _wait_for_earlier_searches(self):
+        """Block until every search started before this call has finished (or timed out)."""
+        with self._searches_changed:
+            self._search_epoch += 1
+            epoch = self._search_epoch
+            self._searches_changed.wait_for(lambda: all(started >= epoch for started in self._searches),
+                                            timeout=self.timeout)
+
+    @property
+    def version(self) -> int:
+        """Changes whenever this process or another coordinator changed a shard (as seen in its replies)."""
+        return self._local_version + self._retired_versions + sum(self._shard_versions.values())
+
+    def _record_shard_version(self, name: str, version: int):
+        """Track a shard's reported version, keeping the total from going backwards (the query cache relies on it)."""
+        with self._version_lock:
+            previous = self._shard_versions.get(name, 0)
+            if version < previous:
+                # The shard restarted and counts from zero again
+                self._retired_versions += previous + 1
+            self._shard_versions[name] = version
+
+    def _broadcast(self, method: str, *args) -> Dict[str, Any]:
+        """Make the same call on every shard in parallel; raises ShardError if any fails."""
+        return {name: future.result() for name, future in self._submit(method, *args).items()}
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embedder.embed_query(query)
+
+    def add_documents(self, chunks: List[DocumentChunk], before_batch=None, on_progress=None,
+                      embeddings: Optional[np.ndarray] = None) -> List[int]:
+        """Embed chunks and add each to the shard owning its source; returns shard-local ids."""
+        if not chunks:
+            return []
+        if embeddings is None:
+            embeddings = self.embedder.embed_texts([chunk.content for chunk in chunks], before_batch, on_progress)
+        embeddings = np.asarray(embeddings, dtype='float32')
+
+        with self.write_lock:
+            names = list(self.shards)
+            groups: Dict[str, List[int]] = {}
+            for row, chunk in enumerate(chunks):
+                groups.setdefault(shard_for(source_key(chunk.source), names), []).append(row)
+
+            ids: List[int] = [0] * len(chunks)
+            with metrics.stage("ingest", "index_add"):
+                futures = {name: self._pool.submit(self.shards[name].call, "add", [chunks[row] for row in rows],
+                                                   embeddings[rows])
+                           for name, rows in groups.items()}
+                for name, future in futures.items():
+                    shard_ids, version = future.result()
+                    self._record_shard_version(name, version)
+                    for row, chunk_id in zip(groups[name], shard_ids):
+                        ids[row] = chunk_id
+            self._local_version += 1
+        return ids
+
+    def remove_documents(self, document_ids) -> int:
+        """Remove the given documents' chunks from whichever shards hold them."""
+        document_ids = list(document_ids)
+        if not document_ids:
+            return 0
+        with self.write_lock:
+            removed = 0
+            for name, (count, version) in self._broadcast("remove_documents", document_ids).items():
+                removed += count
+                self._record_shard_version(name, version)
+            self._local_version += 1
+        return removed
+
+    def replace_documents(self, document_ids, chunks: List[DocumentChunk]) -> List[int]:
+        with self.write_lock:
+            self.remove_documents(document_ids)
+            return self.add_documents(chunks)
+
+    def search(self, query: str, k: int = 5, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               mode: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        return self.search_batch([query], k, nprobe=nprobe, ef_search=ef_search, mode=mode, filters=filters)[0]
+
+    def search_batch(self, queries: List[str], k: int = 5, nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None, mode: Optional[str] = None,
+                     threshold: Optional[float] = None, filters: Optional[Dict[str, Any]] = None,
+                     query_embeddings: Optional[np.ndarray] = None) -> List[List[Hit]]:
+        """Search every shard and merge, with the same arguments and scores as VectorStore.search_batch.
+
+        Lexical scores are normalised BM25 (0-1) rather than raw BM25.
+        """
+        mode = mode or RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+        candidates = k * HYBRID_CANDIDATES if mode == "hybrid" else k
+
+        if mode != "lexical" and query_embeddings is None:
+            with metrics.stage("query", "embedding"):
+                query_embeddings = self.embedder.encoder.encode(queries)
+        options = {"nprobe": nprobe, "ef_search": ef_search, "mode": mode, "threshold": threshold,
+                   "filters": filters}
+        with metrics.stage("query", "shard_search"), self._tracked_search():
+            replies = self._broadcast("search", queries, candidates, query_embeddings, options)
+
+        per_shard = []
+        for name, (hits, version) in replies.items():
+            self._record_shard_version(name, version)
+            per_shard.append(hits)
+
+        with metrics.stage("query", "shard_merge"):
+            results = []
+            for i in range(len(queries)):
+                dense = _merge([hits[i][0] for hits in per_shard], candidates)
+                lexical = _merge([hits[i][1] for hits in per_shard], candidates)
+                if mode != "hybrid":
+                    results.append(dense if mode == "dense" else lexical)
+                    continue
+                chunks = {_chunk_key(chunk): chunk for chunk, _ in dense + lexical}
+                fused = reciprocal_rank_fusion([[_chunk_key(chunk) for chunk, _ in dense],
+                                                [_chunk_key(chunk) for chunk, _ in lexical]], k)
+                results.append([(chunks[key], score) for key, score in fused])
+        return results
+
+    def semantic_search(self, query: str, k: int = 5, threshold: float = 0.3, nprobe: Optional[int] = None,
+                        ef_search: Optional[int] = None, mode: Optional[str] = None,
+                        filters: Optional[Dict[str, Any]] = None) -> List[DocumentChunk]:
+        return self.semantic_search_batch([query], k, threshold, nprobe=nprobe, ef_search=ef_search, mode=mode,
+                                          filters=filters)[0]
+
+    def semantic_search_batch(self, queries: List[str], k: int = 5, threshold: float = 0.3,
+                              nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                              mode: Optional[str] = None,
+                              filters: Optional[Dict[str, Any]] = None) -> List[List[DocumentChunk]]:
+        results = self.search_batch(queries, k, nprobe=nprobe, ef_search=ef_search, mode=mode, threshold=threshold,
+                                    filters=filters)
+        return [[chunk for chunk, _ in hits] for hits in results]
+
+    def save(self, filepath: str):
+        """Have every shard save its snapshot in its own data directory; filepath is not used."""
+        with self.write_lock:
+            self._broadcast("save")
+
+    def load(self, filepath: str) -> bool:
+        """Have every shard reload its last saved snapshot. Returns True if the shards hold any chunks.
+
+        A read-only coordinator leaves the shards as they are, since the
+        writer may have changes not saved yet.
+        """
+        try:
+            if not self.read_only:
+                with self.write_lock:
+                    self._broadcast("load")
+                    self._local_version += 1
+            return self.get_statistics()["total_documents"] > 0
+        except ShardError as e:
+            print(f"Error loading sharded store: {e}")
+            return False
+
+    def source_counts(self) -> Dict[str, Dict[str, int]]:
+        """Chunk count per source key, for each shard."""
+        return self._broadcast("sources")
+
+    def _move_source(self, key: str, source: str, target: str, batch_size: int) -> int:
+        """Copy a source's chunks with their stored vectors to target, then drop them from source."""
+        moved = 0
+        while True:
+            ids, chunks, vectors = self.shards[source].call("export_source", key, batch_size)
+            if not ids:
+                return moved
+            # Added before removal, so the chunks stay searchable (merging drops the duplicates).
+            # A search that reached target before the add could reach source after the removal,
+            # so searches started before the add are waited out first
+            self.shards[target].call("add", chunks, vectors)
+            self._wait_for_earlier_searches()
+            self.shards[source].call("remove_chunks", ids)
+            moved += len(ids)
+
+    def rebalance(self, batch_size: int = SHARD_MOVE_BATCH) -> Dict[str, Any]:
+        """Move every source to the shard owning it under the current shard list.
+
+        Nothing is re-embedded: chunks move with their stored vectors, in
+        batches, added to the new owner before they leave the old one.
+        """
+        with self.write_lock:
+            names = list(self.shards)
+            moved_sources = moved_chunks = 0
+            for name, sources in self.source_counts().items():
+                for key in sources:
+                    owner = shard_for(key, names)
+                    if owner != name:
+                        moved_chunks += self._move_source(key, name, owner, batch_size)
+                        moved_sources += 1
+            if moved_chunks:
+                self._local_version += 1
+        print(f"Rebalanced {len(names)} shards: moved {moved_sources} sources ({moved_chunks} chunks)")
+        return {"shards": len(names), "moved_sources": moved_sources, "moved_chunks": moved_chunks}
+
+    def add_shard(self, address: str, batch_size: int = SHARD_MOVE_BATCH) -> Dict[str, Any]:
+        """Start routing to a new shard and move the sources it now owns onto it."""
+        with self.write_lock:
+            if address in self.shards:
+                raise ValueError(f"Shard {address} is already in use")
+            client = ShardClient(address, self.authkey, self.timeout)
+            client.call("statistics")  # fail before routing anything to it
+            self._set_shards({**self.shards, address: client})
+            # Saved before anything moves, so a restart mid-way still searches the new shard
+            self._save_shard_list()
+            return self.rebalance(batch_size)
+
+    def remove_shard(self, address: str, batch_size: int = SHARD_MOVE_BATCH) -> Dict[str, Any]:
+        """Move every source off a shard to its new owner, then stop using the shard."""
+        with self.write_lock:
+            if address not in self.shards:
+                raise ValueError(f"Unknown shard {address}")
+            if len(self.shards) == 1:
+                raise ValueError("Cannot remove the last shard")
+            remaining = [name for name in self.shards if name != address]
+            moved_sources = moved_chunks = 0
+            for key in self.shards[address].call("sources"):
+                moved_chunks += self._move_source(key, address, shard_for(key, remaining), batch_size)
+                moved_sources += 1
+            # Persist the now empty shard so a restart does not bring its chunks back
+            self.shards[address].call("save")
+            client = self.shards[address]
+            self._set_shards({name: other for name, other in self.shards.items() if name != address})
+            self._save_shard_list()
+            client.close()
+            with self._version_lock:
+                self._retired_versions += self._shard_versions.pop(address, 0)
+            self._local_version += 1
+        print(f"Drained shard {address}: moved {moved_sources} sources ({moved_chunks} chunks)")
+        return {"shards": len(remaining), "moved_sources": moved_sources, "moved_chunks": moved_chunks}
+
+    def _save_shard_list(self):
+        if self.shard_list_path and not self.read_only:
+            write_shard_list(self.shard_list_path, list(self.shards))
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Totals over all shards, plus each shard's own statistics (or its error)."""
+        futures = self._submit("statistics")
+        shards, totals = {}, {"total_documents": 0, "index_size": 0, "tombstones": 0}
+        for name, future in futures.items():
+            try:
+                stats = future.result()
+            except ShardError as e:
+                shards[name] = {"error": str(e)}
+                continue
+            shards[name] = stats
+            for key in totals:
+                totals[key] += stats.get(key, 0)
+        return {
+            **totals,
+            "dimension": self.dimension,
+            "model_name": self.model_name,
+            "generation": self.generation,
+            "shards": shards,
+            "unreachable_shards": sorted(name for name, stats in shards.items() if "error" in stats),
+            "embedding_cache": self.embedding_cache.get_statistics() if self.embedding_cache is not None else None
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve, inspect or rebalance vector store shards")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Serve one shard")
+    serve.add_argument("--host", type=str, default="127.0.0.1", help="Address to bind (default: 127.0.0.1)")
+    serve.add_argument("--port", type=int, required=True, help="Port to listen on")
+    serve.add_argument("--data-dir", type=str, help="Snapshot directory (default: backups/shards/<port>)")
+    serve.add_argument("--index-type", type=str, default=DEFAULT_INDEX_TYPE, help="FAISS index type")
+    serve.add_argument("--dimension", type=int, default=DEFAULT_EMBEDDING_DIMENSION,
+                       help=f"Embedding dimension (default: {DEFAULT_EMBEDDING_DIMENSION})")
+    saved = read_shard_list(SHARD_LIST_PATH)
+    for name, description in (("status", "Show per-shard statistics"),
+                              ("rebalance", "Move sources to their owners under the given shard list")):
+        command = commands.add_parser(name, help=description)
+        command.add_argument("--shards", type=str, default=",".join(saved or SHARD_ADDRESSES),
+                             help="Comma-separated shard addresses (default: the saved list, else SHARD_ADDRESSES)")
+        command.add_argument("--json", type=str, help="Write the result as JSON to this file")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            serve_shard(f"{args.host}:{args.port}", args.data_dir or str(SHARD_DATA_DIR / str(args.port)),
+                        index_type=args.index_type, dimension=args.dimension)
+        except ShardError as e:
+            parser.error(str(e))
+        return
+
+    # The given list is used as it is, not replaced by a saved one
+    store = ShardedVectorStore([a.strip() for a in args.shards.split(",") if a.strip()], load_encoder=False,
+                               shard_list_path=None)
+    if args.command == "rebalance":
+        result = store.rebalance()
+        store.save("")
+        write_shard_list(SHARD_LIST_PATH, list(store.shards))
+        print(f"Saved the shard list to {SHARD_LIST_PATH}")
+    else:
+        result = store.get_statistics()
+    print(json.dumps(result, indent=2, default=str))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import json
+import math
+import os
+import shutil
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+import faiss
+import numpy as np
+from document_processor import DocumentChunk
+from chunk_store import ChunkStore
+
+SNAPSHOT_FORMAT = "policyreader-vector-store"
+SNAPSHOT_VERSION = 3
+# Version 1 had no ids column; its chunk ids are the row positions. Version 2
+# may lack the lexical, float vector and filter files (each is rebuilt or
+# skipped when absent) and stores filter values per row instead of postings
+READABLE_VERSIONS = (1, 2, 3)
+
+# Snapshots are published as generations: {path} is a symlink to the current
+# one, {path}.generations/<number>, and is switched with a single rename
+#
+# Snapshot layout (one directory per generation):
+#   snapshot.json                format, version, model info and chunk count
+#   index.faiss                  FAISS index, opened with mmap where supported
+#   <column>.bin / .offsets.npy  UTF-8 strings addressed by int64 offsets
+#   <column>.idx.npy             int32 row -> interned table entry (-1 for None)
+#   ids.npy                      int64 stable chunk ids, ascending (FAISS labels)
+#   page_number.npy, timestamp.npy
+#   offsets.npy                  int64 (start_char, end_char) per row, -1 if unknown
+#   lexical.*                    BM25 postings (see lexical_index.py)
+#   vectors.npy, vectors.ids.npy float32 vectors beside a quantized index (see float_vectors.py)
+#   filter.*                     filter posting lists and sorted dates (see metadata_filter.py)
+
+class StringColumn:
+    """Read-only, memory-mapped sequence of strings stored as one buffer plus offsets."""
+
+    def __init__(self, directory: Path, name: str):
+        self.offsets = np.load(directory / f"{name}.offsets.npy", mmap_mode='r')
+        size = int(self.offsets[-1]) if len(self.offsets) else 0
+        self.buffer = np.memmap(directory / f"{name}.bin", dtype='uint8', mode='r') if size else None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.buffer[start:end].tobytes().decode('utf-8') if end > start else ""
+
+    @staticmethod
+    def write(directory: Path, name: str, values: Sequence[str]):
+        offsets = np.zeros(len(values) + 1, dtype='int64')
+        with open(directory / f"{name}.bin", 'wb') as f:
+            position = 0
+            for i, value in enumerate(values):
+                data = value.encode('utf-8')
+                f.write(data)
+                position += len(data)
+                offsets[i + 1] = position
+        np.save(directory / f"{name}.offsets.npy", offsets)
+
+class InternedColumn:
+    """Read-only column of repeated strings: a StringColumn table plus per-row indices."""
+
+    def __init__(self, directory: Path, name: str):
+        self.table = StringColumn(directory, f"{name}.table")
+        self.indices = np.load(directory / f"{name}.idx.npy", mmap_mode='r')
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        entry = int(self.indices[i])
+        return self.table[entry] if entry >= 0 else None
+
+    @staticmethod
+    def write(directory: Path, name: str, values: Sequence[Optional[str]]):
+        table: Dict[str, int] = {}
+        indices = np.full(len(values), -1, dtype='int32')
+        for i, value in enumerate(values):
+            if value is not None:
+                indices[i] = table.setdefault(value, len(table))
+        StringColumn.write(directory, f"{name}.table", list(table))
+        np.save(directory / f"{name}.idx.npy", indices)
+
+class SnapshotChunks(MutableMapping):
+    """Lazy mapping of chunk id -> DocumentChunk over the rows of a snapshot.
+
+    DocumentChunk objects are only built for rows that are accessed; a
+    bounded cache keeps hot rows stable. Ids are found by binary search over
+    the mapped, ascending ids column. Chunks added after loading are held in
+    an in-memory ChunkStore, and deleted snapshot rows are masked until the
+    next save.
+    """
+
+    def __init__(self, directory: Path, count: int, version: int = SNAPSHOT_VERSION, cache_size: int = 10000):
+        self.count = count
+        self.content = StringColumn(directory, "content")
+        self.chunk_id = StringColumn(directory, "chunk_id")
+        self.source = InternedColumn(directory, "source")
+        self.section = InternedColumn(directory, "section")
+        self.metadata = InternedColumn(directory, "metadata")
+        self.document_id = InternedColumn(directory, "document_id")
+        self.page_number = np.load(directory / "page_number.npy", mmap_mode='r')
+        self.timestamp = np.load(directory / "timestamp.npy", mmap_mode='r')
+        # Absent in snapshots written before chunks recorded their offsets
+        self.offsets = None
+        if (directory / "offsets.npy").exists():
+            self.offsets = np.load(directory / "offsets.npy", mmap_mode='r')
+        if version >= 2:
+            self.ids = np.load(directory / "ids.npy", mmap_mode='r')
+        else:
+            self.ids = np.arange(count, dtype='int64')
+        self.appended = ChunkStore()
+        self.deleted: set = set()
+        self._postings: Optional[Dict[str, np.ndarray]] = None
+        self._cache: "OrderedDict[int, DocumentChunk]" = OrderedDict()
+        self._cache_size = cache_size
+
+    def _row(self, chunk_id: int) -> Optional[int]:
+        row = int(np.searchsorted(self.ids, chunk_id))
+        if row < self.count and int(self.ids[row]) == chunk_id and chunk_id not in self.deleted:
+            return row
+        return None
+
+    def _materialize(self, row: int) -> DocumentChunk:
+        chunk = self._cache.get(row)
+        if chunk is not None:
+            self._cache.move_to_end(row)
+            return chunk
+
+        page_number = int(self.page_number[row])
+        timestamp = float(self.timestamp[row])
+        metadata = self.metadata[row]
+        start_char, end_char = (int(v) for v in self.offsets[row]) if self.offsets is not None else (-1, -1)
+        chunk = DocumentChunk(
+            content=self.content[row],
+            source=self.source[row],
+            chunk_id=self.chunk_id[row],
+            page_number=page_number if page_number >= 0 else None,
+            section=self.section[row],
+            timestamp=datetime.fromtimestamp(timestamp) if not math.isnan(timestamp) else None,
+            metadata=json.loads(metadata) if metadata is not None else {},
+            document_id=self.document_id[row],
+            start_char=start_char if start_char >= 0 else None,
+            end_char=end_char if end_char >= 0 else None
+        )
+        self._cache[row] = chunk
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return chunk
+
+    def __getitem__(self, chunk_id: int) -> DocumentChunk:
+        chunk = self.appended.get(chunk_id)
+        if chunk is not None:
+            return chunk
+        row = self._row(chunk_id)
+        if row is None:
+            raise KeyError(chunk_id)
+        return self._materialize(row)
+
+    def __setitem__(self, chunk_id: int, chunk: DocumentChunk):
+        if self._row(chunk_id) is not None:
+            raise KeyError(f"Chunk id {chunk_id} already exists in the snapshot")
+        self.appended[chunk_id] = chunk
+
+    def __delitem__(self, chunk_id: int):
+        if chunk_id in self.appended:
+            del self.appended[chunk_id]
+            return
+        row = self._row(chunk_id)
+        if row is None:
+            raise KeyError(chunk_id)
+        self.deleted.add(chunk_id)
+        self._cache.pop(row, None)
+
+    def __len__(self) -> int:
+        return self.count - len(self.deleted) + len(self.appended)
+
+    def __iter__(self) -> Iterator[int]:
+        for row in range(self.count):
+            chunk_id = int(self.ids[row])
+            if chunk_id not in self.deleted:
+                yield chunk_id
+        yield from list(self.appended)
+
+    def __contains__(self, chunk_id) -> bool:
+        return chunk_id in self.appended or self._row(chunk_id) is not None
+
+    def snapshot_ids_for_documents(self, document_ids: Iterable[str]) -> List[int]:
+        """Ids of snapshot rows belonging to the given documents.
+
+        Per-document posting lists are built from the interned document_id
+        column on first use, so each lookup costs time proportional to the
+        document rather than the corpus.
+        """
+        if self._postings is None:
+            indices = np.asarray(self.document_id.indices)
+            order = np.argsort(indices, kind='stable')
+            sorted_indices = indices[order]
+            table = self.document_id.table
+            self._postings = {}
+            for entry in range(len(table)):
+                start, end = np.searchsorted(sorted_indices, [entry, entry + 1])
+                self._postings[table[entry]] = order[start:end]
+
+        ids = []
+        for document_id in document_ids:
+            rows = self._postings.pop(document_id, None)
+            if rows is not None:
+                ids.extend(int(self.ids[row]) for row in rows if int(self.ids[row]) not in self.deleted)
+        return ids
+
+def _generation_numbers(generations: Path) -> List[int]:
+    return sorted(int(entry.name) for entry in generations.iterdir() if entry.name.isdigit() and entry.is_dir())
+
+def snapshot_directory(path: str) -> Optional[Path]:
+    """Resolve a snapshot path to the directory of its current generation, or None if absent.
+
+    Open every file of a snapshot through the resolved directory, so that a
+    generation published meanwhile cannot mix into the one being read.
+    """
+    if not os.path.isdir(path):
+        return None
+    return Path(os.path.realpath(path))
+
+def snapshot_generation(path: str) -> Optional[int]:
+    """Generation number path currently points to, without opening it; None if absent or unversioned."""
+    directory = snapshot_directory(path)
+    return int(directory.name) if directory is not None and directory.name.isdigit() else None
+
+def write_snapshot(path: str, index: faiss.Index, chunk_map: Mapping[int, DocumentChunk], info: Dict[str, Any],
+                   lexical=None, vectors=None, metadata=None, keep_generations: int = 3) -> int:
+    """Publish a snapshot as a new generation, switch path to it atomically and return its number.
+    
+    chunk_map maps each stable chunk id (the FAISS label) to its chunk.
+    lexical, if given, is a LexicalIndex written into the same directory,
+    vectors the FloatVectors of a quantized index and metadata the
+    MetadataIndex of the chunks. Processes serving an older generation keep
+    their mapped files even after it is pruned; only the newest
+    keep_generations are left on disk.
+    """
+    if keep_generations < 1:
+        raise ValueError(f"keep_generations must be at least 1, got {keep_generations}")
+    ids = sorted(chunk_map)
+    chunks = [chunk_map[chunk_id] for chunk_id in ids]
+    target = Path(path)
+    generations = target.with_name(target.name + ".generations")
+    generations.mkdir(parents=True, exist_ok=True)
+    for stale in generations.glob("*.tmp"):
+        # Left by an interrupted write
+        shutil.rmtree(stale)
+    generation = (_generation_numbers(generations) or [0])[-1] + 1
+    tmp = generations / f"{generation:06d}.tmp"
+    tmp.mkdir()
+
+    faiss.write_index(index, str(tmp / "index.faiss"))
+    np.save(tmp / "ids.npy", np.array(ids, dtype='int64'))
+    if lexical is not None:
+        lexical.write(tmp)
+    if vectors is not None:
+        vectors.write(tmp)
+    if metadata is not None:
+        metadata.write(tmp)
+
+    StringColumn.write(tmp, "content", [c.content for c in chunks])
+    StringColumn.write(tmp, "chunk_id", [c.chunk_id for c in chunks])
+    InternedColumn.write(tmp, "source", [c.source for c in chunks])
+    InternedColumn.write(tmp, "section", [c.section for c in chunks])
+    InternedColumn.write(tmp, "metadata", [
+        json.dumps(c.metadata, sort_keys=True, default=str) if c.metadata else None for c in chunks
+    ])
+    InternedColumn.write(tmp, "document_id", [getattr(c, 'document_id', None) for c in chunks])
+    np.save(tmp / "page_number.npy", np.array(
+        [c.page_number if c.page_number is not None else -1 for c in chunks], dtype='int32'))
+    np.save(tmp / "timestamp.npy", np.array(
+        [c.timestamp.timestamp() if c.timestamp else np.nan for c in chunks], dtype='float64'))
+    np.save(tmp / "offsets.npy", np.array([
+        (c.start_char if c.start_char is not None else -1, c.end_char if c.end_char is not None else -1)
+        for c in chunks
+    ], dtype='int64').reshape(-1, 2))
+
+    with open(tmp / "snapshot.json", 'w') as f:
+        json.dump({
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "count": len(chunks),
+            "generation": generation,
+            "created": datetime.now().isoformat(),
+            **info
+        }, f, indent=2)
+
+    final = generations / f"{generation:06d}"
+    os.replace(tmp, final)
+    if target.is_dir() and not target.is_symlink():
+        # A snapshot directory written before generations existed
+        shutil.rmtree(target)
+
+    # Renaming a new symlink over the old one switches readers in one step
+    link = target.with_name(target.name + ".link.tmp")
+    if link.is_symlink() or link.exists():
+        link.unlink()
+    os.symlink(os.path.join(generations.name, final.name), link)
+    os.replace(link, target)
+
+    for number in _generation_numbers(generations)[:-keep_generations]:
+        shutil.rmtree(generations / f"{number:06d}")
+    return generation
+
+def read_snapshot(path: str) -> Tuple[faiss.Index, SnapshotChunks, Dict[str, Any], bool]:
+    """Open a snapshot directory.
+
+    Returns the index, a lazy chunk view, the snapshot info and whether the
+    index is a read-only memory map.
+    """
+    directory = snapshot_directory(path) or Path(path)
+    with open(directory / "snapshot.json", 'r') as f:
+        info = json.load(f)
+    if info.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is not a vector store snapshot")
+    if info.get("version") not in READABLE_VERSIONS:
+        raise ValueError(f"Unsupported snapshot version {info.get('version')} (expected one of {READABLE_VERSIONS})")
+
+    index_path = str(directory / "index.faiss")
+    try:
+        # Flat codes can be mapped zero-copy in newer faiss; IVF lists map in all versions
+        flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(index_path, flags)
+        # HNSW graphs are always read into memory
+        mapped = info.get("index_type") in ("flat", "ivf", "sq8", "pq")
+    except RuntimeError:
+        index = faiss.read_index(index_path)
+        mapped = False
+
+    return index, SnapshotChunks(directory, info["count"], info["version"]), info, mapped
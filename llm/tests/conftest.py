@@ -0,0 +1,60 @@
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# The modules import each other by name and config creates its data
+# directories relative to the working directory, as when the servers run from llm/
+LLM_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(LLM_DIR))
+os.chdir(LLM_DIR)
+
+EMBEDDING_DIMENSION = 8
+
+class WhitespaceTokens:
+    """Word-level stand-in for the cl100k encoder, which is downloaded on first use."""
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+class HashingEncoder:
+    """Stand-in for the SentenceTransformer: a unit vector seeded by each text's hash."""
+
+    def encode(self, texts, **settings):
+        vectors = np.array([np.random.default_rng(int(hashlib.sha256(text.encode()).hexdigest()[:8], 16))
+                            .standard_normal(EMBEDDING_DIMENSION) for text in texts], dtype='float32')
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+@pytest.fixture
+def make_system(monkeypatch):
+    """Build IntelligentQuerySystems that need no model downloads.
+
+    Prompts are counted in words, chunks are measured in words and texts
+    are embedded by HashingEncoder; the query cache is off.
+    """
+    import rag_system
+    from document_processor import DocumentProcessor
+    from vector_store import VectorStore
+
+    def hashed_store(**settings):
+        store = VectorStore(dimension=EMBEDDING_DIMENSION, use_embedding_cache=False, load_encoder=False)
+        store.encoder = HashingEncoder()
+        return store
+
+    monkeypatch.setattr(rag_system, "VectorStore", hashed_store)
+    monkeypatch.setattr(DocumentProcessor, "tokenizer", property(lambda self: WhitespaceTokens()))
+    monkeypatch.setattr(DocumentProcessor, "count_tokens", lambda self, texts: [len(text.split()) for text in texts])
+
+    def make(llm=None):
+        from fake_llm import FakeLLM
+        system = rag_system.IntelligentQuerySystem(llm=llm or FakeLLM())
+        system.cache = None
+        system.document_processor.workers = 1
+        return system
+    return make
@@ -0,0 +1,45 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import api_server
+from document_processor import DocumentChunk
+from fake_ollama import start_fake_ollama
+from llm_pool import ollama_pool
+
+@pytest.fixture
+def client(make_system, monkeypatch):
+    """A TestClient over the app with a given system installed, skipping the background boot."""
+    def serve(system):
+        monkeypatch.setattr(api_server, "rag_system", system)
+        return TestClient(api_server.app)
+    return serve
+
+def test_stats_report_llm_pool(make_system, client):
+    server = start_fake_ollama()
+    try:
+        system = make_system(ollama_pool("fake-llm", [server.url], timeout=2.0))
+        system.llm.invoke("## Context: clause 1\n## User Query: covered?")
+        stats = client(system).get("/stats").json()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    nodes = stats["llm_pool"]["nodes"]
+    assert list(nodes) == [server.url]
+    assert nodes[server.url]["state"] == "closed"
+
+def test_metrics_scrapes_reuse_store_statistics(make_system, client):
+    system = make_system()
+    calls = []
+    get_statistics = system.vector_store.get_statistics
+    system.vector_store.get_statistics = lambda: calls.append(1) or get_statistics()
+    http = client(system)
+
+    for _ in range(3):
+        assert "rag_indexed_chunks 0" in http.get("/metrics").text
+    assert len(calls) == 1
+
+    # A change to the index is reflected on the next scrape
+    system.vector_store.add_documents([DocumentChunk(content="clause 1", source="policy", chunk_id="policy_chunk_0")])
+    assert "rag_indexed_chunks 1" in http.get("/metrics").text
+    assert len(calls) == 2
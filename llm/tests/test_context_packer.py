@@ -0,0 +1,47 @@
+from context_packer import ContextPacker, overlap_length
+from document_processor import DocumentChunk
+
+class WordIds:
+    """Word-level tokenizer with integer ids, standing in for cl100k."""
+
+    def __init__(self):
+        self.ids = {}
+        self.words = []
+
+    def encode(self, text):
+        ids = []
+        for word in text.split():
+            if word not in self.ids:
+                self.ids[word] = len(self.words)
+                self.words.append(word)
+            ids.append(self.ids[word])
+        return ids
+
+    def decode(self, ids):
+        return " ".join(self.words[i] for i in ids)
+
+def chunk(n, content, source="policy"):
+    return DocumentChunk(content=content, source=source, chunk_id=f"{source}_{n}")
+
+def test_overlap_length_is_capped():
+    assert overlap_length([1, 2, 3, 4], [3, 4, 5]) == 2
+    assert overlap_length([1, 2, 3, 4], [5, 6]) == 0
+    assert overlap_length([1, 2, 3, 4], [2, 3, 4, 5], limit=2) == 0
+
+def test_pack_merges_overlapping_neighbours_once():
+    packer = ContextPacker(WordIds())
+    first = chunk(0, "Flood damage is excluded. Theft is covered up to the limit.")
+    second = chunk(1, "Theft is covered up to the limit. Claims are due within 30 days.")
+    other = chunk(0, "Theft is covered up to the limit.", source="other")
+    cache = {}
+
+    context, stats = packer.pack([second, first, other], cache)
+    assert stats["groups"] == 2
+    assert context.split("\n\n")[0].endswith(
+        "Flood damage is excluded. Theft is covered up to the limit. Claims are due within 30 days.")
+    assert set(cache) == {("policy", "policy_1"), ("policy", "policy_0"), ("other", "other_0")}
+
+    # A chunk already inside a merged group joins it without adding text
+    inner = chunk(2, "Theft is covered up to the limit.")
+    _, stats = packer.pack([first, second, inner], cache)
+    assert stats["groups"] == 1
@@ -0,0 +1,44 @@
+import string
+
+import pytest
+from transformers import BertTokenizerFast
+
+from document_processor import DocumentProcessor, load_embedding_tokenizer
+
+@pytest.fixture
+def wordpiece(tmp_path):
+    """A WordPiece tokenizer that spells out unknown words letter by letter, so its counts far exceed cl100k's."""
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "the", "policy", "covers", "water", "damage"]
+    vocab += list(string.ascii_lowercase + string.digits + string.punctuation)
+    vocab += [f"##{c}" for c in string.ascii_lowercase + string.digits]
+    path = tmp_path / "vocab.txt"
+    path.write_text("\n".join(vocab))
+    return BertTokenizerFast(vocab_file=str(path))
+
+def make_processor(tokenizer, **settings):
+    processor = DocumentProcessor(workers=1, **settings)
+    processor._embedding_tokenizer = tokenizer
+    return processor
+
+def test_chunks_fit_the_embedding_model(wordpiece):
+    processor = make_processor(wordpiece, chunk_size=60, chunk_overlap=10)
+    sentences = [f"The policy covers water damage under clause {i} and subrogation applies." for i in range(40)]
+    text = " ".join(sentences) + "\n\n" + "unpunctuated tabular " * 200
+    chunks = processor._chunk_text(text, "policy")
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(wordpiece.tokenize(chunk.content)) <= processor.chunk_size
+        assert chunk.content == text[chunk.start_char:chunk.end_char]
+
+def test_count_tokens_excludes_special_tokens(wordpiece):
+    processor = make_processor(wordpiece)
+    assert processor.count_tokens(["the policy covers water damage", ""]) == [5, 0]
+    assert processor.count_tokens([]) == []
+
+def test_bare_model_names_resolve_like_sentence_transformers(monkeypatch):
+    requested = []
+    monkeypatch.setattr("transformers.AutoTokenizer.from_pretrained", lambda name: requested.append(name))
+    load_embedding_tokenizer("all-MiniLM-L6-v2")
+    load_embedding_tokenizer("BAAI/bge-small-en-v1.5")
+    assert requested == ["sentence-transformers/all-MiniLM-L6-v2", "BAAI/bge-small-en-v1.5"]
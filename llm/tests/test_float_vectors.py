@@ -0,0 +1,39 @@
+import numpy as np
+
+from float_vectors import FloatVectors
+
+DIMENSION = 8
+
+def make_vectors(ids):
+    """Vectors whose first component is the id, so rows can be checked by value."""
+    vectors = np.zeros((len(ids), DIMENSION), dtype='float32')
+    vectors[:, 0] = ids
+    return vectors
+
+def test_vectors_added_since_load_share_one_matrix(tmp_path):
+    store = FloatVectors(DIMENSION)
+    store.add(np.arange(0, 100), make_vectors(np.arange(0, 100)))
+    store.remove([3, 50])
+    store.write(tmp_path)
+
+    loaded = FloatVectors.read(tmp_path, DIMENSION)
+    for start in range(100, 3100, 100):
+        loaded.add(np.arange(start, start + 100), make_vectors(np.arange(start, start + 100)))
+    # Out of order batches, as when a store is rebuilt from unsorted ids
+    loaded.add([3200, 3150], make_vectors([3200, 3150]))
+    loaded.remove([7, 2000, 9999])
+
+    assert len(loaded) == 3100 - 2 - 2 + 2
+    assert loaded._vectors.dtype == np.float32 and loaded._vectors.ndim == 2
+    assert loaded.get_statistics()["in_memory_bytes"] < 2 * loaded._size * (DIMENSION * 4 + 8)
+
+    ids = np.array([0, 3, 7, 99, 100, 2000, 3099, 3150, 3200, 5000])
+    found, vectors = loaded.get(ids)
+    assert found.tolist() == [True, False, False, True, True, False, True, True, True, False]
+    assert vectors[:, 0].tolist() == [0, 99, 100, 3099, 3150, 3200]
+
+    ids, vectors = loaded.export()
+    assert np.all(np.diff(ids) > 0) and np.array_equal(vectors[:, 0], ids)
+    compacted = loaded.compacted()
+    assert len(compacted) == len(loaded) and compacted._size == loaded._size - 1
+    assert np.array_equal(compacted.export()[0], ids)
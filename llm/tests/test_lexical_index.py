@@ -0,0 +1,105 @@
+import math
+import time
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from lexical_index import LexicalIndex, tokenize
+
+def make_documents(count, seed=0):
+    """Texts sharing the common term "policy", with random words and a few rare identifiers."""
+    rng = np.random.default_rng(seed)
+    documents = []
+    for i in range(count):
+        words = ["policy"] + [f"word{j}" for j in rng.integers(0, 2000, int(rng.integers(5, 30))).tolist()]
+        if i % 997 == 0:
+            words.append("clause-7b")
+        documents.append(" ".join(words))
+    return documents
+
+def build(documents, start=0, index=None):
+    index = index or LexicalIndex()
+    for chunk_id, text in enumerate(documents, start=start):
+        index.add(chunk_id, LexicalIndex.analyze(text))
+    return index
+
+def brute_force(documents, removed, query, k, allowed=None, k1=1.2, b=0.75):
+    """Reference BM25 over the live documents, with the index's idf (document frequency counts removed ones)."""
+    terms = {chunk_id: Counter(tokenize(text)) for chunk_id, text in documents.items()}
+    live = [chunk_id for chunk_id in terms if chunk_id not in removed]
+    avgdl = sum(sum(terms[chunk_id].values()) for chunk_id in live) / len(live)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(1 for counts in terms.values() if term in counts)
+        if df == 0:
+            continue
+        idf = math.log(1 + (len(live) - df + 0.5) / (df + 0.5))
+        for chunk_id in live:
+            tf = terms[chunk_id].get(term, 0)
+            if tf and (allowed is None or chunk_id in allowed):
+                length = sum(terms[chunk_id].values())
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (k1 + 1) / (
+                    tf + k1 * (1 - b + b * length / avgdl))
+    return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+def assert_same_ranking(found, expected):
+    assert [round(score, 6) for _, score in found] == [round(score, 6) for _, score in expected]
+    assert {chunk_id for chunk_id, _ in found} <= {chunk_id for chunk_id, _ in expected} | {
+        chunk_id for chunk_id, score in found if round(score, 6) == round(expected[-1][1], 6)}
+
+@pytest.mark.parametrize("query", ["policy", "clause-7b policy", "word1 word2 policy", "clause 7b", "nothing"])
+def test_search_matches_brute_force(tmp_path, query):
+    documents = dict(enumerate(make_documents(3000)))
+    base = build([documents[i] for i in range(2000)])
+    base.write(tmp_path)
+
+    # Snapshot postings, chunks added since load, and removals from both
+    index = LexicalIndex.read(tmp_path)
+    build([documents[i] for i in range(2000, 3000)], start=2000, index=index)
+    removed = {5, 997, 1500, 2500, 2991}
+    index.remove(removed)
+    allowed = np.arange(0, 3000, 3, dtype='int64')
+
+    for k in (1, 5, 50):
+        expected = brute_force(documents, removed, query, k)
+        found = index.search(query, k)
+        if not expected:
+            assert found == []
+            continue
+        assert_same_ranking(found, expected)
+        assert not removed & {chunk_id for chunk_id, _ in found}
+        expected = brute_force(documents, removed, query, k, allowed=set(allowed.tolist()))
+        assert_same_ranking(index.search(query, k, allowed), expected)
+
+def query_seconds(index, query, repeats=20):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        index.search(query, 5)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def test_common_term_cost_does_not_follow_corpus_size(tmp_path):
+    documents = make_documents(100000)
+    small, large = tmp_path / "small", tmp_path / "large"
+    small.mkdir()
+    large.mkdir()
+    build(documents[:10000]).write(small)
+    build(documents).write(large)
+    small, large = LexicalIndex.read(small), LexicalIndex.read(large)
+
+    # "policy" is in every chunk; the rare identifier decides the top k
+    query = "policy clause-7b"
+    assert len(large.search(query, 5)) == 5
+    ratio = query_seconds(large, query) / query_seconds(small, query)
+    assert ratio < 3, f"10x the corpus made the query {ratio:.1f}x slower"
+
+def test_snapshot_terms_and_totals_are_read_not_rebuilt(tmp_path):
+    documents = make_documents(500)
+    build(documents).write(tmp_path)
+    index = LexicalIndex.read(tmp_path)
+    # The sorted term column is searched in place
+    assert not isinstance(index._base_terms, dict)
+    build(["clause-9z added later"], start=500, index=index)
+    assert index.get_statistics() == build(documents + ["clause-9z added later"]).get_statistics()
@@ -0,0 +1,148 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from config import LLM_BREAKER_FAILURES
+from fake_ollama import start_fake_ollama
+from llm_pool import ollama_pool
+
+PROMPT = "## Context: clause 4.2 covers water damage.\n## User Query: is water damage covered?"
+
+@pytest.fixture
+def fake_ollama():
+    """Start FakeOllamaServers on loopback ports; they are shut down after the test."""
+    servers = []
+
+    def start(**settings):
+        server = start_fake_ollama(**settings)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def make_pool(servers, timeout=2.0, **options):
+    options.setdefault("retry_delay", 0.0)
+    return ollama_pool("fake-llm", [server.url for server in servers], timeout=timeout, **options)
+
+def node(llm, server):
+    return next(node for node in llm.pool.nodes if node.name == server.url)
+
+def test_least_outstanding_balancing(fake_ollama):
+    servers = [fake_ollama(tokens_per_second=200), fake_ollama(tokens_per_second=200)]
+    llm = make_pool(servers)
+
+    first = llm.pool.stream(PROMPT)
+    next(first)
+    second = llm.pool.stream(PROMPT)
+    next(second)
+    # Each open stream holds one node
+    assert sorted(node.outstanding for node in llm.pool.nodes) == [1, 1]
+
+    list(first)
+    third = llm.pool.stream(PROMPT)
+    next(third)
+    # The node whose stream finished was the least loaded, so both hold one again
+    assert sorted(node.outstanding for node in llm.pool.nodes) == [1, 1]
+    list(second)
+    list(third)
+    assert all(node.outstanding == 0 for node in llm.pool.nodes)
+    assert sorted(server.requests for server in servers) == [1, 2]
+
+def test_concurrent_calls_spread_evenly(fake_ollama):
+    servers = [fake_ollama(first_token_ms=50) for _ in range(3)]
+    llm = make_pool(servers)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        answers = list(pool.map(lambda _: llm.invoke(PROMPT), range(9)))
+    assert all(answers)
+    assert [server.requests for server in servers] == [3, 3, 3]
+
+def test_timeout_fires_on_hanging_server(fake_ollama):
+    hanging = fake_ollama(first_token_ms=10000)
+    llm = make_pool([hanging], timeout=0.3, retry_attempts=1)
+
+    start = time.monotonic()
+    with pytest.raises(Exception) as error:
+        llm.invoke(PROMPT)
+    assert time.monotonic() - start < 3
+    assert "timeout" in type(error.value).__name__.lower()
+    assert node(llm, hanging).stats["timeouts"] == 1
+    assert node(llm, hanging).outstanding == 0
+
+def test_failure_before_first_token_is_retried_on_another_node(fake_ollama):
+    failing, healthy = fake_ollama(error_rate=1.0), fake_ollama()
+    llm = make_pool([failing, healthy], retry_attempts=2, failure_threshold=100)
+
+    for _ in range(10):
+        assert llm.invoke(PROMPT)
+    # Every failed call was retried, and never on the node that failed it
+    assert failing.requests >= 1
+    assert llm.pool.retries == failing.requests
+    assert healthy.requests == 10
+    assert node(llm, failing).stats["failures"] == failing.requests
+
+def test_failure_after_first_token_is_not_retried(fake_ollama):
+    servers = [fake_ollama(error_after_tokens=3), fake_ollama(error_after_tokens=3)]
+    llm = make_pool(servers, retry_attempts=3)
+
+    tokens = []
+    with pytest.raises(Exception, match="injected failure"):
+        for token in llm.pool.stream(PROMPT):
+            tokens.append(token)
+    # A retry would have repeated the tokens already returned
+    assert len(tokens) == 3
+    assert sum(server.requests for server in servers) == 1
+    assert llm.pool.retries == 0
+
+def test_node_ejected_after_consecutive_failures(fake_ollama):
+    failing = fake_ollama(error_rate=1.0)
+    llm = make_pool([failing], retry_attempts=1, cooldown=60.0)
+
+    for _ in range(LLM_BREAKER_FAILURES - 1):
+        with pytest.raises(Exception):
+            llm.invoke(PROMPT)
+    assert node(llm, failing).state == "closed"
+    with pytest.raises(Exception):
+        llm.invoke(PROMPT)
+    assert node(llm, failing).state == "open"
+    assert node(llm, failing).stats["ejections"] == 1
+
+def test_slow_node_ejected(fake_ollama):
+    fast, slow = fake_ollama(), fake_ollama(first_token_ms=300)
+    llm = make_pool([fast, slow], latency_samples=2, slow_factor=3.0, slow_min_seconds=0.1, cooldown=60.0)
+
+    # Concurrent pairs put one call on each node
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        for _ in range(3):
+            assert all(pool.map(lambda _: llm.invoke(PROMPT), range(2)))
+    assert node(llm, slow).state == "open"
+    assert node(llm, fast).state == "closed"
+
+    served = fast.requests
+    for _ in range(3):
+        llm.invoke(PROMPT)
+    assert fast.requests == served + 3
+
+def test_half_open_trial_brings_node_back(fake_ollama):
+    flaky = fake_ollama(error_rate=1.0)
+    llm = make_pool([flaky], retry_attempts=1, failure_threshold=1, cooldown=0.2)
+
+    with pytest.raises(Exception):
+        llm.invoke(PROMPT)
+    assert node(llm, flaky).state == "open"
+
+    # A failed trial ejects the node again at once
+    time.sleep(0.3)
+    with pytest.raises(Exception):
+        llm.invoke(PROMPT)
+    assert node(llm, flaky).state == "open"
+    assert node(llm, flaky).stats["ejections"] == 2
+
+    flaky.error_rate = 0.0
+    time.sleep(0.3)
+    assert llm.invoke(PROMPT)
+    assert node(llm, flaky).state == "closed"
+    assert node(llm, flaky).consecutive_failures == 0
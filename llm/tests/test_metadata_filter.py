@@ -0,0 +1,92 @@
+import math
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from metadata_filter import FILTER_FIELDS, MetadataIndex
+from snapshot import InternedColumn
+
+def make_entries(count, seed=0):
+    """(id, (fields, timestamp)) pairs with a handful of repeated values per field."""
+    rng = np.random.default_rng(seed)
+    entries = []
+    for chunk_id in range(count):
+        fields = {
+            "source": f"policy_{int(rng.integers(0, 20))}",
+            "section": ["document", "email", None][int(rng.integers(0, 3))],
+            "type": ["pdf", "docx", "email"][int(rng.integers(0, 3))],
+            "domain": ["insurance", "legal", None][int(rng.integers(0, 3))]
+        }
+        date = math.nan if chunk_id % 7 == 0 else datetime(2024, 1, 1).timestamp() + 86400 * int(rng.integers(0, 365))
+        entries.append((chunk_id, (fields, date)))
+    return entries
+
+def build(entries):
+    index = MetadataIndex()
+    for chunk_id, entry in entries:
+        index.add(chunk_id, entry)
+    return index
+
+FILTERS = [
+    {"source": "policy_3"},
+    {"source": ["policy_1", "policy_19"], "type": "pdf"},
+    {"section": "email", "domain": "legal"},
+    {"date_from": datetime(2024, 3, 1), "date_to": "2024-06-30T00:00:00"},
+    {"type": "docx", "date_from": datetime(2024, 10, 1).timestamp()},
+    {"source": "unknown"}
+]
+
+def write_legacy(directory, ids, entries):
+    """Per-row filter columns, as version 2 snapshots stored them."""
+    np.save(directory / "ids.npy", np.array(ids, dtype='int64'))
+    for field in FILTER_FIELDS:
+        InternedColumn.write(directory, f"filter.{field}", [fields[field] for _, (fields, _) in entries])
+    np.save(directory / "filter.date.npy", np.array([date for _, (_, date) in entries], dtype='float64'))
+
+@pytest.mark.parametrize("layout", ["postings", "legacy"])
+def test_snapshot_postings_match_in_memory_index(tmp_path, layout):
+    entries = make_entries(2000)
+    removed = [3, 500, 1999]
+    if layout == "postings":
+        build(entries[:1500]).write(tmp_path)
+    else:
+        write_legacy(tmp_path, range(1500), entries[:1500])
+
+    # Snapshot postings, chunks added since load, and removals from both
+    index = MetadataIndex.read(tmp_path)
+    for chunk_id, entry in entries[1500:]:
+        index.add(chunk_id, entry)
+    index.remove(removed)
+    expected = build([(chunk_id, entry) for chunk_id, entry in entries if chunk_id not in removed])
+
+    for filters in FILTERS:
+        assert np.array_equal(index.matching_ids(filters), expected.matching_ids(filters))
+    assert index.value_counts("source") == expected.value_counts("source")
+    assert index.get_statistics() == expected.get_statistics()
+
+    # Written again, the merged postings load unchanged
+    rewritten = tmp_path / "rewritten"
+    rewritten.mkdir()
+    index.write(rewritten)
+    reloaded = MetadataIndex.read(rewritten)
+    for filters in FILTERS:
+        assert np.array_equal(reloaded.matching_ids(filters), expected.matching_ids(filters))
+
+def test_snapshot_without_filters(tmp_path):
+    assert MetadataIndex.read(tmp_path) is None
+
+def test_dates_stay_correct_across_interleaved_changes():
+    entries = make_entries(600, seed=1)
+    index = build(entries[:300])
+    date_filter = FILTERS[3]
+    index.matching_ids(date_filter)
+
+    # Removals and adds after a lookup are only applied to the sorted dates on the next one
+    index.remove(range(0, 300, 3))
+    for chunk_id, entry in entries[300:]:
+        index.add(chunk_id, entry)
+    index.remove([301, 599])
+    live = [(chunk_id, entry) for chunk_id, entry in entries
+            if not (chunk_id < 300 and chunk_id % 3 == 0) and chunk_id not in (301, 599)]
+    assert np.array_equal(index.matching_ids(date_filter), build(live).matching_ids(date_filter))
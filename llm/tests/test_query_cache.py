@@ -0,0 +1,20 @@
+from query_cache import QueryCache
+
+PARAMS = (5, 0.3, None, None, "dense", None, False)
+
+def test_stale_put_after_version_bump_is_dropped():
+    cache = QueryCache()
+    cache.put("What is the deductible?", PARAMS, 1, "old answer")
+    assert cache.get("what is the deductible", PARAMS, 1) == "old answer"
+
+    # An ingest bumps the version and a fresh answer is cached
+    cache.put("Is flood covered?", PARAMS, 2, "new answer")
+    assert cache.get("What is the deductible?", PARAMS, 2) is None
+
+    # A slow query computed against version 1 finishes afterwards
+    cache.put("What is the deductible?", PARAMS, 1, "stale answer")
+    assert cache.get("Is flood covered?", PARAMS, 2) == "new answer"
+    assert cache.get("What is the deductible?", PARAMS, 2) is None
+    assert cache.get("Is flood covered?", PARAMS, 1) is None
+    stats = cache.get_statistics()
+    assert stats["stale_puts"] == 1 and stats["entries"] == 1
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+import rag_system
+from document_processor import DocumentChunk
+from fake_llm import FakeLLM
+
+def add_policy_chunks(system):
+    chunks = [DocumentChunk(content=f"Clause {i}: water damage is covered up to {i}000 dollars.",
+                            source=f"policy_{i}", chunk_id=f"policy_{i}_chunk_0") for i in range(5)]
+    system.vector_store.add_documents(chunks)
+    return system
+
+def llm_slots_free(system, timeout=2.0):
+    """Whether every LLM slot can be taken within the timeout (they are given back at once)."""
+    taken = 0
+    try:
+        while taken < rag_system.LLM_CONCURRENCY:
+            if not system.llm_slots.acquire(timeout=timeout):
+                return False
+            taken += 1
+        return True
+    finally:
+        for _ in range(taken):
+            system.llm_slots.release()
+
+def stream(system):
+    return system.query_stream("is water damage covered", mode="lexical")
+
+def test_slow_reader_does_not_hold_llm_slot(make_system):
+    system = add_policy_chunks(make_system(FakeLLM(answer_words=40)))
+    events = stream(system)
+    assert next(events)["event"] == "sources"
+    first = next(events)
+    assert first["event"] == "token"
+
+    # The reader is paused at a token, but generation has finished and let go of its slot
+    assert llm_slots_free(system)
+    assert system.query_activity.active == 0
+
+    rest = list(events)
+    answer = first["data"] + "".join(event["data"] for event in rest if event["event"] == "token")
+    assert rest[-1]["event"] == "response"
+    assert rest[-1]["data"]["response"]["answer"] == answer
+
+def test_disconnect_stops_generation_and_frees_slot(make_system):
+    system = add_policy_chunks(make_system(FakeLLM(tokens_per_second=20, answer_words=200)))
+    events = stream(system)
+    next(events)
+    next(events)
+    start = time.monotonic()
+    events.close()
+
+    # The remaining ~10 seconds of tokens are never generated
+    assert llm_slots_free(system)
+    assert time.monotonic() - start < 1.0
+    deadline = time.monotonic() + 2.0
+    while system.query_activity.active and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert system.query_activity.active == 0
+    assert not any(thread.name == "llm-stream" and thread.is_alive() for thread in threading.enumerate())
+
+def write_email(path, body):
+    path.write_text(f"From: claims@example.com\nSubject: Claim\nDate: Mon, 1 Jul 2024 10:00:00 +0000\n\n{body}\n")
+    return path
+
+def test_failed_indexing_leaves_files_to_retry(make_system, tmp_path):
+    system = make_system()
+    email = write_email(tmp_path / "claim.eml", "Water damage to the roof was reported on 1 July. " * 5)
+    add = system.vector_store.add_documents
+    failures = [RuntimeError("disk full")]
+
+    def fail_once(*args, **kwargs):
+        if failures:
+            raise failures.pop()
+        return add(*args, **kwargs)
+
+    system.vector_store.add_documents = fail_once
+    with pytest.raises(RuntimeError):
+        system.add_files([email])
+    assert system.manifest.get_statistics()["tracked_files"] == 0
+    assert system.ingestion_progress["state"] == "idle"
+    assert "disk full" in system.ingestion_progress["last_error"]
+
+    # The retry indexes the file rather than skipping it as unchanged
+    assert system.add_files([email]) == 1
+    assert len(system.vector_store.chunks) == system.manifest.get_statistics()["indexed_chunks"] > 0
+    assert system.ingestion_progress["last_error"] is None
+    assert system.add_files([email]) == 0
+
+def test_failure_partway_drops_indexed_batches(make_system, tmp_path, monkeypatch):
+    system = make_system()
+    monkeypatch.setattr(rag_system, "INGEST_BATCH_SIZE", 1)
+    emails = [write_email(tmp_path / f"claim_{i}.eml", f"Claim {i} covers storm damage to the garage.")
+              for i in range(3)]
+    add = system.vector_store.add_documents
+    calls = []
+
+    def fail_third(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 3:
+            raise RuntimeError("embedding server down")
+        return add(*args, **kwargs)
+
+    system.vector_store.add_documents = fail_third
+    with pytest.raises(RuntimeError):
+        system.add_files(emails)
+    # Two files' chunks were searchable before the failure; none are left untracked
+    assert len(system.vector_store.chunks) == 0
+
+    system.vector_store.add_documents = add
+    assert system.add_files(emails) == 3
+    assert len(system.vector_store.chunks) == 3
@@ -0,0 +1,40 @@
+import time
+
+from serving import SnapshotPublisher
+
+class CountingSystem:
+    def __init__(self):
+        self.saves = []
+
+    def save_system(self, filepath):
+        self.saves.append(filepath)
+
+def test_publisher_batches_changes_within_interval():
+    system = CountingSystem()
+    publisher = SnapshotPublisher("snap", interval=0.3, max_pending=100)
+    publisher.changed(system)
+    assert len(system.saves) == 1
+
+    # Later jobs inside the interval wait for the timer instead of each saving
+    for _ in range(5):
+        publisher.changed(system)
+    assert len(system.saves) == 1 and publisher.pending == 5
+
+    deadline = time.monotonic() + 5
+    while len(system.saves) < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert system.saves == ["snap", "snap"] and publisher.pending == 0
+
+def test_publisher_saves_after_max_pending_and_on_flush():
+    system = CountingSystem()
+    publisher = SnapshotPublisher("snap", interval=3600, max_pending=3)
+    for _ in range(4):
+        publisher.changed(system)
+    # The first change publishes at once, the next three fill the batch
+    assert len(system.saves) == 2
+
+    publisher.changed(system)
+    publisher.flush()
+    publisher.flush()
+    assert len(system.saves) == 3
+    assert publisher.get_statistics()["publishes"] == 3
@@ -0,0 +1,147 @@
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from document_processor import DocumentChunk
+from sharded_store import ShardClient, ShardError, ShardedVectorStore, serve_shard, shard_for
+from vector_store import VectorStore
+
+DIMENSION = 32
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+@pytest.fixture
+def start_shard(tmp_path):
+    """Serve shards on loopback ports from daemon threads; returns their addresses."""
+    def start():
+        address = f"127.0.0.1:{free_port()}"
+        threading.Thread(target=serve_shard, args=(address, str(tmp_path / address.replace(":", "_"))),
+                         kwargs={"index_type": "flat", "dimension": DIMENSION}, daemon=True).start()
+        client = ShardClient(address, timeout=5.0)
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                client.call("statistics")
+                client.close()
+                return address
+            except ShardError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+    return start
+
+def make_corpus(documents, seed=0):
+    """Chunks of synthetic documents, each its own source, with random unit embeddings."""
+    rng = np.random.default_rng(seed)
+    words = ["water", "damage", "fire", "theft", "premium", "deductible", "claim", "flood", "roof", "vehicle"]
+    chunks = []
+    for i in range(documents):
+        for j in range(int(rng.integers(2, 6))):
+            text = " ".join(rng.choice(words, 8)) + f" clause {i}.{j}"
+            chunks.append(DocumentChunk(content=text, source=f"policy_{i:03d}", chunk_id=f"policy_{i:03d}_chunk_{j}",
+                                        section="document", metadata={"type": "txt"}, document_id=f"doc-{i:03d}"))
+    vectors = rng.standard_normal((len(chunks), DIMENSION)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return chunks, vectors
+
+def make_sharded(addresses, tmp_path):
+    return ShardedVectorStore(addresses, dimension=DIMENSION, use_embedding_cache=False, load_encoder=False,
+                              shard_list_path=str(tmp_path / "shards.json"))
+
+def keys(hits):
+    return [(chunk.source, chunk.chunk_id) for chunk, _ in hits]
+
+def placement(store):
+    names = list(store.shards)
+    held = store.source_counts()
+    misplaced = sum(1 for name, sources in held.items() for key in sources if shard_for(key, names) != name)
+    return sum(sum(sources.values()) for sources in held.values()), misplaced
+
+def test_dense_search_matches_single_store(start_shard, tmp_path):
+    chunks, vectors = make_corpus(60)
+    sharded = make_sharded([start_shard() for _ in range(3)], tmp_path)
+    sharded.add_documents(chunks, embeddings=vectors)
+    single = VectorStore(dimension=DIMENSION, index_type="flat", use_embedding_cache=False, load_encoder=False)
+    single.add_documents(chunks, embeddings=vectors)
+
+    # Every shard holds part of the corpus
+    held = sharded.source_counts()
+    assert len(held) == 3 and all(held.values())
+    assert sum(sum(sources.values()) for sources in held.values()) == len(chunks)
+
+    queries = vectors[:10] + 0.1
+    expected = single.search_batch(["q"] * 10, k=5, mode="dense", query_embeddings=queries)
+    found = sharded.search_batch(["q"] * 10, k=5, mode="dense", query_embeddings=queries)
+    assert [keys(hits) for hits in found] == [keys(hits) for hits in expected]
+
+    lexical = sharded.search("flood clause", k=5, mode="lexical")
+    assert lexical and all(0 < score <= 1 for _, score in lexical)
+
+def test_removed_documents_not_returned(start_shard, tmp_path):
+    chunks, vectors = make_corpus(40)
+    sharded = make_sharded([start_shard() for _ in range(2)], tmp_path)
+    sharded.add_documents(chunks, embeddings=vectors)
+
+    removed = [f"doc-{i:03d}" for i in range(0, 40, 4)]
+    assert sharded.remove_documents(removed) == sum(1 for chunk in chunks if chunk.document_id in removed)
+    results = sharded.search_batch(["q"] * len(vectors), k=5, mode="dense", query_embeddings=vectors)
+    assert not any(chunk.document_id in removed for hits in results for chunk, _ in hits)
+
+def test_add_shard_rebalances_and_saves_shard_list(start_shard, tmp_path):
+    chunks, vectors = make_corpus(60)
+    addresses = [start_shard() for _ in range(2)]
+    sharded = make_sharded(addresses, tmp_path)
+    sharded.add_documents(chunks, embeddings=vectors)
+
+    added = start_shard()
+    moved = sharded.add_shard(added)
+    total, misplaced = placement(sharded)
+    assert moved["moved_chunks"] > 0
+    assert total == len(chunks) and misplaced == 0
+
+    # A coordinator restarted with the old addresses still reaches the new shard
+    restarted = make_sharded(addresses, tmp_path)
+    assert list(restarted.shards) == addresses + [added]
+    assert restarted.get_statistics()["total_documents"] == len(chunks)
+
+    sharded.remove_shard(addresses[0])
+    total, misplaced = placement(sharded)
+    assert total == len(chunks) and misplaced == 0
+    assert list(make_sharded(addresses, tmp_path).shards) == [addresses[1], added]
+
+def test_searches_run_while_a_shard_is_added(start_shard, tmp_path):
+    chunks, vectors = make_corpus(80)
+    sharded = make_sharded([start_shard() for _ in range(2)], tmp_path)
+    sharded.add_documents(chunks, embeddings=vectors)
+
+    errors, stop = [], threading.Event()
+
+    def search():
+        while not stop.is_set():
+            try:
+                hits = sharded.search_batch(["q"], k=5, mode="dense", query_embeddings=vectors[:1])[0]
+                assert keys(hits)[0] == (chunks[0].source, chunks[0].chunk_id)
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=search) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        sharded.add_shard(start_shard(), batch_size=4)
+        sharded.add_shard(start_shard(), batch_size=4)
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+    assert errors == []
+
+def test_shard_refuses_public_bind_with_default_authkey(tmp_path):
+    with pytest.raises(ShardError, match="default authkey"):
+        serve_shard("0.0.0.0:0", str(tmp_path / "shard"))
@@ -0,0 +1,26 @@
+import faiss
+import pytest
+
+from document_processor import DocumentChunk
+from snapshot import SNAPSHOT_VERSION, read_snapshot, write_snapshot
+
+def publish(path, keep_generations):
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(4))
+    chunks = {0: DocumentChunk(content="clause 1", source="policy", chunk_id="policy_chunk_0")}
+    return write_snapshot(str(path), index, chunks, {"model_name": "test", "dimension": 4},
+                          keep_generations=keep_generations)
+
+@pytest.mark.parametrize("keep_generations", [1, 2])
+def test_only_newest_generations_kept(tmp_path, keep_generations):
+    for _ in range(4):
+        generation = publish(tmp_path / "store.snapshot", keep_generations)
+    kept = sorted(entry.name for entry in (tmp_path / "store.snapshot.generations").iterdir())
+    assert kept == [f"{number:06d}" for number in range(generation - keep_generations + 1, generation + 1)]
+    _, chunks, info, _ = read_snapshot(str(tmp_path / "store.snapshot"))
+    assert info["version"] == SNAPSHOT_VERSION and chunks[0].content == "clause 1"
+
+def test_keeping_no_generation_is_refused(tmp_path):
+    # [:-0] would prune nothing rather than everything
+    with pytest.raises(ValueError, match="keep_generations"):
+        publish(tmp_path / "store.snapshot", 0)
+    assert not (tmp_path / "store.snapshot").exists()
@@ -0,0 +1,86 @@
+import faiss
+import numpy as np
+import pytest
+
+from document_processor import DocumentChunk
+from vector_store import VectorStore
+
+DIMENSION = 32
+CHUNKS_PER_DOCUMENT = 10
+
+def make_corpus(count, seed=0):
+    """Chunks of synthetic documents with random unit embeddings."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, DIMENSION)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    chunks = [DocumentChunk(content=f"clause {i} of policy {i // CHUNKS_PER_DOCUMENT}",
+                            source=f"policy_{i // CHUNKS_PER_DOCUMENT}", chunk_id=f"chunk_{i}",
+                            document_id=f"doc-{i // CHUNKS_PER_DOCUMENT}")
+              for i in range(count)]
+    return chunks, vectors
+
+def make_store(index_type, chunks, vectors):
+    store = VectorStore(dimension=DIMENSION, index_type=index_type, use_embedding_cache=False, load_encoder=False)
+    store.add_documents(chunks, embeddings=vectors)
+    return store
+
+def recall_at_k(store, vectors, live, queries, k=10):
+    """Fraction of the exact top k among the live ids that the store's search returns."""
+    _, labels = store.search_vectors(queries, k)
+    exact = np.argsort(-(queries @ vectors[live].T), axis=1)[:, :k]
+    expected = live[exact]
+    return np.mean([len(set(found) & set(truth)) / k for found, truth in zip(labels.tolist(), expected.tolist())])
+
+@pytest.mark.parametrize("index_type", ["ivf", "hnsw"])
+def test_recall_kept_after_removal(index_type):
+    chunks, vectors = make_corpus(4000)
+    store = make_store(index_type, chunks, vectors)
+    queries = make_corpus(50, seed=1)[1]
+    live = np.arange(len(chunks))
+    before = recall_at_k(store, vectors, live, queries)
+
+    # Tombstones make every search pass explicit parameters
+    assert store.remove_documents(["doc-0"]) == CHUNKS_PER_DOCUMENT
+    assert store._search_params() is not None
+    live = live[CHUNKS_PER_DOCUMENT:]
+    after = recall_at_k(store, vectors, live, queries)
+    assert after >= before - 0.02
+
+def test_search_params_keep_index_settings():
+    chunks, vectors = make_corpus(4000)
+    store = make_store("ivf", chunks, vectors)
+    store.remove_documents(["doc-0"])
+    assert store._search_params().nprobe == store.index.nprobe
+    assert store._search_params(nprobe=3).nprobe == 3
+
+    store = make_store("hnsw", chunks, vectors)
+    store.remove_documents(["doc-0"])
+    assert store._search_params().efSearch == store._hnsw().efSearch
+    assert store._search_params(ef_search=8).efSearch == 8
+
+def test_removed_documents_are_not_returned():
+    chunks, vectors = make_corpus(500)
+    store = make_store("flat", chunks, vectors)
+    store.remove_documents(["doc-3"])
+    results = store.search_batch(["unused"], k=5, mode="dense", query_embeddings=vectors[30:40])
+    assert all(chunk.document_id != "doc-3" for hits in results for chunk, _ in hits)
+
+@pytest.mark.parametrize("index_type", ["ivf", "pq"])
+def test_quantizer_retrained_as_corpus_grows(index_type, tmp_path, monkeypatch):
+    # PQ_M must divide the test dimension
+    monkeypatch.setattr("vector_store.PQ_M", 8)
+    chunks, vectors = make_corpus(4000)
+    store = make_store(index_type, chunks[:100], vectors[:100])
+    assert store.trained_on == 100
+    for start in range(100, 4000, 100):
+        store.add_documents(chunks[start:start + 100], embeddings=vectors[start:start + 100])
+
+    # Retrained at 400 and 1600 chunks, not left with the first batch's 2 lists or 6 bits
+    assert store.trained_on == 1600
+    if index_type == "ivf":
+        assert store.index.nlist == 1600 // 39
+    else:
+        assert faiss.downcast_index(store.index.index).pq.nbits == 8
+    store.save(str(tmp_path / "store"))
+    loaded = VectorStore(dimension=DIMENSION, use_embedding_cache=False, load_encoder=False)
+    assert loaded.load(str(tmp_path / "store")) and loaded.trained_on == 1600
@@ -1,123 +1,774 @@
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Callable, Iterable
 import pickle
 import os
+import threading
 from document_processor import DocumentChunk
+from embedding_cache import EmbeddingCache
+from snapshot import SnapshotChunks, write_snapshot, read_snapshot, snapshot_directory
+from chunk_store import ChunkStore
+from lexical_index import LexicalIndex
+from metadata_filter import MetadataIndex, chunk_fields
+from float_vectors import FloatVectors, rescore
+from metrics import metrics
+from config import (
+    DEFAULT_INDEX_TYPE, ANN_THRESHOLD, ANN_AUTO_INDEX_TYPE, IVF_NLIST, IVF_NPROBE,
+    IVF_TRAINING_SAMPLE, RETRAIN_GROWTH_FACTOR, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, PQ_M, PQ_NBITS,
+    RESCORE_ENABLED, RESCORE_FACTOR,
+    EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_DIR, EMBED_BATCH_SIZE, COMPACTION_TOMBSTONE_RATIO,
+    RETRIEVAL_MODE, RRF_K, HYBRID_CANDIDATES, FILTER_EXACT_LIMIT, SNAPSHOT_KEEP_GENERATIONS
+)
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "sq8", "pq", "auto")
+# Index types whose stored vectors are lossy; float vectors are kept beside them
+QUANTIZED_INDEX_TYPES = ("sq8", "pq")
+# Index types trained on the vectors present when they are created
+TRAINED_INDEX_TYPES = ("ivf", "sq8", "pq")
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+
+def create_index(index_type: str, dimension: int, training_vectors: np.ndarray) -> faiss.Index:
+    """Create (and train, if needed) an empty inner-product FAISS index of the given type.
+
+    Every index takes explicit ids through add_with_ids: flat, HNSW and the
+    quantized types are wrapped in an IndexIDMap2, IVF stores ids natively.
+    """
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+    if index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        # Training only records each dimension's value range
+        index.train(_training_sample(training_vectors))
+        return faiss.IndexIDMap2(index)
+
+    if index_type == "pq":
+        # Each sub-quantizer has 2**nbits centroids, so tiny corpora get fewer
+        nbits = min(PQ_NBITS, int(np.log2(len(training_vectors)))) if len(training_vectors) >= 2 else 0
+        if nbits < 1:
+            return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        index = faiss.IndexPQ(dimension, PQ_M, nbits, faiss.METRIC_INNER_PRODUCT)
+        index.train(_training_sample(training_vectors))
+        return faiss.IndexIDMap2(index)
+
+    if index_type == "hnsw":
+        index = faiss.index_factory(dimension, f"HNSW{HNSW_M},Flat", faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return faiss.IndexIDMap2(index)
+
+    if index_type == "ivf":
+        # faiss wants roughly 39+ training points per list
+        nlist = max(1, min(IVF_NLIST, len(training_vectors) // 39))
+        index = faiss.index_factory(dimension, f"IVF{nlist},Flat", faiss.METRIC_INNER_PRODUCT)
+        index.train(_training_sample(training_vectors))
+        index.nprobe = min(IVF_NPROBE, nlist)
+        # Allows reconstructing vectors by arbitrary id
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+
+    raise ValueError(f"Unknown index type '{index_type}'")
+
+def _training_sample(vectors: np.ndarray) -> np.ndarray:
+    """At most IVF_TRAINING_SAMPLE of the vectors, chosen reproducibly."""
+    if len(vectors) > IVF_TRAINING_SAMPLE:
+        rng = np.random.default_rng(0)
+        return vectors[rng.choice(len(vectors), IVF_TRAINING_SAMPLE, replace=False)]
+    return vectors
+
+def supports_ids(index: faiss.Index) -> bool:
+    """Whether add_with_ids works on this index (stores built before stable ids may not)."""
+    if hasattr(index, 'id_map'):
+        return True
+    ivf = faiss.try_extract_index_ivf(index)
+    return ivf is not None and ivf.direct_map.type != faiss.DirectMap.Array
+
+def export_vectors(index: faiss.Index, dimension: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (ids, vectors) for every entry in an index, sorted by id."""
+    if index is None or index.ntotal == 0:
+        return np.zeros(0, dtype='int64'), np.zeros((0, dimension), dtype='float32')
+
+    if hasattr(index, 'id_map'):
+        ids = faiss.vector_to_array(index.id_map).astype('int64')
+        vectors = index.index.reconstruct_n(0, index.ntotal)
+    elif faiss.try_extract_index_ivf(index) is not None:
+        # Read the inverted lists directly; IVF-Flat codes are the raw vectors
+        ivf = faiss.extract_index_ivf(index)
+        invlists = ivf.invlists
+        id_parts, vector_parts = [], []
+        for list_no in range(ivf.nlist):
+            size = invlists.list_size(list_no)
+            if size == 0:
+                continue
+            id_parts.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy())
+            codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size).copy()
+            vector_parts.append(codes.view('float32').reshape(size, dimension))
+        ids = np.concatenate(id_parts).astype('int64')
+        vectors = np.vstack(vector_parts)
+    else:
+        # Plain index from an older save: labels are row positions
+        ids = np.arange(index.ntotal, dtype='int64')
+        vectors = index.reconstruct_n(0, index.ntotal)
+
+    order = np.argsort(ids)
+    return ids[order], vectors[order]
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int, rrf_k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuse ranked id lists: each id scores sum(1 / (rrf_k + rank)) over the lists it appears in."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
 
 class VectorStore:
-    """FAISS-based vector store for semantic search."""
-    
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", dimension: int = 384):
+    """FAISS-based vector store for semantic search.
+
+    Each chunk gets a stable integer id that is also its FAISS label, so
+    chunks can be removed per document without renumbering. Removed ids are
+    tombstoned and excluded from searches with an ID selector; once enough
+    accumulate, the index is compacted in the background while readers keep
+    searching the old one.
+
+    A BM25 inverted index over the same ids is maintained next to the FAISS
+    index, so exact terms such as clause numbers can be matched lexically
+    and fused with the dense results (see search_batch). Per-field posting
+    lists (MetadataIndex) restrict both searches to chunks matching a filter.
+
+    Quantized index types (sq8, pq) keep full-precision vectors beside the
+    index in FloatVectors, memory-mapped once saved; with rescore enabled
+    the top quantized candidates are re-ranked by their exact scores.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", dimension: int = 384,
+                 index_type: str = DEFAULT_INDEX_TYPE, ann_threshold: int = ANN_THRESHOLD,
+                 rescore: bool = RESCORE_ENABLED, use_embedding_cache: bool = EMBEDDING_CACHE_ENABLED,
+                 load_encoder: bool = True):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
         self.model_name = model_name
         self.dimension = dimension
-        self.encoder = SentenceTransformer(model_name)
+        # Stores that are always handed embeddings (shards) skip loading the model
+        self.encoder = SentenceTransformer(model_name) if load_encoder else None
+        self.embedding_cache = EmbeddingCache(
+            EMBEDDING_CACHE_DIR, model_name, dimension
+        ) if use_embedding_cache else None
+        self.index_type = index_type
+        self.ann_threshold = ann_threshold
+        self.active_index_type = None
         self.index = None
-        self.chunks = []
-        self.metadata = []
-        
-    def add_documents(self, chunks: List[DocumentChunk]):
-        """Add document chunks to the vector store."""
+        self.index_mapped = False
+        # Number of vectors the index was trained on (see _needs_retraining)
+        self.trained_on = 0
+        self.rescore = rescore
+        # Float vectors for quantized indexes, None otherwise
+        self.float_vectors: Optional[FloatVectors] = None
+        # chunk id -> DocumentChunk, stored as columns (a lazy SnapshotChunks after loading a snapshot)
+        self.chunks = ChunkStore()
+        self.next_id = 0
+        # Snapshot generation the store was loaded from or last saved as, if any
+        self.generation: Optional[int] = None
+        # document id -> chunk ids added since load; snapshot rows are looked up in the snapshot
+        self.document_chunks: Dict[str, List[int]] = {}
+        self.lexical = LexicalIndex()
+        self.metadata_index = MetadataIndex()
+        self.tombstones = set()
+        self._tombstone_selector = None
+        self._compaction_thread = None
+        # lock guards the index and chunk map for readers and is only held briefly;
+        # write_lock serialises writers, including background compaction
+        self.lock = threading.RLock()
+        self.write_lock = threading.RLock()
+        # Bumped on every change to the indexed contents, for cache invalidation
+        self.version = 0
+
+    def _create_index(self, index_type: str, training_vectors: np.ndarray) -> faiss.Index:
+        """Create (and train, if needed) an empty FAISS index of the given type."""
+        return create_index(index_type, self.dimension, training_vectors)
+
+    def _ensure_writable(self):
+        """Copy a memory-mapped, read-only or id-less index into RAM before modifying it."""
+        if self.index_mapped or not supports_ids(self.index):
+            self.rebuild_index(self.active_index_type)
+            self.index_mapped = False
+
+    def _needs_retraining(self) -> bool:
+        """Whether the corpus has outgrown the sample the index was trained on.
+
+        An ivf, sq8 or pq index created from a first small batch keeps that
+        batch's centroids (and few lists or bits) for good, so it is retrained
+        each time the corpus grows RETRAIN_GROWTH_FACTOR times past it, until
+        the full IVF_TRAINING_SAMPLE is available.
+        """
+        return (self.active_index_type in TRAINED_INDEX_TYPES and self.trained_on < IVF_TRAINING_SAMPLE
+                and len(self.chunks) >= RETRAIN_GROWTH_FACTOR * max(self.trained_on, 1))
+
+    def _target_index_type(self, total: int) -> str:
+        """Resolve the configured index type for a corpus of the given size."""
+        if self.index_type != "auto":
+            return self.index_type
+        return ANN_AUTO_INDEX_TYPE if total >= self.ann_threshold else "flat"
+
+    def _build_index(self, index_type: str) -> Tuple[faiss.Index, Optional[FloatVectors]]:
+        """Build a new index of the given type holding every live (non-tombstoned) vector.
+
+        Also returns the float vectors to keep beside it, if it is quantized.
+        Vectors are taken from the float vectors when there are any, so
+        rebuilding a quantized index does not re-quantize decoded codes.
+        """
+        if self.float_vectors is not None:
+            ids, vectors = self.float_vectors.export()
+        else:
+            ids, vectors = export_vectors(self.index, self.dimension)
+        if self.tombstones:
+            live = ~np.isin(ids, np.fromiter(self.tombstones, dtype='int64'))
+            ids, vectors = ids[live], vectors[live]
+
+        index = self._create_index(index_type, vectors)
+        if len(vectors):
+            index.add_with_ids(vectors, ids)
+
+        float_vectors = None
+        if index_type in QUANTIZED_INDEX_TYPES:
+            float_vectors = self.float_vectors.compacted() if self.float_vectors is not None else None
+            if float_vectors is None:
+                float_vectors = FloatVectors(self.dimension)
+                float_vectors.add(ids, vectors)
+        return index, float_vectors
+
+    def rebuild_index(self, index_type: Optional[str] = None):
+        """Rebuild the index, optionally switching type, dropping tombstoned vectors."""
+        with self.write_lock:
+            # An emptied store has nothing to train an ANN index on
+            index_type = (index_type or self._target_index_type(len(self.chunks))) if len(self.chunks) else "flat"
+            with metrics.stage("ingest", "index_rebuild"):
+                index, float_vectors = self._build_index(index_type)
+            with self.lock:
+                self.index = index
+                self.float_vectors = float_vectors
+                self.trained_on = index.ntotal
+                self.index_mapped = False
+                self.active_index_type = index_type
+                self._set_tombstones(set())
+                self.version += 1
+
+    def add_documents(self, chunks: List[DocumentChunk], before_batch: Optional[Callable[[], Any]] = None,
+                      on_progress: Optional[Callable[[int], Any]] = None,
+                      embeddings: Optional[np.ndarray] = None) -> List[int]:
+        """Add document chunks to the vector store and return their ids.
+
+        Embeddings are computed in batches of EMBED_BATCH_SIZE; before_batch is
+        called before each one (e.g. to yield to queries) and on_progress with
+        the number of chunks embedded so far. Precomputed embeddings, one row
+        per chunk, skip the encoder.
+        """
         if not chunks:
-            return
-            
+            return []
+
         # Extract text content
         texts = [chunk.content for chunk in chunks]
-        
-        # Create embeddings
-        embeddings = self.encoder.encode(texts, show_progress_bar=True)
-        
-        # Initialize FAISS index if not exists
-        if self.index is None:
-            self.index = faiss.IndexFlatIP(self.dimension)
-        
-        # Add to index
-        self.index.add(embeddings.astype('float32'))
-        
-        # Store metadata
-        for chunk in chunks:
-            self.chunks.append(chunk)
-            self.metadata.append({
-                'source': chunk.source,
-                'chunk_id': chunk.chunk_id,
-                'page_number': chunk.page_number,
-                'section': chunk.section,
-                'timestamp': chunk.timestamp,
-                'metadata': chunk.metadata
-            })
-    
-    def search(self, query: str, k: int = 5) -> List[Tuple[DocumentChunk, float]]:
-        """Search for similar documents."""
-        if self.index is None or len(self.chunks) == 0:
-            return []
-        
-        # Encode query
-        query_embedding = self.encoder.encode([query])
-        
-        # Search
-        scores, indices = self.index.search(query_embedding.astype('float32'), k)
-        
-        # Return results with scores
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.chunks):
-                results.append((self.chunks[idx], float(score)))
-        
+
+        if embeddings is None:
+            embeddings = self.embed_texts(texts, before_batch, on_progress)
+        embeddings = np.asarray(embeddings, dtype='float32')
+        with metrics.stage("ingest", "analyze"):
+            analyzed = [LexicalIndex.analyze(text) for text in texts]
+            fields = [chunk_fields(chunk) for chunk in chunks]
+
+        with self.write_lock:
+            # Initialize FAISS index if not exists, training ANN indexes on this batch
+            if self.index is None:
+                self.active_index_type = self._target_index_type(len(embeddings))
+                self.index = self._create_index(self.active_index_type, embeddings)
+                self.trained_on = len(embeddings)
+                if self.active_index_type in QUANTIZED_INDEX_TYPES:
+                    self.float_vectors = FloatVectors(self.dimension)
+            self._ensure_writable()
+
+            ids = list(range(self.next_id, self.next_id + len(chunks)))
+            with self.lock, metrics.stage("ingest", "index_add"):
+                # Add to index
+                self.index.add_with_ids(embeddings, np.array(ids, dtype='int64'))
+                if self.float_vectors is not None:
+                    self.float_vectors.add(ids, embeddings)
+                self.next_id += len(chunks)
+
+                # Store chunks and their postings
+                for chunk_id, chunk, terms, entry in zip(ids, chunks, analyzed, fields):
+                    self.chunks[chunk_id] = chunk
+                    self.lexical.add(chunk_id, terms)
+                    self.metadata_index.add(chunk_id, entry)
+                    if chunk.document_id is not None:
+                        self.document_chunks.setdefault(chunk.document_id, []).append(chunk_id)
+
+                self.version += 1
+
+            # Switch from exact to approximate search once the corpus is large enough
+            target = self._target_index_type(len(self.chunks))
+            if target != self.active_index_type:
+                print(f"Rebuilding {self.active_index_type} index as {target} ({len(self.chunks)} vectors)")
+                self.rebuild_index(target)
+            elif self._needs_retraining():
+                print(f"Retraining {self.active_index_type} index on {len(self.chunks)} vectors "
+                      f"(trained on {self.trained_on})")
+                self.rebuild_index(self.active_index_type)
+
+        return ids
+
+    def embed_texts(self, texts: List[str], before_batch: Optional[Callable[[], Any]] = None,
+                    on_progress: Optional[Callable[[int], Any]] = None) -> np.ndarray:
+        """Embed chunk texts in batches of EMBED_BATCH_SIZE, as add_documents does."""
+        # Create embeddings, skipping the encoder for previously seen text
+        batches = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            if before_batch is not None:
+                with metrics.stage("ingest", "query_yield"):
+                    before_batch()
+            with metrics.stage("ingest", "embedding"):
+                batches.append(self.encode_texts(texts[start:start + EMBED_BATCH_SIZE]))
+            if on_progress is not None:
+                on_progress(min(start + EMBED_BATCH_SIZE, len(texts)))
+        return np.vstack(batches)
+
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Encode chunk texts, using the persistent embedding cache when enabled."""
+        if self.embedding_cache is None:
+            return self._encode_batch(texts)
+        return self.embedding_cache.encode(texts, self._encode_batch)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return self.encoder.encode(texts, show_progress_bar=True).astype('float32')
+
+    def _set_tombstones(self, tombstones: set):
+        """Replace the tombstone set and the selector that excludes it from searches."""
+        self.tombstones = tombstones
+        if tombstones:
+            # Both selectors must stay referenced while the C++ side uses them
+            batch = faiss.IDSelectorBatch(np.fromiter(tombstones, dtype='int64'))
+            self._tombstone_selector = (faiss.IDSelectorNot(batch), batch)
+        else:
+            self._tombstone_selector = None
+
+    def remove_documents(self, document_ids: Iterable[str]) -> int:
+        """Remove all chunks belonging to the given documents. Returns the number removed.
+
+        Cost is proportional to the removed documents: their chunks are found
+        through per-document id lists and tombstoned rather than deleted from
+        the index. Compaction starts in the background once tombstones exceed
+        COMPACTION_TOMBSTONE_RATIO of the index.
+        """
+        document_ids = set(document_ids)
+        if self.index is None or not document_ids:
+            return 0
+
+        with self.write_lock:
+            ids = []
+            for document_id in document_ids:
+                ids.extend(self.document_chunks.pop(document_id, []))
+            if isinstance(self.chunks, SnapshotChunks):
+                ids.extend(self.chunks.snapshot_ids_for_documents(document_ids))
+            return self.remove_chunks(ids)
+
+    def remove_chunks(self, ids: Iterable[int]) -> int:
+        """Tombstone chunks by id, as remove_documents does for whole documents. Returns the number removed."""
+        with self.write_lock:
+            ids = [chunk_id for chunk_id in ids if chunk_id in self.chunks]
+            if self.index is None or not ids:
+                return 0
+
+            with self.lock:
+                for chunk_id in ids:
+                    document_id = getattr(self.chunks.pop(chunk_id), 'document_id', None)
+                    # No-op when called from remove_documents, which already dropped the lists
+                    siblings = self.document_chunks.get(document_id)
+                    if siblings is not None and chunk_id in siblings:
+                        siblings.remove(chunk_id)
+                        if not siblings:
+                            del self.document_chunks[document_id]
+                self.lexical.remove(ids)
+                self.metadata_index.remove(ids)
+                if self.float_vectors is not None:
+                    self.float_vectors.remove(ids)
+                self._set_tombstones(self.tombstones | set(ids))
+                self.version += 1
+
+            if len(self.tombstones) > COMPACTION_TOMBSTONE_RATIO * max(self.index.ntotal, 1):
+                self.compact_in_background()
+
+        return len(ids)
+
+    def get_vectors(self, ids: List[int]) -> np.ndarray:
+        """Stored embeddings of live chunk ids, one row per id.
+
+        Quantized indexes answer from their float vectors, so moved or
+        exported vectors are never decoded codes.
+        """
+        ids = np.asarray(ids, dtype='int64')
+        with self.lock:
+            if self.float_vectors is not None:
+                found, vectors = self.float_vectors.get(ids)
+                if found.all():
+                    return vectors
+            if not len(ids):
+                return np.zeros((0, self.dimension), dtype='float32')
+            return np.vstack([self.index.reconstruct(int(chunk_id)) for chunk_id in ids]).astype('float32')
+
+    def replace_documents(self, document_ids: Iterable[str], chunks: List[DocumentChunk]) -> List[int]:
+        """Remove the given documents' chunks and add their replacements."""
+        with self.write_lock:
+            self.remove_documents(document_ids)
+            return self.add_documents(chunks)
+
+    def compact(self):
+        """Rebuild the index without tombstoned vectors.
+
+        Readers keep searching the current index while the new one is built;
+        the swap itself happens under the reader lock.
+        """
+        with self.write_lock:
+            if not self.tombstones:
+                return
+            removed = len(self.tombstones)
+            self.rebuild_index(self.active_index_type)
+            store = self.chunks.appended if isinstance(self.chunks, SnapshotChunks) else self.chunks
+            with metrics.stage("ingest", "compaction"):
+                compacted = store.compacted()
+            with self.lock:
+                self.lexical.compact()
+                if isinstance(self.chunks, SnapshotChunks):
+                    self.chunks.appended = compacted
+                else:
+                    self.chunks = compacted
+            print(f"Compacted vector index: dropped {removed} removed vectors")
+
+    def compact_in_background(self):
+        """Start compaction on a background thread unless one is already running."""
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self.compact, name="compaction", daemon=True)
+        self._compaction_thread.start()
+
+    def _search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None, selector=None):
+        """Build per-query FAISS search parameters for the active index type.
+
+        selector defaults to the one excluding tombstoned ids. Parameters not
+        given keep the index's own settings (IVF_NPROBE, HNSW_EF_SEARCH)
+        rather than the faiss defaults of a fresh parameter object.
+        """
+        if selector is None and self._tombstone_selector:
+            selector = self._tombstone_selector[0]
+        if self.active_index_type == "ivf":
+            params = faiss.SearchParametersIVF()
+            params.nprobe = nprobe if nprobe is not None else faiss.extract_index_ivf(self.index).nprobe
+        elif self.active_index_type == "hnsw":
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = ef_search if ef_search is not None else self._hnsw().efSearch
+        else:
+            if selector is None:
+                return None
+            params = faiss.SearchParameters()
+
+        if selector is None and nprobe is None and ef_search is None:
+            return None
+        if selector is not None:
+            params.sel = selector
+        return params
+
+    def _hnsw(self):
+        """HNSW graph of the active index, unwrapped from its id map."""
+        index = self.index.index if hasattr(self.index, 'id_map') else self.index
+        return faiss.downcast_index(index).hnsw
+
+    def search_vectors(self, query_embeddings: np.ndarray, k: int = 5, nprobe: Optional[int] = None,
+                       ef_search: Optional[int] = None,
+                       allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the index with pre-computed query embeddings; labels are chunk ids.
+
+        allowed restricts the search to the given live ids. Small sets are
+        scored exactly against their stored vectors; larger ones are passed to
+        FAISS as an ID selector so the scan itself skips everything else.
+        Quantized results are re-scored against float vectors if enabled.
+        """
+        query_embeddings = query_embeddings.astype('float32')
+        if allowed is not None and len(allowed) <= FILTER_EXACT_LIMIT:
+            return self._search_subset(query_embeddings, k, allowed)
+
+        rescoring = self.rescore and self.float_vectors is not None
+        fetch = k * RESCORE_FACTOR if rescoring else k
+        selector = faiss.IDSelectorBatch(allowed) if allowed is not None else None
+        params = self._search_params(nprobe, ef_search, selector)
+        if params is not None:
+            scores, labels = self.index.search(query_embeddings, fetch, params=params)
+        else:
+            scores, labels = self.index.search(query_embeddings, fetch)
+        if rescoring:
+            return rescore(query_embeddings, labels, self.float_vectors, k)
+        return scores, labels
+
+    def _search_subset(self, query_embeddings: np.ndarray, k: int, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact inner-product search over a small set of ids, shaped like index.search."""
+        scores = np.full((len(query_embeddings), k), -np.inf, dtype='float32')
+        labels = np.full((len(query_embeddings), k), -1, dtype='int64')
+        if len(ids) == 0:
+            return scores, labels
+
+        if self.float_vectors is not None:
+            found, vectors = self.float_vectors.get(ids)
+            ids = ids[found]
+            if len(ids) == 0:
+                return scores, labels
+        else:
+            vectors = np.vstack([self.index.reconstruct(int(chunk_id)) for chunk_id in ids])
+        similarities = query_embeddings @ vectors.T
+        top = np.argsort(-similarities, axis=1)[:, :k]
+        scores[:, :top.shape[1]] = np.take_along_axis(similarities, top, axis=1)
+        labels[:, :top.shape[1]] = ids[top]
+        return scores, labels
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Encode a single query into a float32 embedding."""
+        return self.encoder.encode([query])[0].astype('float32')
+
+    def search(self, query: str, k: int = 5, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None, mode: Optional[str] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[Tuple[DocumentChunk, float]]:
+        """Search for similar documents.
+
+        nprobe (IVF) and ef_search (HNSW) trade recall for latency per query;
+        they are ignored for the flat index. See search_batch for modes and
+        filters.
+        """
+        return self.search_batch([query], k, nprobe=nprobe, ef_search=ef_search, mode=mode, filters=filters)[0]
+
+    def search_batch(self, queries: List[str], k: int = 5, nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None, mode: Optional[str] = None,
+                     threshold: Optional[float] = None, filters: Optional[Dict[str, Any]] = None,
+                     query_embeddings: Optional[np.ndarray] = None) -> List[List[Tuple[DocumentChunk, float]]]:
+        """Search for several queries with one encoder call and one index search.
+
+        mode is "dense" (cosine scores), "lexical" (BM25 scores) or "hybrid"
+        (reciprocal rank fusion of both, RRF scores); it defaults to
+        RETRIEVAL_MODE. threshold, if given, drops dense hits below that
+        cosine similarity before fusion.
+
+        filters restricts results to chunks matching source, section, type
+        and domain values and a date_from/date_to range, e.g.
+        {"source": "health_policy", "date_from": "2024-01-01"}. Matching ids
+        come from the metadata posting lists and are applied inside the index
+        and BM25 scans, so heavy filtering still returns up to k results.
+        query_embeddings, if given, are used instead of encoding the queries.
+        """
+        mode = mode or RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+        candidates = k * HYBRID_CANDIDATES if mode == "hybrid" else k
+        dense, lexical = self._search_ids(queries, candidates, nprobe, ef_search, mode, threshold, filters,
+                                          query_embeddings)
+
+        with self.lock:
+            # Return results with scores
+            results = []
+            for dense_hits, lexical_hits in zip(dense, lexical):
+                if mode == "hybrid":
+                    ranked = reciprocal_rank_fusion([[i for i, _ in dense_hits], [i for i, _ in lexical_hits]], k)
+                else:
+                    ranked = dense_hits if mode == "dense" else lexical_hits
+                results.append(self._materialize(ranked))
+
         return results
-    
-    def semantic_search(self, query: str, k: int = 5, threshold: float = 0.3) -> List[DocumentChunk]:
+
+    def search_candidates(self, queries: List[str], k: int = 5, nprobe: Optional[int] = None,
+                          ef_search: Optional[int] = None, mode: Optional[str] = None,
+                          threshold: Optional[float] = None, filters: Optional[Dict[str, Any]] = None,
+                          query_embeddings: Optional[np.ndarray] = None
+                          ) -> List[Tuple[List[Tuple[DocumentChunk, float]], List[Tuple[DocumentChunk, float]]]]:
+        """Unfused (dense, lexical) hits per query, up to k each, with cosine and BM25 scores.
+
+        For callers that fuse the results of several stores themselves (see
+        sharded_store.py); arguments are as for search_batch.
+        """
+        mode = mode or RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+        dense, lexical = self._search_ids(queries, k, nprobe, ef_search, mode, threshold, filters, query_embeddings)
+        with self.lock:
+            return [(self._materialize(dense_hits), self._materialize(lexical_hits))
+                    for dense_hits, lexical_hits in zip(dense, lexical)]
+
+    def _materialize(self, ranked: List[Tuple[int, float]]) -> List[Tuple[DocumentChunk, float]]:
+        """Look up the chunks of (chunk id, score) hits, skipping any removed meanwhile."""
+        hits = []
+        for chunk_id, score in ranked:
+            chunk = self.chunks.get(chunk_id)
+            if chunk is not None:
+                hits.append((chunk, float(score)))
+        return hits
+
+    def _search_ids(self, queries: List[str], candidates: int, nprobe: Optional[int], ef_search: Optional[int],
+                    mode: str, threshold: Optional[float], filters: Optional[Dict[str, Any]],
+                    query_embeddings: Optional[np.ndarray]
+                    ) -> Tuple[List[List[Tuple[int, float]]], List[List[Tuple[int, float]]]]:
+        """Dense and lexical (chunk id, score) candidates for each query, before fusion."""
+        dense: List[List[Tuple[int, float]]] = [[] for _ in queries]
+        lexical: List[List[Tuple[int, float]]] = [[] for _ in queries]
+        if self.index is None or len(self.chunks) == 0:
+            return dense, lexical
+
+        allowed = None
+        if filters:
+            with self.lock, metrics.stage("query", "filter"):
+                allowed = self.metadata_index.matching_ids(filters)
+        if allowed is not None and len(allowed) == 0:
+            return dense, lexical
+
+        # Encode all queries as one matrix
+        if mode != "lexical" and query_embeddings is None:
+            with metrics.stage("query", "embedding"):
+                query_embeddings = self.encoder.encode(queries)
+
+        with self.lock:
+            if query_embeddings is not None:
+                # Search
+                with metrics.stage("query", "vector_search"):
+                    scores, labels = self.search_vectors(query_embeddings, candidates, nprobe=nprobe,
+                                                         ef_search=ef_search, allowed=allowed)
+                for hits, row_scores, row_labels in zip(dense, scores, labels):
+                    for score, chunk_id in zip(row_scores, row_labels):
+                        if chunk_id >= 0 and (threshold is None or score >= threshold):
+                            hits.append((int(chunk_id), float(score)))
+
+            if mode != "dense":
+                with metrics.stage("query", "lexical_search"):
+                    lexical = [self.lexical.search(query, candidates, allowed) for query in queries]
+
+        return dense, lexical
+
+    def semantic_search(self, query: str, k: int = 5, threshold: float = 0.3, nprobe: Optional[int] = None,
+                        ef_search: Optional[int] = None, mode: Optional[str] = None,
+                        filters: Optional[Dict[str, Any]] = None) -> List[DocumentChunk]:
         """Perform semantic search with similarity threshold."""
-        results = self.search(query, k)
-        
-        # Filter by threshold
-        filtered_results = []
-        for chunk, score in results:
-            if score >= threshold:
-                filtered_results.append(chunk)
-        
-        return filtered_results
-    
+        return self.semantic_search_batch([query], k, threshold, nprobe=nprobe, ef_search=ef_search, mode=mode,
+                                          filters=filters)[0]
+
+    def semantic_search_batch(self, queries: List[str], k: int = 5, threshold: float = 0.3,
+                              nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                              mode: Optional[str] = None,
+                              filters: Optional[Dict[str, Any]] = None) -> List[List[DocumentChunk]]:
+        """Perform semantic search with similarity threshold for several queries at once.
+
+        The threshold applies to dense cosine scores; lexical matches are kept
+        regardless since BM25 scores are not on the same scale.
+        """
+        results = self.search_batch(queries, k, nprobe=nprobe, ef_search=ef_search, mode=mode, threshold=threshold,
+                                    filters=filters)
+        return [[chunk for chunk, _ in hits] for hits in results]
+
     def save(self, filepath: str):
-        """Save the vector store to disk."""
-        if self.index is not None:
-            # Save FAISS index
-            faiss.write_index(self.index, f"{filepath}.index")
-            
-            # Save metadata
-            with open(f"{filepath}.metadata", 'wb') as f:
-                pickle.dump({
-                    'chunks': self.chunks,
-                    'metadata': self.metadata,
-                    'model_name': self.model_name,
-                    'dimension': self.dimension
-                }, f)
-    
-    def load(self, filepath: str):
-        """Load the vector store from disk."""
+        """Save the vector store to disk as a snapshot directory ({filepath}.snapshot)."""
+        with self.write_lock:
+            if self.index is None:
+                return
+            # Snapshots never contain tombstoned vectors
+            self.compact()
+            self.generation = write_snapshot(f"{filepath}.snapshot", self.index, self.chunks, {
+                'model_name': self.model_name,
+                'dimension': self.dimension,
+                'index_type': self.active_index_type,
+                'next_id': self.next_id,
+                'trained_on': self.trained_on
+            }, lexical=self.lexical, vectors=self.float_vectors, metadata=self.metadata_index,
+               keep_generations=SNAPSHOT_KEEP_GENERATIONS)
+
+    def load(self, filepath: str) -> bool:
+        """Load the vector store from disk. Returns True if a store was loaded.
+
+        Snapshots are opened lazily: the index is memory-mapped where faiss
+        supports it and chunks are read on access. Stores saved in the older
+        pickle format ({filepath}.index / .metadata) are still readable.
+        """
         try:
-            # Load FAISS index
-            self.index = faiss.read_index(f"{filepath}.index")
-            
-            # Load metadata
-            with open(f"{filepath}.metadata", 'rb') as f:
-                data = pickle.load(f)
-                self.chunks = data['chunks']
-                self.metadata = data['metadata']
-                self.model_name = data['model_name']
-                self.dimension = data['dimension']
-                
+            # Resolved once, so every file comes from the same snapshot generation
+            directory = snapshot_directory(f"{filepath}.snapshot")
+            if directory is not None:
+                index, chunks, info, mapped = read_snapshot(str(directory))
+                next_id = info.get('next_id', info['count'])
+                lexical = LexicalIndex.read(directory)
+                float_vectors = FloatVectors.read(directory, info['dimension'])
+                metadata_index = MetadataIndex.read(directory)
+            else:
+                # Load FAISS index
+                index = faiss.read_index(f"{filepath}.index")
+                mapped = False
+
+                # Load metadata; positions double as chunk ids
+                with open(f"{filepath}.metadata", 'rb') as f:
+                    info = pickle.load(f)
+                chunks = ChunkStore.from_items(enumerate(info['chunks']))
+                next_id = len(chunks)
+                float_vectors = None
+                lexical = None
+                metadata_index = None
+
+            if lexical is None:
+                # Stores saved before the lexical index existed
+                print(f"Building lexical index for {len(chunks)} chunks")
+                lexical = LexicalIndex()
+                for chunk_id, chunk in chunks.items():
+                    lexical.add(chunk_id, LexicalIndex.analyze(chunk.content))
+
+            if metadata_index is None:
+                # Stores saved before filtering existed
+                print(f"Building metadata filter index for {len(chunks)} chunks")
+                metadata_index = MetadataIndex()
+                for chunk_id, chunk in chunks.items():
+                    metadata_index.add(chunk_id, chunk_fields(chunk))
+
+            with self.write_lock, self.lock:
+                self.index, self.chunks, self.index_mapped = index, chunks, mapped
+                self.next_id = next_id
+                self.lexical = lexical
+                self.float_vectors = float_vectors
+                self.metadata_index = metadata_index
+                self.model_name = info['model_name']
+                self.dimension = info['dimension']
+                self.active_index_type = info.get('index_type', 'flat')
+                # Older snapshots do not record it; assume the index fits the saved corpus
+                self.trained_on = info.get('trained_on', index.ntotal)
+                self.generation = info.get('generation')
+                self.document_chunks = {}
+                if not isinstance(chunks, SnapshotChunks):
+                    for chunk_id, chunk in chunks.items():
+                        document_id = getattr(chunk, 'document_id', None)
+                        if document_id is not None:
+                            self.document_chunks.setdefault(document_id, []).append(chunk_id)
+                self._set_tombstones(set())
+                self.version += 1
+            return True
+
         except Exception as e:
             print(f"Error loading vector store: {e}")
-    
+            return False
+
     def get_statistics(self) -> Dict[str, Any]:
         """Get statistics about the vector store."""
         if self.index is None:
             return {"total_documents": 0, "index_size": 0}
-        
+
         return {
             "total_documents": len(self.chunks),
             "index_size": self.index.ntotal,
+            "chunk_store": (self.chunks.appended if isinstance(self.chunks, SnapshotChunks) else self.chunks).get_statistics(),
+            "tombstones": len(self.tombstones),
             "dimension": self.dimension,
-            "model_name": self.model_name
-        } 
\ No newline at end of file
+            "model_name": self.model_name,
+            "index_type": self.active_index_type,
+            "index_mapped": self.index_mapped,
+            "generation": self.generation,
+            "rescore": self.rescore and self.float_vectors is not None,
+            "float_vectors": self.float_vectors.get_statistics() if self.float_vectors is not None else None,
+            "lexical": self.lexical.get_statistics(),
+            "filter_values": self.metadata_index.get_statistics(),
+            "embedding_cache": self.embedding_cache.get_statistics() if self.embedding_cache is not None else None
+        }